@@ -0,0 +1,302 @@
+"""Benchmarks for the ConflictSheet query paths over synthetic lineups, no workbook or Discord needed.
+
+Daytime lineups come from ConflictSheet.gen_lineup over the games active in each season, with the other times filled in
+alongside. The real-size data is tiled row by row for the larger scales, so the per-season shape stays the same.
+Every query is timed cold (empty LFU) and warm (repeated against the warm LFU), and each measurement is written as a
+JSON line to the output for comparing between commits.
+"""
+import json
+import random
+import statistics
+import subprocess
+import time
+from argparse import ArgumentParser
+from copy import copy
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+import polars as pl
+import portion as P
+from cachetools import LFUCache
+
+from conflictsheet import (
+    _frame_size,
+    _PG_BY_ORDINAL,
+    _PG_ORDINAL,
+    ALL_FLAGS_BUT_UNCERTAIN,
+    ANY_FLAG,
+    ANY_FREQ,
+    ANY_SLOT,
+    FIRST_HALF,
+    GEN_LINEUP_ODDS,
+    ConflictSheet,
+)
+from pg import CURRENT_SEASON, PG, PGPlaying
+from util import PLAYING_FLAGS
+
+# shows per season at 1x, the first seasons were half hours
+DAYTIME_PER_SEASON = 190
+HALF_HOUR_SEASONS = 3
+PRIMETIME_SHOWS = 120
+SYNDICATED_SEASONS = 9
+SYNDICATED_PER_SEASON = 30
+UNAIRED_SHOWS = 30
+# gen_lineups is off from gen_lineup when any slot frequency of a PG differs by more than this many standard errors
+GEN_CHECK_Z = 5
+# partitions the check also compares the share of lineups with one of, where a wrong chance shows up undiluted
+GEN_CHECK_PARTITIONS = ('CASH', 'CAR', 'NON-CAR', 'FEE', 'REG. GP', 'REG. SP', '4 PRIZER', '3 PRIZER', '2 PRIZER', '1+ PRIZER')
+
+# odds of a synthetic playing carrying a flag, on top of the cars gen_lineup marks
+FLAG_ODDS = {2 ** (len(PLAYING_FLAGS) - 1 - PLAYING_FLAGS.index(pf)): odds for pf, odds in (('?', 0.01), ('^', 0.01), ('$', 0.005), ('*', 0.005))}
+
+
+def _random_flag():
+    return sum(f for f, odds in FLAG_ODDS.items() if random.random() < odds)
+
+
+@lru_cache
+def _season_pool(season: int):
+    return frozenset(pg for pg in PG if pg is not PG._UNKNOWN and pg.activeIn(season)) or frozenset(PG) - {PG._UNKNOWN}
+
+
+def _lineup(cs: ConflictSheet, season: int, half_hour: bool = False):
+    pool = set(_season_pool(season))
+    if not half_hour:
+        try:
+            nPGs, non_car = cs.gen_lineup(copy(pool), odds=GEN_LINEUP_ODDS)
+            return [(str(pg), int(bool(n)) | _random_flag()) for pg, n in zip(nPGs, non_car)]
+        except (IndexError, KeyError, ValueError):
+            # gen_lineup assumes a modern game pool, early seasons may not have one of everything it wants
+            pass
+    return [(str(pg), _random_flag()) for pg in random.sample(tuple(pool), 3 if half_hour else 6)]
+
+
+def _sheet(names, rows, lineups, n_slots):
+    bits = np.zeros((len(rows), n_slots, 2), dtype=np.uint16)
+    cells = []
+    for i, lineup in enumerate(lineups):
+        for s, (pg_str, flag) in enumerate(lineup):
+            bits[i, s, 0] = flag
+        cells.append([pg_str for pg_str, _ in lineup] + ['-'] * (n_slots - len(lineup)))
+    return ConflictSheet._build_frame(names, [r + tuple(c) for r, c in zip(rows, cells)], bits)
+
+
+def synthetic_frames(seasons: int = CURRENT_SEASON):
+    """Calendar, Primetime and Syndication frames at roughly the real sheet's size."""
+    # gen_lineup needs no sheet data when given its odds
+    cs = ConflictSheet.__new__(ConflictSheet)
+    rows, lineups = [], []
+    for u in range(UNAIRED_SHOWS):
+        rows.append((f'{u:03d}9R', random.randint(1, seasons), None, datetime(1972, 1, 1) + timedelta(days=u), None))
+        lineups.append(_lineup(cs, seasons))
+    d, n = datetime(1972, 9, 4), 0
+    for s in range(1, seasons + 1):
+        for _ in range(DAYTIME_PER_SEASON):
+            n += 1
+            rows.append((f'{n:04d}{"D" if s < 20 else "K"}', s, d, d, random.choice([None] * 20 + ['MDS', 'a note'])))
+            lineups.append(_lineup(cs, s, s <= HALF_HOUR_SEASONS))
+            d += timedelta(days=1 + 2 * (d.weekday() == 4))
+        d += timedelta(days=90)
+    daytime = _sheet(['PROD', 'S', 'AIRDATE', 'INT. DATE', 'NOTES'] + [f'PG{i}' for i in range(1, 7)], rows, lineups, 6)
+
+    rows, lineups = [], []
+    for i in range(PRIMETIME_SHOWS):
+        d = datetime(1986, 8, 14) + timedelta(days=90 * i)
+        rows.append((f'{i:03d}SP', d, d, random.choice([None, 'MDS', 'Million Dollar Spectacular'])))
+        lineups.append(_lineup(cs, min(seasons, 15 + i // 4)))
+    primetime = _sheet(['PROD', 'AIRDATE', 'INT. DATE', 'SPECIAL'] + [f'PG{i}' for i in range(1, 7)], rows, lineups, 6)
+
+    rows, lineups = [], []
+    for s in range(1, SYNDICATED_SEASONS + 1):
+        for e in range(SYNDICATED_PER_SEASON):
+            rows.append((f'{s:02d}{e:02d}N', s))
+            lineups.append(_lineup(cs, s, True))
+    syndicated = _sheet(['PROD', 'S'] + [f'PG{i}' for i in range(1, 4)], rows, lineups, 3)
+
+    return daytime, primetime, syndicated
+
+
+def scale_frames(frames, k: int):
+    # every row k times in place, so seasons and airdates stay in order
+    return tuple(df[np.repeat(np.arange(df.height), k)] if k > 1 else df for df in frames)
+
+
+def _materialize(res):
+    return res.collect() if isinstance(res, pl.LazyFrame) else res
+
+
+def _timed(f):
+    t = time.perf_counter()
+    _materialize(f())
+    return 1000 * (time.perf_counter() - t)
+
+
+def query_cases(cs: ConflictSheet):
+    """(family, case, callable) of everything worth timing, each callable goes through the LFU like the cogs do."""
+    daytime = cs.get('daytime')
+    dates = daytime.get_column('AIRDATE')
+    mid = dates[daytime.height // 2]
+    date_ep = P.closed(mid, mid + timedelta(days=5 * 365))
+    recent = P.closed(CURRENT_SEASON - 10, CURRENT_SEASON)
+    week = frozenset({PG.Plinko, PG.Cliffhangers, PG.ClockGame, PG.AnyNumber, PG.BonusGame, PG.Bullseye})
+    conds_simple = ((frozenset(PG.partition_table['1 PRIZER']), ANY_SLOT, ANY_FLAG, ANY_FREQ),)
+    conds_multi = (
+        (frozenset({PG.Plinko}), FIRST_HALF, ANY_FLAG, ANY_FREQ),
+        (frozenset(PG.partition_table['CAR']), ANY_SLOT, ALL_FLAGS_BUT_UNCERTAIN, frozenset({1, 2})),
+        (frozenset(PG.partition_table['1 PRIZER']), ANY_SLOT, ANY_FLAG, frozenset({2})),
+    )
+    sheet_pgs = [PGPlaying(str(pg), 0, pg=pg) for pg in week]
+
+    cases = []
+    for ep_name, ep in (('all', None), ('seasons', recent), ('dates', date_ep)):
+        cases += [
+            ('endpoint_sub', ep_name, lambda ep=ep: cs.endpoint_sub(ep, 'daytime')),
+            ('concurrence_query', ep_name, lambda ep=ep: cs.concurrence_query(ep, 'daytime', (PG.Plinko, PG.Cliffhangers), (None, None))),
+            ('slot_counts', ep_name, lambda ep=ep: cs.slot_counts(ep, 'daytime')),
+            ('gen_sheet', ep_name, lambda ep=ep: cs.gen_sheet(sheet_pgs, ep, 'X', 'daytime')),
+        ]
+        for engine in ('polars', 'bitset'):
+            cases += [
+                (f'lineup_query[{engine}]', f'{ep_name}/simple', lambda ep=ep, e=engine: cs.lineup_query(ep, 'daytime', 'all', conds_simple, engine=e)),
+                (f'lineup_query[{engine}]', f'{ep_name}/all', lambda ep=ep, e=engine: cs.lineup_query(ep, 'daytime', 'all', conds_multi, engine=e)),
+                (f'lineup_query[{engine}]', f'{ep_name}/custom', lambda ep=ep, e=engine: cs.lineup_query(ep, 'daytime', 'A & ~(B | C)', conds_multi, engine=e)),
+            ]
+    cases += [
+        ('slot_table', 'S', lambda: cs.slot_table('daytime', 'S')),
+        ('slot_table', 'none', lambda: cs.slot_table('daytime')),
+    ]
+    return cases
+
+
+def bench_queries(cs: ConflictSheet, repeat: int):
+    for family, case, f in query_cases(cs):
+        cold, warm = [], []
+        for _ in range(repeat):
+            cs.cache.clear()
+            cold.append(_timed(f))
+            warm.append(_timed(f))
+        yield {
+            'family': family,
+            'case': case,
+            'cold_ms': statistics.median(cold),
+            'cold_min_ms': min(cold),
+            'warm_ms': statistics.median(warm),
+            'warm_min_ms': min(warm),
+        }
+
+
+def bench_cache_sizes(cs: ConflictSheet, sizes, calls: int):
+    """Mixed workload of the query cases, drawn Zipf-like so a few queries dominate, against LFUs of each budget in MB."""
+    cases = query_cases(cs)
+    weights = [1 / (i + 1) for i in range(len(cases))]
+    picks = random.Random(0).choices(range(len(cases)), weights, k=calls)
+    for size in sizes:
+        cs.cache = LFUCache(size * 2**20, getsizeof=_frame_size)
+        before = cs.cache_info()
+        t = time.perf_counter()
+        for i in picks:
+            _materialize(cases[i][2]())
+        elapsed = 1000 * (time.perf_counter() - t)
+        info = cs.cache_info()
+        hits, misses = info.hits - before.hits, info.misses - before.misses
+        yield {
+            'family': 'lfu',
+            'case': f'maxsize={size}MB',
+            'calls': calls,
+            'hit_rate': hits / (hits + misses),
+            'total_ms': elapsed,
+        }
+
+
+def compare_gen_lineups(cs: ConflictSheet, n: int, seed: int):
+    """How far gen_lineups strays from gen_lineup over the latest season's games, n lineups of each.
+
+    gen_lineups repeats gen_lineup's rules on arrays, so every (slot, PG) and (slot, non-car) frequency of the two is
+    compared, and the share of lineups with each of GEN_CHECK_PARTITIONS, as two-proportion z-scores. Lineups
+    gen_lineup raises on are left out, as gen_lineups throws them out."""
+    pool = _season_pool(CURRENT_SEASON)
+    ords, non_car = [], []
+    while len(ords) < n:
+        try:
+            nPGs, nc = cs.gen_lineup(set(pool), odds=GEN_LINEUP_ODDS)
+        except (IndexError, KeyError, ValueError):
+            continue
+        ords.append([_PG_ORDINAL[str(pg)] for pg in nPGs])
+        non_car.append([bool(c) for c in nc])
+    sim = cs.gen_lineups(set(pool), n, seed=seed, odds=GEN_LINEUP_ODDS)
+
+    labels = [f'PG{s + 1} {pg or "-"}' for s in range(6) for pg in _PG_BY_ORDINAL] + [f'PG{s + 1} non-car' for s in range(6)]
+    labels += [f'any {p}' for p in GEN_CHECK_PARTITIONS]
+    in_partition = np.zeros((len(GEN_CHECK_PARTITIONS), len(PG) + 1), dtype=bool)
+    for i, p in enumerate(GEN_CHECK_PARTITIONS):
+        in_partition[i, [_PG_ORDINAL[str(pg)] for pg in PG.partition_table[p]]] = True
+
+    def freqs(o, c):
+        # the share of lineups with each PG ordinal (the last is no playing) in each slot, with a non-car game in each
+        # slot, then with a game of each partition
+        o, c = np.asarray(o, dtype=np.intp), np.asarray(c, dtype=bool)
+        by_pg = np.concatenate([np.bincount(o[:, s], minlength=len(PG) + 1) for s in range(6)])
+        return np.concatenate([by_pg, c.sum(axis=0), in_partition[:, o].any(axis=2).sum(axis=1)]) / len(o)
+
+    p, q = freqs(ords, non_car), freqs(sim.ords, sim.non_car)
+    pooled = (p + q) / 2
+    se = np.sqrt(pooled * (1 - pooled) * 2 / n)
+    z = np.divide(np.abs(p - q), se, out=np.zeros_like(se), where=se > 0)
+    return {'family': 'gen_lineups', 'case': 'vs gen_lineup', 'lineups': n, 'max_z': float(z.max()), 'worst': labels[z.argmax()]}
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+    bench_parser = ArgumentParser(description='Time the ConflictSheet query paths on synthetic lineups')
+    bench_parser.add_argument('--scales', help='multiples of the real data size', type=int, nargs='+', default=[1, 10, 100])
+    bench_parser.add_argument('--seasons', help='daytime seasons to generate', type=int, default=CURRENT_SEASON)
+    bench_parser.add_argument('--repeat', help='cold/warm runs per query', type=int, default=5)
+    bench_parser.add_argument('--cache-sizes', help='LFU budgets in MB for the mixed workload', type=int, nargs='+', default=[8, 32, 128])
+    bench_parser.add_argument('--calls', help='queries in the mixed workload', type=int, default=500)
+    bench_parser.add_argument('--gen-check', help='lineups of each generator to compare, 0 to skip', type=int, default=20000)
+    bench_parser.add_argument('--seed', type=int, default=0)
+    bench_parser.add_argument('-o', dest='output', help='JSON lines output', default='bench_output.txt')
+    bench_options = bench_parser.parse_args()
+
+    pl.toggle_string_cache(True)
+    random.seed(bench_options.seed)
+    commit = _commit()
+
+    t = time.perf_counter()
+    base = synthetic_frames(bench_options.seasons)
+    print(f'generated 1x lineups in {time.perf_counter() - t:.1f}s')
+
+    with open(bench_options.output, 'w') as out:
+        if bench_options.gen_check:
+            r = compare_gen_lineups(ConflictSheet(None, None, frames=base), bench_options.gen_check, bench_options.seed)
+            out.write(json.dumps({'commit': commit} | r) + '\n')
+            print(f'gen_lineups vs gen_lineup: max |z| {r["max_z"]:.2f} at {r["worst"]}')
+            if r['max_z'] > GEN_CHECK_Z:
+                raise SystemExit(f'gen_lineups does not follow gen_lineup\'s rules (|z| > {GEN_CHECK_Z} at {r["worst"]})')
+
+        for k in bench_options.scales:
+            frames = scale_frames(base, k)
+            t = time.perf_counter()
+            cs = ConflictSheet(None, None, frames=frames)
+            build_ms = 1000 * (time.perf_counter() - t)
+            meta = {'commit': commit, 'scale': k, 'rows': cs.get('daytime').height}
+
+            results = [{'family': 'build', 'case': 'frames+indexes', 'cold_ms': build_ms}]
+            results += bench_queries(cs, bench_options.repeat)
+            results += bench_cache_sizes(cs, bench_options.cache_sizes, bench_options.calls)
+
+            print(f'\n{k}x, {meta["rows"]} daytime rows')
+            for r in results:
+                out.write(json.dumps(meta | r) + '\n')
+                if r['family'] == 'lfu':
+                    print(f'  {"lfu":<22} {r["case"]:<16} hit rate {r["hit_rate"]:6.1%}  total {r["total_ms"]:10.1f} ms')
+                else:
+                    warm = f'warm {r["warm_ms"]:9.2f} ms' if 'warm_ms' in r else ''
+                    print(f'  {r["family"]:<22} {r["case"]:<16} cold {r["cold_ms"]:9.2f} ms  {warm}')
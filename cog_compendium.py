@@ -20,7 +20,7 @@ from humanize import ordinal
 from more_itertools import chunked, value_chain
 from sortedcontainers import SortedSet
 
-from compendium import COMPENDIUM_NOTES, CURRENT_SEASON, WheelCompendium, dl_season
+from compendium import COMPENDIUM_NOTES, CURRENT_SEASON, WheelCompendium, dl_season, letter_count
 from util import (
     NONNEGATIVE_INT,
     POSITIVE_INT,
@@ -119,6 +119,8 @@ _date_logic_to_str = {
     ')': 'earlier than',
     ']': 'on or before',
 }
+# is_between's closed= for an interval's brackets
+_interval_closed = {('[', ']'): 'both', ('[', ')'): 'left', ('(', ']'): 'right', ('(', ')'): 'none'}
 _col_name_remapping = {
     'SEASON': 'S',
     'EPISODE': 'EP',
@@ -181,7 +183,6 @@ _month_backmapping = [
     'December',
 ]
 _letters_mapping = {'CONSONANT': 'BCDFGHJKLMNPQRSTVWXYZ'}
-_word_regex = r"\b[A-Z-'\.]+\b"
 
 
 def build_int_expression(base_expr, conds, date_hybrid=False):
@@ -196,7 +197,7 @@ def build_int_expression(base_expr, conds, date_hybrid=False):
             b1, start, end, b2 = m.groups()
             start = int(start)
             end = int(end)
-            cond_builder.append(base_expr.is_between(start, end, [b1 == '[', b2 == ']']))
+            cond_builder.append(base_expr.is_between(start, end, closed=_interval_closed[b1, b2]))
             desc_builder.append(f'{str_converter(b1)} {start} and {str_converter(b2)} {end}')
             plural |= start != 1 or end != 1
         elif re.fullmatch('\d+(,\s*\d+)+', c):
@@ -237,7 +238,7 @@ def build_date_expression(base_expr, conds, dateFormat):
         if m := _DTM.match(f'([\[\(])({dateFormat}),\s*({dateFormat})([\)\]])', c):
             b1, b2 = m.group(1, 4)
             start, end = [df(d) for d in m.group(2, 3)]
-            cond_builder.append(base_expr.is_between(start, end, [b1 == '[', b2 == ']']))
+            cond_builder.append(base_expr.is_between(start, end, closed=_interval_closed[b1, b2]))
             desc_builder.append(f'{_date_logic_to_str[b1]} {m.group(2)} and {_date_logic_to_str[b2]} {m.group(3)}')
         elif m := _DTM.match(f'^=?\s*({dateFormat})$', c):
             d = df(m.group(1))
@@ -260,6 +261,26 @@ def build_date_expression(base_expr, conds, dateFormat):
         return cond_builder[0], desc_builder[0]
 
 
+def top_level_conjuncts(logicExpr: str) -> List[int]:
+    """Indices of the conditions logicExpr ANDs together at its top level, the ones every matching row must satisfy."""
+    if logicExpr == 'all':
+        return list(range(26))
+    terms, depth, start = [], 0, 0
+    for i, c in enumerate(logicExpr):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif depth == 0 and c in '|^':
+            # & binds tighter, an | or ^ outside parentheses is what the whole expression is
+            return []
+        elif depth == 0 and c == '&':
+            terms.append(logicExpr[start:i])
+            start = i + 1
+    terms.append(logicExpr[start:])
+    return [ord(m[1]) - ord('A') for t in terms if (m := re.fullmatch(r'[\s(]*([A-Z])[\s)]*', t))]
+
+
 class CompendiumCog(commands.Cog, name='Compendium'):
     """https://buyavowel.boards.net/page/compendiumindex"""
 
@@ -329,6 +350,8 @@ class CompendiumCog(commands.Cog, name='Compendium'):
 
         f_exprs = []
         cond_descriptions = []
+        # condition index -> its expression, for each condition on S
+        season_exprs = {}
 
         if len(options.conditions) > 26:
             raise ValueError("Too many conditions given, max is 26. (You shouldn't need close to this many!)")
@@ -368,10 +391,10 @@ class CompendiumCog(commands.Cog, name='Compendium'):
                     col = _col_name_remapping.get(col, col)
 
                     if p_q.startswith('L'):
-                        f = pl.col(col).str.contains(lit, literal=True)
+                        f = self.wc.text_match(col, lit, literal=True)
                         cd = f'{col} contains "{lit}"'
                     else:
-                        f = pl.col(col).str.contains(f'^{lit}$')
+                        f = self.wc.text_match(col, f'^{lit}$')
                         cd = f'{col} is exactly "{lit}"'
                 case ['PUZZLE' | 'P' | 'CLUE/BONUS' | 'CLUE' | 'BONUS' | 'CB' | 'B' as col, regex, *e]:
                     col = _col_name_remapping.get(col, col)
@@ -381,7 +404,7 @@ class CompendiumCog(commands.Cog, name='Compendium'):
                         f, cd, p = build_int_expression(pl.col(col).str.count_match(regex), e)
                         cd = f'{col} matches "{regex}" {cd} time' + ('s' if p else '')
                     else:
-                        f = pl.col(col).str.contains(regex)
+                        f = self.wc.text_match(col, regex)
                         cd = f'{col} matches "{regex}"'
                 case ['RD' | 'ROUND' | 'R' | 'CAT' | 'CATEGORY' as col, regex]:
                     col = _col_name_remapping.get(col, col)
@@ -396,6 +419,8 @@ class CompendiumCog(commands.Cog, name='Compendium'):
 
                     f, cd, _ = build_int_expression(pl.col(col), e)
                     cd = f'{col} is {cd}'
+                    if col == 'S':
+                        season_exprs[len(f_exprs)] = f
                 case [
                     'DATE' | 'D' as col,
                     'YEAR' | 'Y' | 'MONTH' | 'M' | 'DAY' | 'D' | 'DOW' | 'WKDAY' | 'WEEKDAY' as dt_q,
@@ -421,7 +446,11 @@ class CompendiumCog(commands.Cog, name='Compendium'):
                     else:
                         backmapping = lambda cd: cd
 
-                    f, cd, _ = build_int_expression((attrgetter(dt_q.lower())(pl.col('DATE').dt))(), e, special)
+                    dt_expr = (attrgetter(dt_q.lower())(pl.col('DATE').dt))()
+                    if dt_q == 'WEEKDAY':
+                        # polars gives the ISO weekday, conditions count Monday as 0
+                        dt_expr = dt_expr - 1
+                    f, cd, _ = build_int_expression(dt_expr, e, special)
                     cd = f'{dt_q} of DATE is ' + backmapping(cd)
                 case ['DATE' | 'D' as col, *e]:
                     col = _col_name_remapping.get(col, col)
@@ -435,10 +464,10 @@ class CompendiumCog(commands.Cog, name='Compendium'):
                     f, cd = build_date_expression(pl.col(col), e, options.dateFormat)
                     cd = f'{col} is {cd}'
                 case ['LENGTH' | 'LC' | 'L', *e]:
-                    f, cd, _ = build_int_expression(pl.col('PUZZLE').str.extract_all('[A-Z]').arr.lengths(), e)
+                    f, cd, _ = build_int_expression(pl.col('N_LETTERS'), e)
                     cd = f'length is {cd}'
                 case ['LENGTH_UNIQUE' | 'LCU' | 'LU', *e]:
-                    f, cd, _ = build_int_expression(pl.col('PUZZLE').str.extract_all('[A-Z]').arr.unique().arr.lengths(), e)
+                    f, cd, _ = build_int_expression(pl.col('N_UNIQUE'), e)
                     cd = f'total number of unique letters is {cd}'
                 case ['COUNT' | 'C', letters, *e]:
                     if letters in _letters_mapping:
@@ -446,13 +475,7 @@ class CompendiumCog(commands.Cog, name='Compendium'):
                     elif not re.match('[A-Z]+', letters) or not len(set(letters)) == len(letters):
                         raise ValueError(f'Malformed letter string (must be all A-Z and all unique): {letters}')
 
-                    f, cd, _ = build_int_expression(
-                        pl.col('PUZZLE')
-                        .str.extract_all('[A-Z]')
-                        .arr.eval(pl.element().is_in(list(letters)), parallel=True)
-                        .arr.sum(),
-                        e,
-                    )
+                    f, cd, _ = build_int_expression(letter_count(letters), e)
                     cd = f'total number of {letters} is {cd}'
                 case ['COUNT_UNIQUE' | 'CU', letters, *e]:
                     if letters in _letters_mapping:
@@ -460,37 +483,27 @@ class CompendiumCog(commands.Cog, name='Compendium'):
                     elif not re.match('[A-Z]+', letters) or not len(set(letters)) == len(letters):
                         raise ValueError(f'Malformed letter string (must be all A-Z and all unique): {letters}')
 
-                    f, cd, _ = build_int_expression(
-                        pl.col('PUZZLE')
-                        .str.extract_all('[A-Z]')
-                        .arr.unique()
-                        .arr.eval(pl.element().is_in(list(letters)), parallel=True)
-                        .arr.sum(),
-                        e,
-                    )
+                    f, cd, _ = build_int_expression(letter_count(letters, distinct=True), e)
                     cd = f'total unique number of {letters} is {cd}'
                 case ['WORD_COUNT' | 'WC', *e]:
-                    f, cd, _ = build_int_expression(pl.col('PUZZLE').str.count_match(_word_regex), e)
+                    f, cd, _ = build_int_expression(pl.col('N_WORDS'), e)
                     cd = f'total word count is {cd}'
+                case ['PATTERN' | 'PAT', shape]:
+                    # a board with spaces can be quoted to show where it starts and ends
+                    if len(shape) > 1 and shape[0] == shape[-1] == '"':
+                        shape = shape[1:-1]
+                    shape = re.sub('[A-Z]', '_', shape)
+                    f = pl.col('PATTERN') == shape
+                    cd = f'board pattern is "{shape}"'
                 case ['WORD' | 'W', regex]:
-                    f = (
-                        pl.col('PUZZLE')
-                        .str.extract_all(_word_regex)
-                        .arr.eval(pl.element().str.contains(regex), parallel=True)
-                        .arr.contains(True)
-                    )
+                    f = pl.col('ID').is_in(self.wc.word_rows(regex))
                     cd = f'any word matches "{regex}"'
                 case ['WORD' | 'W', word, 'LITERAL' | 'LIT' | 'L' | 'EXACT' | 'E' as w_q]:
                     if w_q.startswith('L'):
-                        f = (
-                            pl.col('PUZZLE')
-                            .str.extract_all(_word_regex)
-                            .arr.eval(pl.element().str.contains(word, literal=True), parallel=True)
-                            .arr.contains(True)
-                        )
+                        f = pl.col('ID').is_in(self.wc.word_rows(word, 'literal'))
                         cd = f'any word contains "{word}"'
                     else:
-                        f = pl.col('PUZZLE').str.extract_all(_word_regex).arr.contains(word)
+                        f = pl.col('ID').is_in(self.wc.word_rows(word, 'exact'))
                         cd = f'any word is exactly "{word}"'
                 case ['WORD' | 'W', regex, idx]:
                     idx = int(idx)
@@ -502,7 +515,7 @@ class CompendiumCog(commands.Cog, name='Compendium'):
                     else:
                         sub_cd = ordinal(-idx) + '-to-last' if idx < -1 else 'last'
 
-                    f = pl.col('PUZZLE').str.extract_all(_word_regex).arr.get(idx).str.contains(regex)
+                    f = pl.col('ID').is_in(self.wc.word_rows(regex, idx=idx))
                     cd = f'{sub_cd} word matches "{regex}"'
                 case ['WORD' | 'W', word, 'LITERAL' | 'LIT' | 'L' | 'EXACT' | 'E' as w_q, idx]:
                     idx = int(idx)
@@ -514,13 +527,11 @@ class CompendiumCog(commands.Cog, name='Compendium'):
                     else:
                         sub_cd = ordinal(-idx) + '-to-last' if idx < -1 else 'last'
 
-                    base_expr = pl.col('PUZZLE').str.extract_all(_word_regex).arr.get(idx)
-
                     if w_q.startswith('L'):
-                        f = base_expr.str.contains(word, literal=True)
+                        f = pl.col('ID').is_in(self.wc.word_rows(word, 'literal', idx))
                         cd = f'{sub_cd} word contains "{word}"'
                     else:
-                        f = base_expr == word
+                        f = pl.col('ID').is_in(self.wc.word_rows(word, 'exact', idx))
                         cd = f'{sub_cd} word is exactly "{word}"'
                 case ['UC' | 'PP' | 'PR' | 'RL' as col]:
                     f = pl.col(col)
@@ -551,8 +562,16 @@ class CompendiumCog(commands.Cog, name='Compendium'):
             total_expr = eval(re.sub('([A-Z])', r'(\1)', options.logicExpr))
             expr_str = f'\n{options.logicExpr}; where'
 
+        # season conditions every matching row must satisfy, only those seasons' rows need scanning.
+        required = [season_exprs[i] for i in top_level_conjuncts(options.logicExpr) if i in season_exprs]
+        if required:
+            seasons = pl.DataFrame({'S': pl.Series(list(self.wc.seasons), dtype=pl.UInt8)})
+            base_df = self.wc.season_slice(seasons.filter(pl.all(required)).to_series())
+        else:
+            base_df = self.wc.df
+
         async with ctx.typing():
-            sub_df = self.wc.df.filter(total_expr).collect()
+            sub_df = base_df.lazy().filter(total_expr).select(self.wc.columns).collect()
             # _log.debug(f'\n{sub_df}')
 
             bonus_df = sub_df.lazy().filter(pl.col('CLUE/BONUS').str.lengths() > 0).collect()
@@ -682,7 +701,6 @@ class CompendiumCog(commands.Cog, name='Compendium'):
     @wheelcompendium.command(aliases=['pc'], description='Gives the total puzzle count in the given seasons.')
     async def puzzle_count(self, ctx, seasons: commands.Greedy[SEASON_RANGE], range: bool = False):
         """Gives the total puzzle count in the compendium in the given seasons (all by default, if range is True it will treat each pair of inputs as an inclusive range) compendium without any further results."""
-        q = self.wc.df
         if seasons:
             if range:
                 seasons = list(
@@ -695,8 +713,9 @@ class CompendiumCog(commands.Cog, name='Compendium'):
                         step=1,
                     )
                 )
-            q = q.filter(pl.col('S').is_in(seasons))
-        await ctx.send(f'`{q.collect().height}`')
+        else:
+            seasons = None
+        await ctx.send(f'`{self.wc.puzzle_count(seasons)}`')
 
     @wheelcompendium.command(
         aliases=['cov'], description='Calculates the number of unique shows covered in the given seasons.'
@@ -729,7 +748,7 @@ class CompendiumCog(commands.Cog, name='Compendium'):
             else:  # if isinstance(e.__cause__, ValueError):
                 await ctx.send(f'`{e.__cause__}`', ephemeral=True)
         elif isinstance(e, commands.CheckFailure):
-            if not self.wc or not self.wc.df:
+            if not self.wc or self.wc.df is None:
                 await ctx.send('`Compendium is loading (try again shortly) or failed to load.`', ephemeral=True)
             else:
                 await ctx.send('`Only compendium maintainers can run this command.`')
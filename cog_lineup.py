@@ -4,17 +4,19 @@ import logging
 import operator
 import random
 import string
-from collections import OrderedDict
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
 from datetime import *
 from functools import reduce
-from typing import List, Literal, Optional, Union
+from typing import Callable, ContextManager, List, Literal, NamedTuple, Optional, Tuple, Union
 
 import discord
 import discord.ui as dui
 import numpy as np
 import polars as pl
 import portion as P
+from cachetools.func import lfu_cache
 from discord.ext import commands
 from more_itertools import chunked, value_chain
 from sortedcontainers import SortedSet
@@ -35,7 +37,9 @@ from util import (
     parse_time_options,
     pretty_print_polars as ppp,
     season_portion_str,
+    send_long_lines,
     send_long_mes,
+    MAX_MES_SIZE,
     PLAYING_FLAGS,
     NAME_ATTRGET,
     SCHEDULER_TZ,
@@ -171,7 +175,7 @@ def trim_query(q: pl.LazyFrame, sortBy: str = 'prod', since: bool = False):
     return q.select(pl.exclude('^PG\d?_.+$')).collect()
 
 
-def gen_lineup_submes(sub_df: pl.DataFrame, initial_str: str):
+def _lineup_display(sub_df: pl.DataFrame):
     q = sub_df.lazy()
 
     notes_check = sub_df.select(pl.all(pl.col('NOTES').is_null())).to_series()
@@ -191,12 +195,143 @@ def gen_lineup_submes(sub_df: pl.DataFrame, initial_str: str):
         elif half_hour_check.any():
             q = q.with_column(pl.col('^PG[4-6]$').fill_null(''))
 
-    sub_df = q.collect()
+    return q.collect()
+
 
+def gen_lineup_submes(sub_df: pl.DataFrame, initial_str: str):
+    sub_df = _lineup_display(sub_df)
     sub_df_str = ppp(sub_df) if sub_df.height else '' if initial_str else 'None'
     return f'{initial_str}\n\n{sub_df_str}' if initial_str else sub_df_str
 
 
+class LineupText:
+    """gen_lineup_submes of a frame, rendered a slice of rows at a time instead of as one string.
+
+    Every slice is printed by pretty_print_polars together with the frame's widest rows, which are then cut off again:
+    the columns come out as wide as over the whole frame, so every slice lines up with the others and with the header."""
+
+    def __init__(self, sub_df: pl.DataFrame, initial_str: str = ''):
+        self.df = _lineup_display(sub_df)
+        self.initial_str = initial_str
+        self.height = self.df.height
+        self._widest = self.df[self._widest_rows(self.df)]
+        head = ppp(self._widest).split('\n')
+        self._header_lines = len(head) - self._widest.height
+        self.header = '\n'.join(head[: self._header_lines])
+        # every line is as wide as the header
+        self.size = (len(initial_str) + 2 if initial_str else 0) + len(self.header) + self.height * (len(self.header) + 1)
+
+    @staticmethod
+    def _widest_rows(df: pl.DataFrame):
+        # a column is printed as wide as its widest cell: its longest string, or its largest or smallest value, or a null
+        if not df.height:
+            return []
+        rows = {0}
+        for s in df.get_columns():
+            if s.dtype in (pl.Float32, pl.Float64):
+                # polars picks each float's format on its own, the widest is only found by printing the column
+                cells = [line.lstrip() for line in ppp(s.to_frame()).split('\n')[-df.height :]]
+                rows.add(max(range(df.height), key=lambda i: len(cells[i])))
+                continue
+            if s.dtype in (pl.Utf8, pl.Categorical):
+                s = s.cast(pl.Utf8).str.n_chars()
+            elif s.dtype == pl.Boolean:
+                s = s.cast(pl.UInt8)
+            else:
+                s = s.to_physical()
+            rows.update(i for i in (s.arg_max(), s.arg_min()) if i is not None)
+            if s.null_count():
+                rows.add(s.is_null().arg_max())
+        return sorted(rows)
+
+    def lines(self, offset: int, length: int):
+        rows = self.df.slice(offset, length)
+        if not rows.height:
+            return []
+        return ppp(pl.concat([rows, self._widest])).split('\n')[self._header_lines : self._header_lines + rows.height]
+
+    def chunks(self, rows: int = 500):
+        yield (f'{self.initial_str}\n\n' if self.initial_str else '') + self.header
+        for offset in range(0, self.height, rows):
+            yield '\n' + '\n'.join(self.lines(offset, rows))
+
+
+class LineupPagesView(dui.View):
+    PAGE_ROWS = 15
+
+    def __init__(self, ctx, text: LineupText, rows_per_page: int):
+        super().__init__(timeout=600.0)
+        self.ctx = ctx
+        self.text = text
+        self.rows_per_page = rows_per_page
+        self.pages = -(-text.height // rows_per_page)
+        self.page = 0
+        self.message = None
+        self._update_buttons()
+
+    def content(self):
+        lines = self.text.lines(self.page * self.rows_per_page, self.rows_per_page)
+        initial = f'{self.text.initial_str}\n\n' if self.text.initial_str else ''
+        return f'```\n{initial}{self.text.header}\n' + '\n'.join(lines) + f'```Page {self.page + 1}/{self.pages}'
+
+    def _update_buttons(self):
+        self.previous.disabled = self.page == 0
+        self.next.disabled = self.page == self.pages - 1
+
+    async def _turn(self, interaction, page):
+        self.page = page
+        self._update_buttons()
+        await interaction.response.edit_message(content=self.content(), view=self)
+
+    @dui.button(emoji='◀️', style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction, button):
+        await self._turn(interaction, self.page - 1)
+
+    @dui.button(emoji='▶️', style=discord.ButtonStyle.secondary)
+    async def next(self, interaction, button):
+        await self._turn(interaction, self.page + 1)
+
+    @dui.button(label='Full file', emoji='📄', style=discord.ButtonStyle.primary)
+    async def full_file(self, interaction, button):
+        button.disabled = True
+        await interaction.response.edit_message(view=self)
+        await send_long_lines(self.ctx, self.text.chunks())
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id == self.ctx.author.id:
+            return True
+        await interaction.response.send_message('Only whoever ran the command can page through this.', ephemeral=True)
+        return False
+
+    async def on_timeout(self):
+        if self.message:
+            await self.message.edit(view=None)
+
+
+async def send_lineups(ctx, sub_df: pl.DataFrame, initial_str: str = '', max_pages: int = 20):
+    """send_long_mes(ctx, gen_lineup_submes(sub_df, initial_str)), without ever building the whole text.
+
+    Short results are sent as before. Longer ones get paged through on demand if they fit in a few pages, the rest are
+    streamed into an attachment."""
+    if not sub_df.height:
+        await send_long_mes(ctx, gen_lineup_submes(sub_df, initial_str))
+        return
+
+    text = LineupText(sub_df, initial_str)
+    if text.size < MAX_MES_SIZE - 7 and initial_str.count('\n') + 2 * bool(initial_str) + text.height <= 19:
+        await send_long_mes(ctx, ''.join(text.chunks()))
+        return
+
+    # code block, initial_str, header and page number around the rows
+    fixed = len(initial_str) + len(text.header) + 30
+    rows_per_page = min(LineupPagesView.PAGE_ROWS, (MAX_MES_SIZE - fixed) // (len(text.header) + 1))
+    if rows_per_page > 0 and -(-text.height // rows_per_page) <= max_pages:
+        view = LineupPagesView(ctx, text, rows_per_page)
+        view.message = await ctx.send(view.content(), view=view)
+    else:
+        await send_long_lines(ctx, text.chunks())
+
+
 class CSUpdateView(dui.View):
     def __init__(self, cc, prodNumber, retro, guild, scheduler, pgUpdate=True):
         super().__init__(timeout=3600.0)
@@ -250,6 +385,168 @@ class CSUpdateView(dui.View):
         # )
 
 
+class QueryRejected(Exception):
+    pass
+
+
+class QueryRunner:
+    """Runs ConflictSheet queries on a small pool of worker threads, so collecting a frame never blocks the event loop.
+
+    Each user gets at most a couple of queries in flight. A query is abandoned at its timeout, or when the interaction
+    that invoked it expires, whichever comes first. A query still waiting for a worker is dropped then; one already
+    running can't be stopped, it finishes in the background with its result discarded and keeps counting against its
+    user until it does.
+
+    pin gives the context each query runs in, the sheet's pinned() so all of a query sees one version of the frames."""
+
+    MAX_WORKERS = 4
+    PER_USER = 2
+    TIMEOUT = 30.0
+
+    def __init__(self, pin: Callable[[], ContextManager]):
+        self._executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix='cs_query')
+        self._running = Counter()
+        self._pin = pin
+
+    def _call(self, func, *args):
+        with self._pin():
+            return func(*args)
+
+    def _timeout(self, ctx):
+        if ctx.interaction:
+            return min(self.TIMEOUT, (ctx.interaction.expires_at - datetime.now(tz=timezone.utc)).total_seconds())
+        return self.TIMEOUT
+
+    async def run(self, ctx, func, *args):
+        user = ctx.author.id
+        if self._running[user] >= self.PER_USER:
+            raise QueryRejected(f'You already have {self._running[user]} queries running, wait for one to finish.')
+
+        self._running[user] += 1
+        loop = asyncio.get_running_loop()
+        cfut = self._executor.submit(self._call, func, *args)
+        # the slot is given back when the worker is actually done (or the query never started), not when we stop waiting
+        cfut.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release, user))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(cfut), self._timeout(ctx))
+        except asyncio.TimeoutError:
+            _log.warning(f'cs query {ctx.command} by {ctx.author} timed out: {ctx.message.content}')
+            raise QueryRejected('Query took too long, stopped waiting for it. Try a smaller time range or fewer PGs.')
+
+    def _release(self, user):
+        self._running[user] -= 1
+        if not self._running[user]:
+            del self._running[user]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SearchError(Exception):
+    pass
+
+
+class SearchPlan(NamedTuple):
+    logic: str
+    # (PGs, slots, flags, counts) of each condition, in the order given
+    conditions: Tuple[tuple, ...]
+    note_regex: Optional[str]
+    warnings: Tuple[str, ...]
+    slot_queried: bool
+    warned_slot: bool
+    warned_game: bool
+    # how many condition letters a custom logic expression uses, 0 for all/any
+    sym_free: int
+
+
+@lfu_cache(maxsize=256)
+def compile_search(logic: str, conditions: Tuple[str, ...], exclude_uncertain: bool) -> SearchPlan:
+    """The condition strings of a search parsed and checked once, repeats of a search come straight from here.
+
+    Raises SearchError with what to tell the user."""
+    overallCond = []
+    warning_strs = []
+    slot_queried = False
+    warned_slot = False
+    warned_game = False
+    DEFAULT_FLAGS = ALL_FLAGS_BUT_UNCERTAIN if exclude_uncertain else ANY_FLAG
+    noteRegex = None
+
+    for cond in conditions:
+        m = re.fullmatch('n(?:otes)?[,;](.+?)', cond)
+        if m:
+            if noteRegex:
+                raise SearchError('More than one notes regex specified in conditions.')
+            noteRegex = m.group(1)
+            continue
+
+        workingPGs = None
+        workingSlots = ANY_SLOT
+        workingFlags = DEFAULT_FLAGS
+        workingFreqs = ANY_FREQ
+        for pgCond in re.split(r'[,;]+', cond):
+            if (
+                pg := PG.lookup_table.get(pgCond) or PG.partition_table.get(PG.partition_lookup.get(pgCond))
+            ) or re.match('^[-*]+$', pgCond):
+                if workingPGs:
+                    raise SearchError(f'More than one PG/PGGroup in condition "{cond}".')
+                workingPGs = (pg if type(pg) == frozenset else (pg,)) if pg else PG_WILDCARD
+            elif pgCond[0].lower() == 's' and re.match(SLOTS_REGEX, pgc := pgCond[1:]):
+                if workingSlots != ANY_SLOT:
+                    raise SearchError(f'More than one slot specification in condition "{cond}".')
+                workingSlots = frozenset(int(i) for i in pgc)
+            elif pgCond[0].lower() == 'h' and re.match(HALF_REGEX, pgc := pgCond[1:]):
+                if workingSlots != ANY_SLOT:
+                    raise SearchError(f'More than one slot specification in condition "{cond}".')
+                workingSlots = FIRST_HALF if pgCond[1] == '1' else SECOND_HALF
+            elif pgCond[0].lower() == 'c' and re.match(FREQS_REGEX, pgc := pgCond[1:]):
+                if workingFreqs != ANY_FREQ:
+                    raise SearchError(f'More than one count specification in condition "{cond}".')
+                workingFreqs = frozenset(int(i) for i in pgc)
+            elif pgCond[0].lower() == 'f' and re.match(FLAGS_REGEX, pgcu := pgCond[1:].upper()):
+                if workingFlags != DEFAULT_FLAGS:
+                    raise SearchError(f'More than one flag specification in condition "{cond}".')
+                workingFlags = tuple(0 if i.isnumeric() else 2 ** PLAYING_FLAGS_SINGLE.index(i) for i in pgcu)
+            else:
+                raise SearchError(f"Malformed condition string: '{pgCond}'")
+
+        if not workingPGs:
+            raise SearchError(f'No valid PG or wildcard specified in condition "{cond}"')
+        if workingSlots != ANY_SLOT:
+            if PG._UNKNOWN in workingPGs:
+                warning_strs.append('DISCLAIMER: Missing games have uncertain slots by definition.')
+            elif SlotCertainty.SLOT in workingFlags:
+                warning_strs.append('DISCLAIMER: Slotting of uncertainly slotted playings specified in a condition.')
+                warned_slot = True
+            else:
+                slot_queried = True
+        if SlotCertainty.GAME in workingFlags:
+            warning_strs.append(
+                'DISCLAIMER: Uncertain playing flag specified in a condition. Playings marked with the ? flag belong to a lineup that is, at worst, close to the given production number.'
+            )
+            warned_game = True
+
+        overallCond.append((workingPGs, workingSlots, workingFlags, workingFreqs))
+
+    letters = set(re.findall('[A-Z]', logic))
+    if len(overallCond) > 26:
+        raise SearchError(
+            "More than 26 conditions in a custom logical expression. You don't need anywhere near this many, stop trying to break me! If you really need this many, consider using PGGroups to whittle down the expression count."
+        )
+    elif (sym_free := len(letters)) and sym_free != len(overallCond):
+        raise SearchError(
+            f'Logical expression mismatch. Expecting {len(overallCond)} variables, got {sym_free} instead in "{logic}"'
+        )
+    elif sym_free and letters != set(string.ascii_uppercase[:sym_free]):
+        raise SearchError(
+            f'Logical expression mismatch. Expecting variables {string.ascii_uppercase[:sym_free]}, got {"".join(sorted(letters))} instead in "{logic}"'
+        )
+
+    return SearchPlan(
+        logic, tuple(overallCond), noteRegex, tuple(warning_strs), slot_queried, warned_slot, warned_game, sym_free
+    )
+
+
 class EditLineupFlags(commands.FlagConverter, delimiter='=', case_insensitive=True):
     prodNumber: prodStr = commands.flag(aliases=['prod'])
     airdate: str = commands.flag(aliases=['air'], default=None)
@@ -337,6 +634,7 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
         self.latest_conflict = {}
         self.latest_meta = {}
         self.latest_lock = asyncio.Lock()
+        self.queries = QueryRunner(lambda: self.cs.pinned())
         self.bot = bot
 
     # bases
@@ -370,23 +668,25 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
         )
         _log.info('end creating cs at ' + str(datetime.now()))
 
+    async def cog_unload(self):
+        self.queries.shutdown()
+
     async def cog_check(self, ctx):
         return self.cs and self.cs.is_ready()
 
     async def cs_update(self, view):
         async with self.latest_lock:
             mes, prodNumber, pgps, retro = self.latest_conflict[view]
-            _log.info('start updating & reloading cs at ' + str(datetime.now()))
-            await asyncio.to_thread(
+            _log.info('start updating cs at ' + str(datetime.now()))
+            persisted = await asyncio.to_thread(
                 self.cs.update, prodNumber, pgps, not retro, datetime.now(tz=SCHEDULER_TZ).date(), None, None
             )
-            await asyncio.to_thread(self.cs.initialize)
             _log.info('end cs at ' + str(datetime.now()))
             del self.latest_conflict[view]
             view.finish()
             await mes.edit(view=view)
-            await asyncio.to_thread(self.cs.save_excel)
-            _log.info('end saving excel at ' + str(datetime.now()))
+        await asyncio.wrap_future(persisted)
+        _log.info('end saving excel at ' + str(datetime.now()))
 
     @played.command(aliases=['conflictsheet', 'sheet', 'cs'], with_app_command=False)
     async def concurrencesheet(
@@ -428,7 +728,7 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
             for pg, pn, f in zip(pgs, playing_names, options.pgFlags)
         ]
 
-        gs = self.cs.gen_sheet(pgps, ep, epText, options.time)
+        gs = await self.queries.run(ctx, self.cs.gen_sheet, pgps, ep, epText, options.time)
         mc = f'```\n{gs}```'
 
         if options.prodNumber:
@@ -477,15 +777,14 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
     async def cs_metaupdate(self, view):
         async with self.latest_lock:
             mes, prodNumber, ad, ind, notes = self.latest_meta[view]
-            _log.info('META: start updating & reloading cs at ' + str(datetime.now()))
-            await asyncio.to_thread(self.cs.update, prodNumber, None, False, ad, ind, notes)
-            await asyncio.to_thread(self.cs.initialize)
+            _log.info('META: start updating cs at ' + str(datetime.now()))
+            persisted = await asyncio.to_thread(self.cs.update, prodNumber, None, False, ad, ind, notes)
             _log.info('META: end cs at ' + str(datetime.now()))
             del self.latest_meta[view]
             view.finish()
             await mes.edit(view=view)
-            await asyncio.to_thread(self.cs.save_excel)
-            _log.info('META: end saving excel at ' + str(datetime.now()))
+        await asyncio.wrap_future(persisted)
+        _log.info('META: end saving excel at ' + str(datetime.now()))
 
     @lineup.command(name='edit', aliases=['e'], with_app_command=False)
     async def editLineup(self, ctx, *, options: EditLineupFlags):
@@ -611,8 +910,11 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
             if options.excludeEducated:
                 flags = [fl - {2**q for q in Q_FLAG} if fl else ALL_FLAGS_BUT_GUESS for fl in flags]
 
-            sub_df = trim_query(
-                self.cs.concurrence_query(ep, options.time, tuple(pgs), tuple(flags)), options.sortBy, options.since
+            sub_df = await self.queries.run(
+                ctx,
+                lambda: trim_query(
+                    self.cs.concurrence_query(ep, options.time, tuple(pgs), tuple(flags)), options.sortBy, options.since
+                ),
             )
 
             ttl = sub_df.height
@@ -644,13 +946,13 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
                     total_str = initial_str + LINEUP_SEP + LINEUP_SEP.join(total_str)
             else:
                 initial_str = '{}, {}{}: {}'.format(pgs_str, epText, ', no ? flag' if options.excludeEducated else '', ttl)
-                if options.showLineup and ttl:
-                    total_str = gen_lineup_submes(
-                        sub_df.select(pl.exclude('S')) if ep and options.start == options.end else sub_df, initial_str
-                    )
 
-        if options.showLineup and ttl:
+        if options.showLineup and ttl and bySeasonBool:
             await send_long_mes(ctx, total_str)
+        elif options.showLineup and ttl:
+            await send_lineups(
+                ctx, sub_df.select(pl.exclude('S')) if ep and options.start == options.end else sub_df, initial_str
+            )
         else:
             await ctx.send(f'`{initial_str}`')
 
@@ -715,11 +1017,11 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
             else:
                 flags_str = ''
 
-            sub_slots_df = self.cs.endpoint_sub(
-                ep, options.time, q=self.cs.slot_table(options.time, 'S' if options.time != 'primetime' else None)
-            )
-            if options.pgFlags:
-                sub_slots_df = sub_slots_df.filter(pl.col('flag').is_in(list(options.pgFlags)))
+            def slot_counts(ep):
+                q = self.cs.slot_counts(ep, options.time)
+                return q.filter(pl.col('flag').is_in(list(options.pgFlags))) if options.pgFlags else q
+
+            sub_slots_df = await self.queries.run(ctx, slot_counts, ep)
 
             for pgQ in pgQueries:
                 isPGGroup = not type(pgQ) == PG
@@ -768,14 +1070,21 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
                     season_chunks = [pg_ep.replace(lower=sc[0], upper=sc[-1]) for sc in chunked(ep_list, options.bySeason)]
                     sc_strs = [season_portion_str(sc) for sc in season_chunks]
 
-                    h = (
-                        sub_slots_df.filter(
-                            pl.col('PG').is_in([str(pg) for pg in pgQ]) if isPGGroup else pl.col('PG') == str(pgQ)
+                    def chunk_slot_counts(season_chunks, pgs):
+                        # every chunk is a couple of lookups into the slot index, no re-aggregation of the whole table.
+                        # all of them are taken from the same pinned state.
+                        return (
+                            pl.concat(
+                                [slot_counts(sc).with_column(pl.lit(i).alias('S')) for i, sc in enumerate(season_chunks)]
+                            )
+                            .filter(pl.col('PG').is_in(pgs))
+                            .select(pl.exclude('PG'))
+                            .groupby(['S', 'flag'])
+                            .agg(pl.exclude('S').sum())
+                            .collect()
                         )
-                        .select(pl.exclude('PG'))
-                        .groupby([(pl.col('S').rank('dense') - 1) // options.bySeason, 'flag'])
-                        .agg(pl.exclude('S').sum())
-                    )
+
+                    h = (await self.queries.run(ctx, chunk_slot_counts, season_chunks, [str(pg) for pg in qPG])).lazy()
                     if not options.pgFlags:
                         sc_t = (SlotCertainty.SLOT, SlotCertainty.GAME)
                         h_unc = (
@@ -920,15 +1229,6 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
         except ValueError:
             return
 
-        # not sure why copy is needed? reset_index?
-        sub_slots_df = self.cs.endpoint_sub(
-            ep,
-            options.time,
-            q=self.cs.slot_table(
-                options.time, 'S' if options.time != 'primetime' else None
-            ),  # 'S' if options.time != 'primetime' else
-        )
-
         pgQueries = list(value_chain(*pgGroups)) or list(PG)
 
         if options.N > len(pgQueries):
@@ -939,22 +1239,25 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
             filt_exprs.append(pl.col('PG').is_in([str(pg) for pg in pgQueries]))
         if options.excludeUncertain:
             filt_exprs.append(~has_any_flags('flag', frozenset({2**qu for qu in QU_FLAGS})))
-        if filt_exprs:
-            sub_slots_df = sub_slots_df.filter(pl.all(filt_exprs))
 
-        ddf = sub_slots_df.collect()
+        def totals():
+            sub_slots_df = self.cs.slot_counts(ep, options.time)
+            if filt_exprs:
+                sub_slots_df = sub_slots_df.filter(pl.all(filt_exprs))
+            # per-PG totals over every slot, the same for any slots and N asked for
+            return self.cs.materialize(
+                ('mostPlayed', ep, options.time, frozenset(pgQueries) if pgGroups else None, options.excludeUncertain),
+                sub_slots_df.groupby('PG').agg(pl.exclude('flag').sum()),
+            )
+
+        ddf = await self.queries.run(ctx, totals)
 
         if ddf.height:
             q = ddf.lazy()
             result = []
 
             for slot in slots:
-                ser = (
-                    q.groupby('PG')
-                    .agg(pl.exclude('flag').sum())
-                    .select(pl.col(f'^PG{slot}?$').sort_by(f'PG{slot}', True).head(options.N))
-                    .collect()
-                )
+                ser = q.select(pl.col(f'^PG{slot}?$').sort_by(f'PG{slot}', True).head(options.N)).collect()
                 result.append(
                     slot
                     + ORDINAL_SUFFIXES[int(slot)]
@@ -964,9 +1267,7 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
                 )
             if len(slots) > 1:
                 ser = (
-                    q.groupby('PG')
-                    .agg(pl.exclude('flag').sum())
-                    .select([pl.col('PG'), pl.fold(pl.lit(0), operator.add, pl.col(f'^PG[{slots}]$')).alias('sum')])
+                    q.select([pl.col('PG'), pl.fold(pl.lit(0), operator.add, pl.col(f'^PG[{slots}]$')).alias('sum')])
                     .select(pl.all().sort_by('sum', True).head(options.N))
                     .collect()
                 )
@@ -1044,23 +1345,28 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
             if options.excludeEducated:
                 flags = [fl - {2**q for q in Q_FLAG} if fl else ALL_FLAGS_BUT_GUESS for fl in flags]
 
-            sub_df = self.cs.concurrence_query(ep, options.time, tuple(pgs), tuple(flags)).collect()
-            total_playings = sub_df.height
+            def concurrences():
+                # the episodes and the playings counted over them have to come from the same pinned state
+                conc_df = self.cs.concurrence_query(ep, options.time, tuple(pgs), tuple(flags)).collect()
+                return conc_df, self.cs.materialize(
+                    ('concurrenceN', ep, options.time, tuple(pgs), tuple(flags)),
+                    self.cs.playings(options.time)
+                    .filter(pl.col('PG_n').is_in(conc_df.get_column('PG_n')))
+                    .filter(~pl.col('PG').is_in([str(pg) for pg in pgs]))
+                    .select(pl.col('PG').value_counts(True, True))
+                    .unnest('PG'),
+                )
+
+            conc_df, sub_df = await self.queries.run(ctx, concurrences)
+            total_playings = conc_df.height
 
             # all-Dinko check
             try:
-                check = sub_df.row(by_predicate=pl.col('PROD') == '6435K')
+                check = conc_df.row(by_predicate=pl.col('PROD') == '6435K')
                 all_dinko = True
             except pl.exceptions.RowsException:
                 all_dinko = False
 
-            sub_df = (
-                sub_df
-                .select(pl.concat_list('^PG\d_p$').alias('PG').explode().value_counts(True, True))
-                .unnest('PG')
-                .filter(~pl.col('PG').is_in([str(pg) for pg in pgs]))
-            )
-
             if options.pgGroupCompare:
                 sub_df = sub_df.filter(pl.col('PG').is_in([str(pg2) for pg2 in options.pgGroupCompare if pg2.activeIn(ep)]))
 
@@ -1135,7 +1441,7 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
 
             if N2:
                 r_text = []
-                sdf = sub_df.filter(pl.col('counts').is_between(N1, N2, True))
+                sdf = sub_df.filter(pl.col('counts').is_between(N1, N2, closed='both'))
 
                 for sdfg in sdf.groupby('counts'):
                     N = sdfg[0, 1]
@@ -1186,7 +1492,7 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
         for time in ('daytime', 'primetime', 'syndicated', 'unaired'):
             sub_df = trim_query(self.cs.get(time).lazy().filter(pl.col('PROD').is_in(prods)))
             if sub_df.height:
-                await send_long_mes(ctx, gen_lineup_submes(sub_df, ''))
+                await send_lineups(ctx, sub_df)
                 sent_any = True
 
         if not sent_any:
@@ -1201,15 +1507,14 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
         Date formatting by default, for example, is "03/26/20" (leading zeros optional)."""
         dates = re.split(r'\s+', dates)
         try:
-            dts = [(datetime.strptime(d, dateFormat) - datetime(1970, 1, 1)).days for d in dates]
+            dts = [datetime.strptime(d, dateFormat).date() for d in dates]
         except ValueError as e:
             await ctx.send(f'`Malformed date: {e}`', ephemeral=True)
             return
 
-        df = self.cs.get(time)
-        sub_df = trim_query(df.lazy().filter(pl.col('AIRDATE').dt.epoch('d').is_in(dts)))
+        sub_df = trim_query(self.cs.airdate_sub(dts, time))
         if sub_df.height:
-            await send_long_mes(ctx, gen_lineup_submes(sub_df, ''))
+            await send_lineups(ctx, sub_df)
         else:
             await ctx.send(f'`No lineups in {time} for any of these dates.`')
 
@@ -1234,9 +1539,7 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
             return
 
         if start_idx < end_idx:
-            await send_long_mes(
-                ctx, gen_lineup_submes(trim_query(sub_df.lazy().slice(start_idx - 1, end_idx - start_idx + 1)), '')
-            )
+            await send_lineups(ctx, trim_query(sub_df.lazy().slice(start_idx - 1, end_idx - start_idx + 1)))
         else:
             await ctx.send(
                 '`No production codes within that range. Are you sure start < end? Are you sure the time is right?`',
@@ -1267,10 +1570,9 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
 
         dts = pl.date_range(startDate, endDate, step)
 
-        df = self.cs.get(time)
-        sub_df = trim_query(df.lazy().filter(pl.col('AIRDATE').is_in(dts)))
+        sub_df = trim_query(self.cs.airdate_sub(dts, time))
         if sub_df.height:
-            await send_long_mes(ctx, gen_lineup_submes(sub_df, ''))
+            await send_lineups(ctx, sub_df)
         else:
             await ctx.send(f'`No lineups in {time} for any of these dates.`')
 
@@ -1285,7 +1587,7 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
         except ValueError:
             return
 
-        df = self.cs.endpoint_sub(ep, options.time).collect()
+        df = await self.queries.run(ctx, lambda: self.cs.endpoint_sub(ep, options.time).collect())
 
         if options.sort:
             comp = operator.lt
@@ -1296,7 +1598,7 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
 
         if comp(N, df.height):
             sub_df = trim_query(df.sample(n=N, with_replacement=False, shuffle=not options.sort).lazy())
-            await send_long_mes(ctx, gen_lineup_submes(sub_df, ''))
+            await send_lineups(ctx, sub_df)
         else:
             await ctx.send(
                 f'`No point to picking{extra_str} {N} shows out of a sample size of {df.height}.`', ephemeral=True
@@ -1324,103 +1626,29 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
         except ValueError:
             return
 
-        overallCond = []
-        warning_strs = []
-        slot_queried = False
-        warned_slot = False
-        warned_game = False
-        DEFAULT_FLAGS = ALL_FLAGS_BUT_UNCERTAIN if options.excludeUncertain else ANY_FLAG
-        noteRegex = None
-
-        for cond in options.conditions:
-            m = re.fullmatch('n(?:otes)?[,;](.+?)', cond)
-            if m:
-                if noteRegex:
-                    await ctx.send(f'`More than one notes regex specified in conditions.`', ephemeral=True)
-                    return
-                noteRegex = m.group(1)
-                continue
-
-            workingPGs = None
-            workingSlots = ANY_SLOT
-            workingFlags = DEFAULT_FLAGS
-            workingFreqs = ANY_FREQ
-            for pgCond in re.split(r'[,;]+', cond):
-                if (
-                    pg := PG.lookup_table.get(pgCond) or PG.partition_table.get(PG.partition_lookup.get(pgCond))
-                ) or re.match('^[-*]+$', pgCond):
-                    if workingPGs:
-                        await ctx.send(f'`More than one PG/PGGroup in condition "{cond}".`', ephemeral=True)
-                        return
-                    workingPGs = (pg if type(pg) == frozenset else (pg,)) if pg else PG_WILDCARD
-                elif pgCond[0].lower() == 's' and re.match(SLOTS_REGEX, pgc := pgCond[1:]):
-                    if workingSlots != ANY_SLOT:
-                        await ctx.send(f'`More than one slot specification in condition "{cond}".`', ephemeral=True)
-                        return
-                    workingSlots = frozenset(int(i) for i in pgc)
-                elif pgCond[0].lower() == 'h' and re.match(HALF_REGEX, pgc := pgCond[1:]):
-                    if workingSlots != ANY_SLOT:
-                        await ctx.send(f'`More than one slot specification in condition "{cond}".`', ephemeral=True)
-                        return
-                    workingSlots = FIRST_HALF if pgCond[1] == '1' else SECOND_HALF
-                elif pgCond[0].lower() == 'c' and re.match(FREQS_REGEX, pgc := pgCond[1:]):
-                    if workingFreqs != ANY_FREQ:
-                        await ctx.send(f'`More than one count specification in condition "{cond}".`', ephemeral=True)
-                        return
-                    workingFreqs = frozenset(int(i) for i in pgc)
-                elif pgCond[0].lower() == 'f' and re.match(FLAGS_REGEX, pgcu := pgCond[1:].upper()):
-                    if workingFlags != DEFAULT_FLAGS:
-                        await ctx.send(f'`More than one flag specification in condition "{cond}".`', ephemeral=True)
-                        return
-                    workingFlags = tuple(0 if i.isnumeric() else 2 ** PLAYING_FLAGS_SINGLE.index(i) for i in pgcu)
-                else:
-                    await ctx.send(f"`Malformed condition string: '{pgCond}'`", ephemeral=True)
-                    return
-
-            if not workingPGs:
-                await ctx.send(f'`No valid PG or wildcard specified in condition "{cond}"`', ephemeral=True)
-                return
-            if workingSlots != ANY_SLOT:
-                if PG._UNKNOWN in workingPGs:
-                    warning_strs.append('DISCLAIMER: Missing games have uncertain slots by definition.')
-                elif SlotCertainty.SLOT in workingFlags:
-                    warning_strs.append('DISCLAIMER: Slotting of uncertainly slotted playings specified in a condition.')
-                    warned_slot = True
-                else:
-                    slot_queried = True
-            if SlotCertainty.GAME in workingFlags:
-                warning_strs.append(
-                    'DISCLAIMER: Uncertain playing flag specified in a condition. Playings marked with the ? flag belong to a lineup that is, at worst, close to the given production number.'
-                )
-                warned_game = True
-
-            overallCond.append((workingPGs, workingSlots, workingFlags, workingFreqs))
-
-        if len(overallCond) > 26:
-            await ctx.send(
-                "`More than 26 conditions in a custom logical expression. You don't need anywhere near this many, stop trying to break me! If you really need this many, consider using PGGroups to whittle down the expression count.",
-                ephemeral=True,
-            )
-            return
-        elif (sym_free := len(set(re.findall('[A-Z]', options.logicExpr)))) and sym_free != len(overallCond):
-            await ctx.send(
-                f'`Logical expression mismatch. Expecting {len(overallCond)} variables, got {sym_free} instead in "{options.logicExpr}"`',
-                ephemeral=True,
+        try:
+            plan = compile_search(
+                options.logicExpr, tuple(options.conditions), options.excludeUncertain
             )
+        except SearchError as e:
+            await ctx.send(f'`{e}`', ephemeral=True)
             return
+        overallCond, noteRegex, sym_free = plan.conditions, plan.note_regex, plan.sym_free
+        warning_strs = list(plan.warnings)
 
         async with ctx.typing():
-            sub_df = trim_query(
-                self.cs.lineup_query(ep, options.time, options.logicExpr, tuple(overallCond)), options.sortBy, options.since
+            sub_df = await self.queries.run(
+                ctx,
+                lambda: trim_query(
+                    self.cs.lineup_query(ep, options.time, plan.logic, overallCond), options.sortBy, options.since
+                ),
             )
 
             if noteRegex:
-                sub_df = sub_df.filter(
-                    pl.col('NOTES' if options.time == 'daytime' else 'SPECIAL')
-                    .cast(str)
-                    .str.to_uppercase()
-                    .str.contains(noteRegex.upper())
+                noted = await self.queries.run(
+                    ctx, lambda: self.cs.notes_sub(options.time, noteRegex).select('PROD').collect().to_series()
                 )
+                sub_df = sub_df.filter(pl.col('PROD').is_in(noted))
 
             all_full_hour = not (options.time == 'syndicated' or sub_df.select(pl.any(pl.col('PG6').is_null()))[0, 0])
 
@@ -1503,19 +1731,18 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
             if options.start == options.end:
                 sub_df = sub_df.select(pl.exclude('S'))
 
-            main_mes = gen_lineup_submes(
-                sub_df,
-                initial_str,
-            )
+            flagged = sub_df.select(
+                [pl.any(pl.col('^PG\d$').cast(pl.Utf8).str.contains(f'({f})', literal=True)).any().alias(f) for f in '^?']
+            ).row(0, named=True)
 
-            if slot_queried and not warned_slot and '(^)' in main_mes:
+            if plan.slot_queried and not plan.warned_slot and flagged['^']:
                 warning_strs.append('DISCLAIMER: Slotting of uncertainly slotted playings factored into results.')
-            if not warned_game and '(?)' in main_mes:
+            if not plan.warned_game and flagged['?']:
                 warning_strs.append(
                     'DISCLAIMER: Playings marked with the ? flag belong to a lineup that is, at worst, close to the given production number.'
                 )
 
-        await send_long_mes(ctx, '\n'.join(warning_strs) + ('\n\n' if warning_strs else '') + main_mes)
+        await send_lineups(ctx, sub_df, '\n'.join(warning_strs) + ('\n\n' if warning_strs else '') + initial_str)
 
     @played.command(name='last', aliases=['l'], with_app_command=False)
     async def lastPlayed(
@@ -1553,7 +1780,9 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
                     unfound_pgs |= q
 
             if options.asOf:
-                cutoff = self.cs.get('daytime').select(pl.col('PROD')).row(by_predicate=pl.col('PROD') == options.asOf)[0]
+                cutoff = self.cs.get('daytime').row(by_predicate=pl.col('PROD') == options.asOf, named=True)['PG_n']
+            else:
+                cutoff = None
         except pl.exceptions.RowsException:
             await ctx.send(
                 '(One of) the daytime codes given to `pgs` or `asOf`, despite being properly formatted, does not exist. Some codes do get skipped.',
@@ -1580,19 +1809,10 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
         else:
             fs = ANY_FLAG
 
-        unfound_pgs = {str(pg) for pg in unfound_pgs}
-
         async with ctx.typing():
-            results = []
-            for pg in unfound_pgs:
-                q = self.cs.lineup_query(seasons, 'daytime', 'any', ((frozenset({pg}), ANY_SLOT, fs, ANY_FREQ),))
-                if options.asOf:
-                    q = q.filter(pl.col('PG_n') <= cutoff)
-
-                q = q.select(pl.col('^(PROD|AIRDATE)$')).tail(nth).collect()
-                if q.height:
-                    prod, airdate = q.row(0)
-                    results.append((pg, prod, airdate))
+            results = await self.queries.run(
+                ctx, lambda: self.cs.last_playings(seasons, 'daytime', unfound_pgs, nth, fs, cutoff).collect().rows()
+            )
 
             if results:
                 results.sort(key=lambda t: SORT_PROD(t[1]) if options.sortBy == 'prod' else t[2], reverse=True)
@@ -1656,7 +1876,12 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
         else:
             pgs = [str(pg) for pg in pgs]
             async with ctx.typing():
-                sub_slots_df = self.cs.slot_table('daytime', 'S')
+                sub_slots_df = {
+                    s: self.cs.slot_counts(P.singleton(s), 'daytime').with_column(
+                        pl.concat_list(pl.col('^PG\d$')).arr.sum().alias('ALL')
+                    )
+                    for s in (CURRENT_SEASON - 1, CURRENT_SEASON)
+                }
                 prior_count, current_count = (
                     self.cs.get('daytime')
                     .filter(pl.col('S') >= CURRENT_SEASON - 1)
@@ -1667,7 +1892,7 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
 
                 res = []
                 current = (
-                    sub_slots_df.filter((pl.col('S') == CURRENT_SEASON) & (pl.col('PG').is_in(pgs)))
+                    sub_slots_df[CURRENT_SEASON].filter(pl.col('PG').is_in(pgs))
                     .groupby('PG')
                     .agg(pl.col('ALL').sum())
                     .select(
@@ -1678,7 +1903,7 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
                     )
                 )
                 prior = (
-                    sub_slots_df.filter((pl.col('S') == CURRENT_SEASON - 1) & (pl.col('PG').is_in(pgs)))
+                    sub_slots_df[CURRENT_SEASON - 1].filter(pl.col('PG').is_in(pgs))
                     .groupby('PG')
                     .agg(pl.col('ALL').sum())
                     .select(
@@ -1756,6 +1981,8 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
     async def reload(self, ctx):
         await ctx.message.add_reaction('🚧')
         _log.info('start loading cs at ' + str(datetime.now()))
+        # any queued workbook write has to land before the workbook is downloaded again
+        await asyncio.to_thread(self.cs.flush)
         await asyncio.to_thread(self.cs.load_excel)
         await asyncio.to_thread(self.cs.initialize)
         _log.info('end loading cs at ' + str(datetime.now()))
@@ -1765,6 +1992,8 @@ class LineupCog(commands.Cog, name='TPIRLineups'):
     async def cog_command_error(self, ctx, e):
         if isinstance(e, commands.CheckFailure):
             await ctx.send('`Lineups are being reloaded right now, try again in a few seconds.`', ephemeral=True)
+        elif isinstance(getattr(e, 'original', None), QueryRejected):
+            await ctx.send(f'`{e.original}`', ephemeral=True)
         else:
             if ctx.command.name == 'search':
                 if isinstance(e, (commands.errors.MissingRequiredArgument, commands.errors.MissingRequiredFlag)):
@@ -6,14 +6,16 @@ import logging
 import operator
 import os
 import re
+import string
 from copy import copy
 from datetime import *
 from functools import partial, reduce
-from io import StringIO
+from io import BytesIO, StringIO
 from operator import attrgetter
 from typing import *
 
 import aiofile
+import numpy as np
 import orjson
 import polars as pl
 import portion as P
@@ -25,6 +27,7 @@ from requests_html import AsyncHTMLSession, HTMLSession
 from sortedcontainers import SortedDict
 
 from dropboxwayo import dropboxwayo
+from util import required_literals
 
 Range = Union[range, Iterable[int]]
 
@@ -56,6 +59,53 @@ COMPENDIUM_NOTES = """-On November 2 1992 (S10, #1796), R1 (VANNA'S PREGNANT) wa
 """
 _HEADER_ROW = ['PUZZLE', 'CATEGORY', 'DATE USED', 'WHEN USED']
 
+# bump whenever _process_season's output changes, so cached seasons are rebuilt instead of reused.
+WC_CACHE_VERSION = 1
+_DROPBOX_DIR = '/heroku/wayo-py/compendium'
+WORD_REGEX = r"\b[A-Z-'\.]+\b"
+
+
+def letter_count(letters: str, distinct: bool = False) -> pl.Expr:
+    """How many of the puzzle's letters (or distinct letters) are among letters, off the precomputed counts."""
+    cols = [pl.col(f'N_{l}') for l in sorted(set(letters) & set(string.ascii_uppercase))]
+    if not cols:
+        return pl.lit(0)
+    if distinct:
+        cols = [(c > 0).cast(pl.UInt8) for c in cols]
+    return pl.sum(cols)
+
+
+# text columns with a trigram index, searches on them only verify their regex on rows that have every needed trigram.
+TRIGRAM_COLUMNS = ('PUZZLE', 'CLUE/BONUS')
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _trigram_postings(df: pl.DataFrame, column: str) -> Dict[str, np.ndarray]:
+    """trigram -> sorted IDs of the rows whose column has it. Puzzles repeat, each distinct string is cut up once."""
+    by_text = df.lazy().groupby(column).agg(pl.col('ID')).with_column(pl.col(column).str.n_chars().alias('N')).collect()
+    width = by_text['N'].max() or 0
+    if width < 3:
+        return {}
+    # one slice per offset, only over the strings long enough to have a trigram there.
+    offsets = [
+        by_text.lazy().filter(pl.col('N') >= i + 3).select([pl.col(column).str.slice(i, 3).alias('TRIGRAM'), pl.col('ID')])
+        for i in range(width - 2)
+    ]
+    postings = (
+        pl.concat(pl.collect_all(offsets))
+        .lazy()
+        .explode('ID')
+        .groupby('TRIGRAM')
+        .agg(pl.col('ID').unique().sort())
+        .collect()
+    )
+    ids = postings['ID'].explode().to_numpy()
+    ends = postings['ID'].arr.lengths().cumsum().to_numpy()
+    return {t: ids[end - n : end] for t, n, end in zip(postings['TRIGRAM'], postings['ID'].arr.lengths(), ends)}
+
 
 async def dl_season(season: int, asession: AsyncHTMLSession = None):
     if not asession:
@@ -152,17 +202,23 @@ class WheelCompendium:
     _MAX_CACHE = 64
     _CACHE_GETTER = attrgetter('cache')
 
-    def __init__(self, *, loop=None, debug: bool = False):
+    def __init__(self, *, loop=None, debug: bool = False, cache_dir: str = 'wc_cache'):
         self._loop = loop
         self._debug = debug
+        self.cache_dir = cache_dir
         self.cache = LFUCache(self._MAX_CACHE)
 
         self.df = None
         self._df_dict = SortedDict()
+        self._season_offsets = {}
+        self._words = None
+        self._vocab = None
+        self._trigram_index = {}
         self.coverage = None
         self._coverage_dict = SortedDict()
 
         self._cols = ['S', 'DATE', 'EP', 'E/S', 'UNC', 'ROUND', 'PP', 'RL', 'PR', 'PUZZLE', 'CATEGORY', 'CLUE/BONUS']
+        self._manifest = self._read_manifest()
 
         load = self.load(range(1, CURRENT_SEASON + 1))
         if self._loop:
@@ -178,12 +234,167 @@ class WheelCompendium:
 
     async def load(self, seasons: Range):
         _log.info('start loading wc at ' + str(datetime.now()))
-        changed_cov = await asyncio.gather(*(self._load_season(s) for s in seasons))
-        self.df = pl.concat(pl.collect_all(self._df_dict.values())).lazy()
+        try:
+            revs = await asyncio.to_thread(self._source_revs)
+        except Exception as e:
+            # can't tell what changed, so every season is fetched fresh (and not cached).
+            _log.warning(f'could not list compendium sources: {e}')
+            revs = {}
+        changed_cov = await asyncio.gather(*(self._load_season(s, revs.get(f's{s:02d}.csv')) for s in seasons))
+        self._write_local('manifest.json', orjson.dumps(self._manifest))
+        self._materialize()
         if any(changed_cov):
             self._reset_coverage()
         _log.info('end loading wc at ' + str(datetime.now()))
 
+    def _materialize(self):
+        # one contiguous block in season order, so any run of seasons is a zero-copy slice.
+        frames = pl.collect_all(list(self._df_dict.values()))
+        # sorted by season and episode, each episode's rounds kept in the order of its sheet (RD sorts lexically).
+        # ID is then each row's position, the key the side tables below join back on.
+        df = (
+            pl.concat(frames, rechunk=True)
+            .with_row_count('ID')
+            .sort(['S', 'EP', 'ID'])
+            .drop('ID')
+            .with_row_count('ID')
+            .with_column(pl.col('S').set_sorted())
+        )
+        # letter counts and the blanked board, so letter conditions compare integers instead of scanning strings.
+        df = df.with_columns(
+            [pl.col('PUZZLE').str.count_match(l).cast(pl.UInt8).alias(f'N_{l}') for l in string.ascii_uppercase]
+            + [
+                pl.col('PUZZLE').str.count_match(WORD_REGEX).cast(pl.UInt8).alias('N_WORDS'),
+                pl.col('PUZZLE').str.replace_all('[A-Z]', '_').alias('PATTERN'),
+            ]
+        )
+        letter_cols = [pl.col(f'N_{l}') for l in string.ascii_uppercase]
+        df = df.with_columns(
+            [
+                pl.sum(letter_cols).alias('N_LETTERS'),
+                pl.sum([(c > 0).cast(pl.UInt8) for c in letter_cols]).alias('N_UNIQUE'),
+            ]
+        )
+        if df['EP'].is_sorted():
+            df = df.with_column(pl.col('EP').set_sorted())
+
+        offsets, offset = {}, 0
+        for season, f in zip(self._df_dict.keys(), frames):
+            offsets[season] = (offset, f.height)
+            offset += f.height
+
+        self._season_offsets = offsets
+        self._build_words(df)
+        self._trigram_index = {column: _trigram_postings(df, column) for column in TRIGRAM_COLUMNS}
+        self.cache.clear()
+        self.df = df
+
+    def _build_words(self, df: pl.DataFrame):
+        # every puzzle tokenized once: one row per word, with its position from both ends.
+        words = (
+            df.lazy()
+            .select([pl.col('ID'), pl.col('PUZZLE').str.extract_all(WORD_REGEX).alias('WORD')])
+            .with_column(pl.col('WORD').arr.lengths().cast(pl.Int16).alias('N'))
+            .explode('WORD')
+            .filter(pl.col('WORD').is_not_null())
+            .with_column(pl.col('ID').cumcount().over('ID').cast(pl.Int16).alias('POS'))
+            .select(
+                [
+                    pl.col('ID'),
+                    pl.col('POS'),
+                    (pl.col('POS') - pl.col('N')).alias('RPOS'),
+                    pl.col('WORD'),
+                    pl.col('WORD').str.n_chars().cast(pl.UInt8).alias('LEN'),
+                ]
+            )
+            .sort(['LEN', 'WORD'])
+            .collect()
+        )
+        self._words = words.with_column(pl.col('LEN').set_sorted())
+        # distinct words are far fewer than word occurrences, unpositioned matches only need to test these.
+        self._vocab = words.lazy().groupby('WORD', maintain_order=True).agg(pl.col('ID').unique()).collect()
+
+    @cachedmethod(_CACHE_GETTER, key=partial(hashkey, 'text_match'))
+    def text_match(self, column: str, pattern: str, literal: bool = False) -> pl.Expr:
+        """Expression for column containing pattern (a regex unless literal).
+
+        On an indexed column, only rows with every trigram of the literals pattern needs are checked, and the expression is
+        just membership in the rows that matched. A pattern with no literal of three or more characters is a plain scan."""
+        match = pl.col(column).str.contains(pattern, literal=literal)
+        if column not in self._trigram_index:
+            return match
+
+        if literal:
+            literals = [pattern]
+        else:
+            literals = required_literals(pattern)
+        trigrams = set().union(*(_trigrams(l) for l in literals))
+        if not trigrams:
+            return match
+
+        postings = self._trigram_index[column]
+        rows = None
+        for t in sorted(trigrams, key=lambda t: len(postings.get(t, ()))):
+            hits = postings.get(t)
+            if hits is None:
+                rows = np.zeros(0, dtype=np.uint32)
+                break
+            rows = hits if rows is None else np.intersect1d(rows, hits, assume_unique=True)
+
+        ids = pl.Series('ID', rows, dtype=pl.UInt32)
+        matched = self.df.select(pl.col(['ID', column]).take(ids)).filter(match)['ID']
+        return pl.col('ID').is_in(matched)
+
+    @property
+    def columns(self) -> List[str]:
+        return self._renamed_cols
+
+    @cachedmethod(_CACHE_GETTER, key=partial(hashkey, 'word_rows'))
+    def word_rows(self, pattern: str, how: str = 'regex', idx: Optional[int] = None) -> pl.Series:
+        """IDs of the puzzles with a word (the idx-th word from 0, or from -1 backwards, if given) matching pattern.
+
+        how is one of regex, literal (word contains pattern) or exact."""
+        match how:
+            case 'regex':
+                f = pl.col('WORD').str.contains(pattern)
+            case 'literal':
+                f = pl.col('WORD').str.contains(pattern, literal=True)
+            case 'exact':
+                f = pl.col('WORD') == pattern
+            case _:
+                raise ValueError(f'Unknown word match: {how}')
+
+        if idx is None:
+            q = self._vocab.lazy().filter(f).select(pl.col('ID').explode())
+        else:
+            q = self._words.lazy().filter((pl.col('POS' if idx >= 0 else 'RPOS') == idx) & f).select(pl.col('ID'))
+        return q.unique().collect().to_series()
+
+    def season_slice(self, seasons: Optional[Iterable[int]] = None) -> pl.DataFrame:
+        """The rows of the given seasons (all if None), contiguous runs of seasons are views into self.df."""
+        if seasons is None:
+            return self.df
+
+        runs = []
+        for season in sorted(set(seasons) & self._season_offsets.keys()):
+            offset, length = self._season_offsets[season]
+            if runs and runs[-1][0] + runs[-1][1] == offset:
+                runs[-1][1] += length
+            else:
+                runs.append([offset, length])
+
+        if not runs:
+            return self.df.clear()
+        elif len(runs) == 1:
+            return self.df.slice(*runs[0])
+        else:
+            return pl.concat([self.df.slice(*r) for r in runs], rechunk=False)
+
+    def puzzle_count(self, seasons: Optional[Iterable[int]] = None) -> int:
+        if seasons is None:
+            return self.df.height
+        return sum(self._season_offsets[s][1] for s in set(seasons) if s in self._season_offsets)
+
     def _reset_coverage(self):
         self.coverage = pl.from_dict({'S': self._coverage_dict.keys(), 'COV': self._coverage_dict.values()})
         self.coverage = self.coverage.with_column(
@@ -226,23 +437,94 @@ class WheelCompendium:
 
         return c_df.with_column((100.0 * pl.col('COV') / pl.col('MAX')).round(1).alias('PCT'))
 
-    async def _load_season(self, season: int) -> bool:
+    def _cache_path(self, fn):
+        return os.path.join(self.cache_dir, fn)
+
+    def _read_manifest(self):
         try:
-            if self._debug:
-                async with aiofile.async_open(
-                    os.path.expanduser(f'~/Dropbox/heroku/wayo-py/compendium/s{season:02d}.csv')
-                ) as afp:
-                    file = await afp.read()
-            else:
-                file = await asyncio.to_thread(dropboxwayo.download, f'/heroku/wayo-py/compendium/s{season:02d}.csv')
+            with open(self._cache_path('manifest.json'), 'rb') as f:
+                manifest = orjson.loads(f.read())
+            if manifest['version'] == WC_CACHE_VERSION:
+                return manifest
+            _log.info(f"wc cache version {manifest['version']}, expected {WC_CACHE_VERSION}, rebuilding")
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        return {'version': WC_CACHE_VERSION, 'seasons': {}}
+
+    def _write_local(self, fn, data: bytes):
+        # write to the side and swap in, so frames still memory-mapped from the old file are left intact.
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self._cache_path(fn + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._cache_path(fn))
+
+    def _source_revs(self) -> Dict[str, str]:
+        """The current revision of every season CSV, one listing call instead of a download per season."""
+        if self._debug:
+            d = os.path.expanduser(f'~/Dropbox{_DROPBOX_DIR}')
+            return {e.name: f'{e.stat().st_mtime_ns}-{e.stat().st_size}' for e in os.scandir(d) if e.is_file()}
+        return dropboxwayo.content_hashes(_DROPBOX_DIR)
+
+    def _read_cached(self, season: int) -> Optional[pl.DataFrame]:
+        try:
+            df = pl.read_ipc(self._cache_path(f's{season:02d}.ipc'), memory_map=True)
         except Exception as e:
-            # _log.warning(e)
-            location = 'locally' if self._debug else 'from Dropbox'
-            _log.warning(f'Could not download S{season:02d} {location}')
-            return
+            _log.warning(f'could not read cached S{season:02d}: {e}')
+            return None
+        if df.columns != self._renamed_cols:
+            return None
+        # lexical ordering isn't kept in the IPC file.
+        return df.with_columns([pl.col(c).cat.set_ordering('lexical') for c in ('RD', 'CATEGORY')])
+
+    def _write_cached(self, season: int, df: pl.DataFrame):
+        with BytesIO() as b:
+            # IPC files can only be memory-mapped uncompressed.
+            df.write_ipc(b, compression='uncompressed')
+            self._write_local(f's{season:02d}.ipc', b.getvalue())
+
+    @property
+    def _renamed_cols(self):
+        return [{'ROUND': 'RD', 'UNC': 'UC'}.get(c, c) for c in self._cols]
+
+    async def _load_season(self, season: int, rev: Optional[str] = None) -> bool:
+        entry = self._manifest['seasons'].get(str(season))
+        if rev and entry and entry['rev'] == rev and (df := self._read_cached(season)) is not None:
+            cov = entry['cov']
+        else:
+            try:
+                if self._debug:
+                    async with aiofile.async_open(
+                        os.path.expanduser(f'~/Dropbox{_DROPBOX_DIR}/s{season:02d}.csv')
+                    ) as afp:
+                        file = await afp.read()
+                else:
+                    file = await asyncio.to_thread(dropboxwayo.download, f'{_DROPBOX_DIR}/s{season:02d}.csv')
+            except Exception as e:
+                # _log.warning(e)
+                location = 'locally' if self._debug else 'from Dropbox'
+                if entry and (df := self._read_cached(season)) is not None:
+                    _log.warning(f'Could not download S{season:02d} {location}, using cached copy')
+                    cov = entry['cov']
+                else:
+                    _log.warning(f'Could not download S{season:02d} {location}')
+                    return
+            else:
+                df, cov = self._process_season(season, file.encode() if self._debug else file)
+                if rev:
+                    await asyncio.to_thread(self._write_cached, season, df)
+                    self._manifest['seasons'][str(season)] = {'rev': rev, 'cov': cov}
+
+        old_cov = self._coverage_dict.get(season, 0)
+        new_cov = self._coverage_dict[season] = cov
+        self._df_dict[season] = df.lazy()
+
+        return old_cov != new_cov
 
+    def _process_season(self, season: int, file: bytes) -> Tuple[pl.DataFrame, int]:
+        """Parses and checks one season's CSV, returning the typed frame and its coverage."""
         df = pl.read_csv(
-            file.encode() if self._debug else file,
+            file,
             # to do complicated groupbys, 64 byte preferred..
             dtypes={'EP': pl.UInt64, 'ROUND': pl.Categorical},
         )
@@ -254,9 +536,10 @@ class WheelCompendium:
             _log.warning(
                 f'dates / ep mismatch for S{season}: {len(unique_dates)} unique dates, {len(unique_eps)} unique eps'
             )
+        # ISO weekday, Saturday = 6
         unique_dates = unique_dates.select((pl.all(), pl.col('DATE').dt.weekday().alias('WD')))
-        if unique_dates.select(pl.col('WD').unique()).to_series().max() >= 5:
-            weekend_dates = unique_dates.filter(pl.col('WD') >= 5)
+        if unique_dates.select(pl.col('WD').unique()).to_series().max() >= 6:
+            weekend_dates = unique_dates.filter(pl.col('WD') >= 6)
             if weekend_dates[0, 0] != date(2016, 11, 12):
                 raise ValueError(
                     f'In the compendium, season {season} has invalid (weekend) dates: '
@@ -266,9 +549,6 @@ class WheelCompendium:
             raise ValueError(f'In the compendium, season {season} has too many dates ({len(unique_dates)})')
 
         # passed checks.
-        old_cov = self._coverage_dict.get(season, 0)
-        new_cov = self._coverage_dict[season] = len(unique_dates)  # len(df.select(pl.col('EP').unique()))
-
         c_exprs = [
             pl.lit(season).alias('S').cast(pl.UInt8),
             # to do complicated groupbys, must be at least 32 byte int.
@@ -321,12 +601,8 @@ class WheelCompendium:
                 ]
             )
 
-        # keep lazy.
-        self._df_dict[season] = (
-            df.lazy().with_columns(c_exprs).select(pl.col(self._cols)).rename({'ROUND': 'RD', 'UNC': 'UC'})
-        )
-
-        return old_cov != new_cov
+        df = df.lazy().with_columns(c_exprs).select(pl.col(self._cols)).rename({'ROUND': 'RD', 'UNC': 'UC'}).collect()
+        return df, len(unique_dates)  # len(df.select(pl.col('EP').unique()))
 
     def __str__(self):
-        return str(self.df)
+        return str(self.df.select(self.columns))
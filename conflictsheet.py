@@ -1,27 +1,33 @@
 import bisect
 import enum
+import hashlib
 import io
-import itertools
+import logging
 import operator
-import pickle
+import os
 import re
-import string
-from collections import OrderedDict
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import zipfile
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from copy import copy
+from datetime import date, datetime, timedelta
 from random import choice, choices, random, sample, shuffle
-from operator import attrgetter
-from functools import partial, reduce
+from functools import partial, reduce, wraps
+from itertools import combinations
 from typing import *
+from xml.etree import ElementTree as ET
 
 import numpy as np
 import openpyxl
-import pandas as pd
+import orjson
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import MAC_EPOCH, WINDOWS_EPOCH, from_excel
 import portion as P
 import polars as pl
 import texttable
-from cachetools import LFUCache, cachedmethod
-from cachetools.keys import hashkey
+from cachetools import LFUCache
 from cachetools.func import lfu_cache
 
 Portion = NewType('Portion', P.Interval)
@@ -35,10 +41,10 @@ SECOND_HALF = frozenset({4, 5, 6})
 ANY_FLAG = frozenset()
 ANY_FREQ = frozenset()
 
-from util import PLAYING_FLAGS, SORT_PROD, build_flag_expr as has_any_flags
+from util import PLAYING_FLAGS, SORT_PROD, build_flag_expr as has_any_flags, required_literals
 
 
-_pf_bit_mapping = {pf: len(PLAYING_FLAGS) - 1 - PLAYING_FLAGS.index(pf) for pf in ('^', '?', 'MDG')}
+_pf_bit_mapping = {pf: len(PLAYING_FLAGS) - 1 - PLAYING_FLAGS.index(pf) for pf in ('^', '?', 'MDG', 'car')}
 
 
 def _pf_bit(pf):
@@ -76,52 +82,1033 @@ class SlotCertainty(enum.IntFlag):
 
 UNAIRED_DUPLICATES = ['0013R', '58XXD']
 
+_log = logging.getLogger('wayo_log')
 
-def _dt_convert(dt):
+# bump whenever the layout of the built frames changes, so stale snapshots are rejected instead of half-loaded.
+SNAPSHOT_VERSION = 1
+SNAPSHOT_TIMES = ('daytime', 'primetime', 'syndicated', 'unaired')
+
+
+class SnapshotMismatch(ValueError):
+    pass
+
+
+# the workbook is read straight out of its XML: style tables once, then one streaming pass per sheet for values and styles.
+_XLSX_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_XLSX_REL_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+_CELL_REF = re.compile(r'([A-Z]+)(\d+)')
+
+# sheet name -> columns read (header row gives their names)
+_SHEET_COLUMNS = {'Calendar': 'ABDEFGHIJKL', 'Primetime': 'ABCDEFGHIJ', 'Syndication': 'ABCDE'}
+_CALENDAR_EXTRA = tuple(f'N{i}' for i in range(2, 10)) + tuple(f'AA{i}' for i in range(2, 9))
+
+
+class _XlsxStyles(NamedTuple):
+    # all indexed by cellXfs position. font_rgb is None for no color, '' for a theme/indexed/auto color.
+    fill_rgb: List[Optional[str]]
+    font_rgb: List[Optional[str]]
+    is_date: List[bool]
+
+
+def _xlsx_workbook(zf: zipfile.ZipFile):
+    rels = {rel.get('Id'): rel.get('Target') for rel in ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))}
+    workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+    paths = {}
+    for sheet in workbook.iter(f'{_XLSX_NS}sheet'):
+        target = rels[sheet.get(_XLSX_REL_ID)]
+        paths[sheet.get('name')] = target[1:] if target.startswith('/') else 'xl/' + target
+    pr = workbook.find(f'{_XLSX_NS}workbookPr')
+    epoch = MAC_EPOCH if pr is not None and pr.get('date1904') in ('1', 'true') else WINDOWS_EPOCH
+    return paths, epoch
+
+
+def _xlsx_member_key(zf: zipfile.ZipFile, *names):
+    # CRC and size straight from the zip directory, a member whose bytes are unchanged keeps its key without being read.
+    return tuple((info.CRC, info.file_size) if (info := zf.NameToInfo.get(n)) else None for n in names)
+
+
+def _workbook_hash(fp: io.BytesIO):
+    with fp.getbuffer() as b:
+        return hashlib.sha1(b).hexdigest()
+
+
+def _xlsx_shared_strings(zf: zipfile.ZipFile):
     try:
-        return pd.to_datetime(dt, format='%m/%d/%Y')
-    except ValueError:
-        return np.nan
+        sst = ET.fromstring(zf.read('xl/sharedStrings.xml'))
+    except KeyError:
+        return []
+    # rich text is a run of <r><t>, phonetic <rPh> runs are left out like openpyxl does
+    return [
+        t.text or '' if (t := si.find(f'{_XLSX_NS}t')) is not None else ''.join(r.text or '' for r in si.iterfind(f'{_XLSX_NS}r/{_XLSX_NS}t'))
+        for si in sst
+    ]
+
+
+def _xlsx_rgb(color):
+    # same values openpyxl's Color.rgb gives: theme/indexed/auto colors never match a real aRGB string.
+    rgb = color.get('rgb')
+    if not rgb:
+        return None
+    return '00' + rgb if len(rgb) == 6 else rgb
+
+
+def _xlsx_styles(zf: zipfile.ZipFile):
+    styles = ET.fromstring(zf.read('xl/styles.xml'))
+
+    fills = []
+    for fill in styles.find(f'{_XLSX_NS}fills'):
+        pattern = fill.find(f'{_XLSX_NS}patternFill')
+        fg = pattern.find(f'{_XLSX_NS}fgColor') if pattern is not None else None
+        fills.append(None if pattern is None else _xlsx_rgb(fg) if fg is not None else '00000000')
+
+    fonts = []
+    for font in styles.find(f'{_XLSX_NS}fonts'):
+        color = font.find(f'{_XLSX_NS}color')
+        fonts.append(None if color is None else _xlsx_rgb(color) or '')
+
+    num_fmts = dict(BUILTIN_FORMATS)
+    if (custom := styles.find(f'{_XLSX_NS}numFmts')) is not None:
+        num_fmts.update({int(nf.get('numFmtId')): nf.get('formatCode') for nf in custom})
+
+    xfs = list(styles.find(f'{_XLSX_NS}cellXfs')) or [ET.Element('xf')]
+    return _XlsxStyles(
+        [fills[int(xf.get('fillId', 0))] for xf in xfs],
+        [fonts[int(xf.get('fontId', 0))] for xf in xfs],
+        [is_date_format(num_fmts.get(int(xf.get('numFmtId', 0)), 'General')) for xf in xfs],
+    )
+
+
+def _xlsx_style_bits(styles: _XlsxStyles, ec: Dict[str, int]):
+    """uint16 array of shape (len(cellXfs), 2): the flag bits each cell style's fill and font color stand for."""
+    return np.array(
+        [
+            [
+                2 ** ec[fill] if fill in ec else 0,
+                0 if font is None or font == 'FF000000' else 2 ** ec[font] if font in ec else 2 ** _pf_bit('MDG'),
+            ]
+            for fill, font in zip(styles.fill_rgb, styles.font_rgb)
+        ],
+        dtype=np.uint16,
+    )
+
+
+def _xlsx_value(el, shared_strings, styles, epoch):
+    t = el.get('t', 'n')
+    if t == 'inlineStr':
+        return ''.join(x.text or '' for x in el.iter(f'{_XLSX_NS}t'))
+    v = el.find(f'{_XLSX_NS}v')
+    if v is None or v.text is None or t == 'e':
+        return None
+    match t:
+        case 's':
+            return shared_strings[int(v.text)]
+        case 'str':
+            return v.text
+        case 'b':
+            return v.text == '1'
+        case 'd':
+            return datetime.fromisoformat(v.text)
+    n = float(v.text)
+    if styles.is_date[int(el.get('s', 0))]:
+        return from_excel(n, epoch)
+    return int(n) if n.is_integer() else n
+
+
+def _xlsx_read_sheet(zf: zipfile.ZipFile, path, columns, shared_strings, styles, epoch, extra=()):
+    """Streams one sheet once.
+
+    Returns the header names of the wanted columns, their values for every data row (blank rows and the footer row
+    dropped, like pandas' read_excel(skipfooter=1)), the cellXfs index of each of those cells, and (value, cellXfs index)
+    of any extra cells asked for by reference."""
+    col_of = {c: j for j, c in enumerate(columns)}
+    extra = set(extra)
+    rows, found = {}, {}
+
+    with zf.open(path) as f:
+        for _, el in ET.iterparse(f):
+            if el.tag == f'{_XLSX_NS}row':
+                el.clear()
+            if el.tag != f'{_XLSX_NS}c':
+                continue
+            ref = el.get('r')
+            col, row = _CELL_REF.match(ref).groups()
+            j = col_of.get(col)
+            if j is not None or ref in extra:
+                v = _xlsx_value(el, shared_strings, styles, epoch)
+                xf = int(el.get('s', 0))
+                if j is not None:
+                    if (r := int(row)) not in rows:
+                        rows[r] = ([None] * len(columns), [0] * len(columns))
+                    rows[r][0][j] = None if v == '' else v
+                    rows[r][1][j] = xf
+                if ref in extra:
+                    found[ref] = v, xf
+            el.clear()
+
+    header = rows.pop(1, ([None] * len(columns),))[0]
+    body = [rows[r] for r in sorted(rows) if any(v is not None for v in rows[r][0])][:-1]
+    return (
+        header,
+        [values for values, _ in body],
+        np.array([xf for _, xf in body], dtype=np.intp).reshape(len(body), len(columns)),
+        found,
+    )
+
+
+def _xlsx_date(v):
+    if isinstance(v, datetime):
+        return v.date()
+    if isinstance(v, str):
+        try:
+            return datetime.strptime(v, '%m/%d/%Y').date()
+        except ValueError:
+            return None
+    return None
+
+
+# stable ordinal of every PG, the axis of the dense indexes below. len(PG) stands for no playing.
+_PG_ORDINAL = {str(pg): i for i, pg in enumerate(PG)}
+_PG_BY_ORDINAL = np.array([str(pg) for pg in PG] + [None], dtype=object)
+
+
+def _pg_ordinals(df: pl.DataFrame):
+    """(row, slot) int array of the PG ordinals in df's PGi_p columns, len(PG) where there is no playing."""
+    ords = df.select(pl.col('^PG\d_p$').cast(pl.Utf8).map_dict(_PG_ORDINAL, default=len(PG)))
+    return ords.to_numpy().reshape(ords.shape)
+
+
+def _pg_pair_counts(ords: np.ndarray):
+    """PG x PG matrix of how many rows have both PGs (the diagonal is how many rows have that PG)."""
+    # float so the product goes through BLAS, the counts are exact far past any real row count
+    incidence = np.zeros((len(ords), len(PG) + 1), dtype=np.float64)
+    incidence[np.arange(len(ords))[:, None], ords] = 1
+    incidence = incidence[:, :-1]
+    return (incidence.T @ incidence).astype(np.int64)
+
+
+# 64-bit words per slot in a lineup bitset, one bit per PG ordinal (no playing included)
+_SLOT_WORDS = len(PG) // 64 + 1
+# bit 16 of a flag word marks an unflagged playing
+_UNFLAGGED = 1 << 16
+
+
+def _pg_bitmask(ordinals: Iterable[int]):
+    mask = np.zeros(_SLOT_WORDS, dtype=np.uint64)
+    for o in ordinals:
+        mask[o // 64] |= np.uint64(1) << np.uint64(o % 64)
+    return mask
+
+
+def _lineup_bitsets(ords: np.ndarray, flags: np.ndarray):
+    """(slot, word, row) one-hot bits of every row's PG ordinals, and (slot, row) flag words.
+
+    Rows are the last axis so a condition only touches the words its mask has bits in, each a contiguous vector."""
+    n, n_slots = ords.shape
+    pg_bits = np.zeros((n_slots, _SLOT_WORDS, n), dtype=np.uint64)
+    for s in range(n_slots):
+        pg_bits[s, ords[:, s] // 64, np.arange(n)] = np.left_shift(np.uint64(1), (ords[:, s] % 64).astype(np.uint64))
+    flag_words = flags.T.astype(np.uint32) | np.where(flags.T == 0, _UNFLAGGED, 0).astype(np.uint32)
+    return pg_bits, flag_words
+
+
+def _lineup_condition(bitsets, pgs: Iterable[PG], slots: Iterable[int], flags: Iterable[int], freqs: Iterable[int]):
+    """Row mask of one search condition, the bitset counterpart of its polars expression."""
+    pg_bits, flag_words = bitsets
+    n_slots, _, n = pg_bits.shape
+    mask = _pg_bitmask(_PG_ORDINAL[str(pg)] for pg in pgs)
+    flag_mask = flags and reduce(operator.or_, flags) | (_UNFLAGGED if 0 in flags else 0)
+
+    # a slot holds one PG, so its matching words are at most one: the count is of matching slots
+    count = np.zeros(n, dtype=np.uint8)
+    for s in (s - 1 for s in slots if s <= n_slots):
+        hit = reduce(operator.or_, ((pg_bits[s, w] & mask[w]) != 0 for w in np.flatnonzero(mask)), np.zeros(n, dtype=bool))
+        if flag_mask:
+            hit &= (flag_words[s] & flag_mask) != 0
+        count += hit
+
+    return np.isin(count, list(freqs)) if freqs else count > 0
+
+
+# a parsed search logic expression: the index of a condition, or (operator, operands)
+LogicNode = Union[int, Tuple[str, tuple]]
+_LOGIC_OPS = {'&': operator.and_, '^': operator.xor, '|': operator.or_}
+
+
+@lfu_cache(maxsize=256)
+def _parse_logic(logic: str, n: int) -> LogicNode:
+    """logic ('all', 'any' or logic_expression's text over condition letters A, B, ...) as a tree over n conditions.
+
+    Operators bind like they do in Python, which is how these expressions used to be evaluated."""
+    if logic in ('all', 'any'):
+        return ('&' if logic == 'all' else '|', tuple(range(n)))
+    tokens = re.findall(r'\S', logic)
+    if not all(re.fullmatch(r'[A-Z~&^|()]', t) for t in tokens):
+        raise ValueError(f'bad logic expression: {logic}')
+    pos = 0
+
+    def binary(ops):
+        nonlocal pos
+        if not ops:
+            return unary()
+        operands = [binary(ops[1:])]
+        while pos < len(tokens) and tokens[pos] == ops[0]:
+            pos += 1
+            operands.append(binary(ops[1:]))
+        return operands[0] if len(operands) == 1 else (ops[0], tuple(operands))
+
+    def unary():
+        nonlocal pos
+        if pos == len(tokens):
+            raise ValueError(f'bad logic expression: {logic}')
+        t = tokens[pos]
+        pos += 1
+        if t == '~':
+            return '~', (unary(),)
+        elif t == '(':
+            node = binary('|^&')
+            if pos == len(tokens) or tokens[pos] != ')':
+                raise ValueError(f'bad logic expression: {logic}')
+            pos += 1
+            return node
+        elif t.isalpha() and ord(t) - ord('A') < n:
+            return ord(t) - ord('A')
+        raise ValueError(f'bad logic expression: {logic}')
+
+    node = binary('|^&')
+    if pos != len(tokens):
+        raise ValueError(f'bad logic expression: {logic}')
+    return node
+
+
+def _evaluate_logic(node: LogicNode, terms: Sequence):
+    """node over terms that take &, ^, | and ~: row masks or polars expressions alike."""
+    if isinstance(node, int):
+        return terms[node]
+    op, operands = node
+    if op == '~':
+        return ~_evaluate_logic(operands[0], terms)
+    return reduce(_LOGIC_OPS[op], (_evaluate_logic(o, terms) for o in operands))
+
+
+@lfu_cache(maxsize=256)
+def _search_expr(logic: str, psff_quads) -> pl.Expr:
+    """The polars filter of a search, built once per canonical search."""
+    exprs = []
+    for pgs, slots, flags, freqs in psff_quads:
+        e = [pl.col(f'PG{s}_p').is_in([str(pg) for pg in pgs]) for s in slots]
+
+        if flags:
+            e = [ee & has_any_flags(f'PG{s}_f', frozenset(flags)) for ee, s in zip(e, slots)]
+
+        if freqs:
+            exprs.append(sum([ee.cast(pl.UInt8) for ee in e]).is_in(tuple(freqs)))
+        else:
+            exprs.append(pl.any(e))
+
+    return _evaluate_logic(_parse_logic(logic, len(exprs)), exprs)
+
+
+# the notes column of each time that has one
+_NOTES_COLUMNS = {'daytime': 'NOTES', 'primetime': 'SPECIAL', 'unaired': 'NOTES'}
+# a token of the notes index: a run of letters and digits
+_TOKEN = r'[^\W_]+'
+
+
+def _notes_match(column: str, regex: str) -> pl.Expr:
+    # uppercased on both sides, how the search command has always done case-insensitive
+    return pl.col(column).cast(pl.Utf8).str.to_uppercase().str.contains(regex.upper())
+
+
+@lfu_cache(maxsize=4096)
+def _note_tokens(note: str) -> frozenset[str]:
+    return frozenset(re.findall(_TOKEN, note.upper()))
+
+
+def _notes_postings(df: pl.DataFrame, column: str) -> dict[str, np.ndarray]:
+    """token -> sorted PG_n of the rows whose uppercased notes have it. Notes repeat a lot, each distinct one is tokenized once."""
+    by_note = df.lazy().filter(pl.col(column).is_not_null()).groupby(pl.col(column).cast(pl.Utf8)).agg(pl.col('PG_n')).collect()
+    postings = defaultdict(list)
+    for note, rows in by_note.iter_rows():
+        for token in _note_tokens(note):
+            postings[token].append(rows)
+    return {token: np.sort(np.concatenate(rows)) for token, rows in postings.items()}
+
+
+def _token_trigrams(tokens: Iterable[str]) -> dict[str, frozenset[str]]:
+    trigrams = defaultdict(set)
+    for token in tokens:
+        for i in range(len(token) - 2):
+            trigrams[token[i : i + 3]].add(token)
+    return {t: frozenset(ts) for t, ts in trigrams.items()}
+
+
+class _NotesIndex(NamedTuple):
+    """A notes column and what notes_sub looks its regexes up in."""
+
+    notes: pl.Series
+    # _notes_postings of the column
+    postings: dict
+    # trigram -> the tokens that have it. A token no note has any more stays in until the index is built again.
+    trigrams: dict
+
+
+def _build_notes_index(df: pl.DataFrame, column: str) -> _NotesIndex:
+    postings = _notes_postings(df, column)
+    return _NotesIndex(df.get_column(column).cast(pl.Utf8), postings, _token_trigrams(postings))
+
+
+def _edit_notes_index(
+    index: _NotesIndex, notes: pl.Series, pg_n: int, old: Optional[str], new: Optional[str], renumbered: bool
+) -> _NotesIndex:
+    """index brought up to date with notes, the column after row pg_n's note went from old to new. Only that row's tokens
+    are touched, unless the row was inserted before others (renumbered) and every PG_n after it moves down one."""
+    postings = {token: p + (p >= pg_n) for token, p in index.postings.items()} if renumbered else dict(index.postings)
+    old_tokens = _note_tokens(old) if old else frozenset()
+    new_tokens = _note_tokens(new) if new else frozenset()
+    for token in old_tokens - new_tokens:
+        p = postings[token]
+        p = p[p != pg_n]
+        if len(p):
+            postings[token] = p
+        else:
+            del postings[token]
+
+    trigrams = index.trigrams
+    for token in new_tokens - old_tokens:
+        p = postings.get(token, np.zeros(0, dtype=np.uint32))
+        postings[token] = np.insert(p, np.searchsorted(p, pg_n), pg_n)
+        for i in range(len(token) - 2):
+            t = token[i : i + 3]
+            if token not in trigrams.get(t, ()):
+                # copied on first change, queries of the old state may be reading it
+                trigrams = dict(trigrams) if trigrams is index.trigrams else trigrams
+                trigrams[t] = trigrams.get(t, frozenset()) | {token}
+    return _NotesIndex(notes, postings, trigrams)
+
+
+def _long_playings(df: pl.DataFrame, ords: np.ndarray, flags: np.ndarray):
+    """One row per playing of df (PROD, PG_n, S, AIRDATE, slot, PG, flag), sorted by PG then PG_n.
+
+    Also the start of each PG ordinal's rows, its playings are rows starts[o]:starts[o + 1]."""
+    rows, slots = np.nonzero(ords < len(PG))
+    pg_ords = ords[rows, slots]
+    order = np.lexsort((rows, pg_ords))
+    rows, slots, pg_ords = rows[order], slots[order], pg_ords[order]
+    starts = np.zeros(len(PG) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pg_ords, minlength=len(PG)), out=starts[1:])
+    long = df.select(
+        [pl.col('^(PROD|PG_n|S|AIRDATE)$').take(pl.Series(rows, dtype=pl.UInt32))]
+    ).with_columns(
+        [
+            pl.Series('slot', slots + 1, dtype=pl.UInt8),
+            pl.Series('PG', _PG_BY_ORDINAL[pg_ords].tolist(), dtype=pl.Utf8).cast(pl.Categorical),
+            pl.Series('flag', flags[rows, slots], dtype=pl.UInt16),
+        ]
+    )
+    return long, starts
+
+
+def _pg_n_dtype(height: int):
+    # real sheets stay well under UInt16, only scaled-up synthetic frames need more
+    return pl.UInt16 if height < 2**16 else pl.UInt32
+
+
+def _pg_n(height: int):
+    return pl.arange(1, height + 1).cast(_pg_n_dtype(height)).alias('PG_n')
+
+
+def _pg_names(pg_str, flag):
+    pgp = PGPlaying(pg_str, flag)
+    return str(pgp), str(pgp.pg)
+
+
+def _day(v):
+    return v if v in (P.inf, -P.inf) else datetime.combine(v if type(v) is date else v.date(), datetime.min.time())
+
+
+def _is_season(endpoints: Portion) -> bool:
+    # told by whichever bound is finite, a range can be open-ended on either side
+    return type(endpoints.lower) is int or type(endpoints.upper) is int
+
+
+def _canonical_endpoints(endpoints: Portion, time: str):
+    """endpoints as closed runs of whole seasons or days, merged where they touch, so equal selections key equal.
+
+    None stands for everything, as does any season range for primetime."""
+    if not endpoints or (time == 'primetime' and _is_season(endpoints)):
+        return None
+    is_season = _is_season(endpoints)
+    step = 1 if is_season else timedelta(days=1)
+
+    runs = []
+    for atomic in endpoints:
+        lower, upper = (atomic.lower, atomic.upper) if is_season else (_day(atomic.lower), _day(atomic.upper))
+        if atomic.left == P.OPEN and lower != -P.inf:
+            lower += step
+        if atomic.right == P.OPEN and upper != P.inf:
+            upper -= step
+        if lower > upper:
+            continue
+        if runs and lower - step <= runs[-1][1]:
+            runs[-1][1] = max(runs[-1][1], upper)
+        else:
+            runs.append([lower, upper])
+
+    # an empty selection must not turn into None, that would be everything
+    return reduce(operator.or_, (P.closed(*r) for r in runs)) if runs else endpoints
+
+
+def _canonical_set(values):
+    return frozenset(values) if values else frozenset()
+
+
+def _set_sort_key(values):
+    return tuple(sorted(map(str, values)))
+
 
+def _canonical_conditions(logic: str, psff_quads):
+    """Every part of a condition as a frozenset. Under all/any the order of conditions is irrelevant, so sort them too.
 
-def _pg_convert(pg_str):
-    if not pg_str:
-        return PGPlaying(str(PG._UNKNOWN), 1)
-    if pg_str == '-':
-        return np.nan
-    else:
-        if unc := pg_str.startswith('*') and pg_str.endswith('*'):
-            pg_str = pg_str[1:-1]
-        return PGPlaying(pg_str, 2 ** _pf_bit('?') if unc else 0)
+    Custom logic refers to conditions by position, their order is kept."""
+    quads = tuple(tuple(_canonical_set(part) for part in psff) for psff in psff_quads)
+    if logic in ('all', 'any'):
+        quads = tuple(sorted(set(quads), key=lambda quad: tuple(map(_set_sort_key, quad))))
+    return quads
 
 
-conv_dict = {'INT. DATE': _dt_convert, 'AIRDATE': _dt_convert}
-conv_dict.update({f'PG{i}': _pg_convert for i in range(1, 7)})
+class QueryCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class _QueryKey(NamedTuple):
+    # query family, 'result' for materialized ones
+    prefix: str
+    # the canonical arguments, for materialized results (generation, key)
+    args: tuple
+
+
+class _EndpointArgs(NamedTuple):
+    endpoints: Portion
+    time: str
+
+
+class _LineupArgs(NamedTuple):
+    endpoints: Portion
+    time: str
+    logic: str
+    conditions: tuple
+    engine: str
+
+
+class _ConcurrenceArgs(NamedTuple):
+    endpoints: Portion
+    time: str
+    pgQueries: tuple
+    pgFlags: tuple
+
+
+class _LastPlayingsArgs(NamedTuple):
+    endpoints: Portion
+    time: str
+    pgs: frozenset
+    nth: int
+    flags: Optional[frozenset]
+    cutoff: Optional[int]
+
+
+class _SlotTableArgs(NamedTuple):
+    time: str
+    by: Optional[str]
+
+
+def _cached_query(prefix: str, canonical: Callable):
+    """cachedmethod on the sheet's LFU, keyed on _QueryKey(prefix, canonical(self, *args, **kwargs)).
+
+    The collected frame is what gets cached, callers get a lazy view of it, so a hit runs no plan again.
+    A frame bigger than the whole budget is returned without being cached."""
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            args = canonical(self, *args, **kwargs)
+            key = _QueryKey(prefix, args)
+            with self.pinned():
+                df = self._cache_get(prefix, key)
+                if df is None:
+                    df = method(self, *args).collect()
+                    self._cache_put(key, df)
+            return df.lazy()
+
+        return wrapper
+
+    return decorator
+
+
+def _endpoint_args(self, endpoints: Portion, time: str):
+    return _EndpointArgs(_canonical_endpoints(endpoints, time), time)
+
+
+def _lineup_args(self, endpoints: Portion, time: str, logic: str, psff_quads, engine: Optional[str] = None):
+    return _LineupArgs(
+        _canonical_endpoints(endpoints, time), time, logic, _canonical_conditions(logic, psff_quads), engine or self.lineup_engine
+    )
+
+
+def _concurrence_args(self, endpoints: Portion, time: str, pgQueries: Tuple[PG], pgFlags: tuple[Optional[frozenset[int]]]):
+    # every PG is a separate filter, so their order does not matter
+    pairs = sorted(zip(pgQueries, (frozenset(f) if f else None for f in pgFlags)), key=lambda p: (str(p[0]), _set_sort_key(p[1] or ())))
+    return _ConcurrenceArgs(_canonical_endpoints(endpoints, time), time, tuple(p[0] for p in pairs), tuple(p[1] for p in pairs))
+
+
+def _last_playings_args(
+    self, endpoints: Portion, time: str, pgs: Iterable[PG], nth: int, flags: Optional[frozenset[int]] = None, cutoff: Optional[int] = None
+):
+    return _LastPlayingsArgs(
+        _canonical_endpoints(endpoints, time), time, frozenset(str(pg) for pg in pgs), nth, _canonical_set(flags), cutoff
+    )
+
+
+def _slot_table_args(self, time: str, by: Optional[str] = None):
+    return _SlotTableArgs(time, by)
+
+
+def _slot_count_frame(counts: np.ndarray, flags: np.ndarray):
+    """slot_table's frame out of a (PG ordinal, flag, slot) count array, one row per (PG, flag) with any count."""
+    # the last PG ordinal is the empty slots, not a playing
+    pg_idx, flag_idx = np.nonzero(counts[:-1].any(axis=2))
+    return (
+        pl.DataFrame(
+            [pl.Series('PG', _PG_BY_ORDINAL[pg_idx].tolist(), dtype=pl.Utf8), pl.Series('flag', flags[flag_idx], dtype=pl.UInt16)]
+            + [pl.Series(f'PG{i}', counts[pg_idx, flag_idx, i - 1], dtype=pl.UInt32) for i in range(1, counts.shape[2] + 1)]
+        )
+        .lazy()
+        .with_column(pl.col('PG').cast(pl.Categorical).cat.set_ordering('lexical'))
+    )
+
+
+def _frame_size(df: pl.DataFrame):
+    return df.estimated_size()
 
 
 pct_chance = lambda pct: random() < pct / 100
 
+# gen_lineup's chances (in percent) and slot weights, as it had them hard-coded. _fit_lineup_odds re-estimates what it can.
+GEN_LINEUP_ODDS = {
+    'cash': 70,
+    'cash_slots': [1] * 6,
+    'no_golden_road_after_cash': 98,
+    'three_cars': 2,
+    'non_car': 4,
+    'car_respects_halves': 93,
+    'split_cars': 99.5,
+    'golden_road_first': 95,
+    'car_slots': [1] * 6,
+    'fill_fees': 95,
+    'fee_respects_halves': 95,
+    '4 prizer': 27,
+    '3 prizer after 4': 3,
+    '3 prizer': 30,
+    '2 prizer after 4 and 3': 0.5,
+    '2 prizer after 3': 40,
+    '2 prizer': 75,
+    '1+ prizer after 2': 0.25,
+    '1+ prizer after 4 or 3': 10,
+    '1+ prizer': 65,
+}
+# the daytime seasons the odds are fitted to unless asked otherwise, "modern-day"
+LINEUP_ODDS_SEASONS = P.closed(max(1, CURRENT_SEASON - 4), CURRENT_SEASON)
+# fewer lineups than this to estimate a chance from, and the default is kept
+_MIN_FIT_LINEUPS = 30
+
+
+def _pg_mask(pgs: Iterable[PG]):
+    """Bool array over the PG ordinals, True for pgs."""
+    mask = np.zeros(len(PG), dtype=bool)
+    mask[[_PG_ORDINAL[str(pg)] for pg in pgs]] = True
+    return mask
+
+
+# the partitions gen_lineup draws from, as masks over the PG ordinals and as the ordinals themselves
+_GEN_MASKS = {
+    p: _pg_mask(PG.partition_table[p])
+    for p in ('CASH', 'SP/CASH', 'BAILOUT', 'CAR', 'NON-CAR', 'FEE', 'SP/CAR', 'GP/CAR', 'REG. GP', 'REG. SP')
+    + ('4 PRIZER', '3 PRIZER', '2 PRIZER', '1+ PRIZER', '1 PRIZER')
+}
+_GEN_MASKS['ANY CAR'] = _GEN_MASKS['CAR'] | _GEN_MASKS['NON-CAR']
+_GEN_MASKS['REG. FEE'] = _GEN_MASKS['REG. GP'] | _GEN_MASKS['REG. SP']
+_GEN_ORDS = {p: np.flatnonzero(mask) for p, mask in _GEN_MASKS.items()}
+# indexed by fee, GP then SP like gen_lineup's unused_fees
+_GEN_FEES = np.stack([_pg_mask(PG.partition_table['GP']), _pg_mask(PG.partition_table['SP'])])
+_GEN_REG_FEES = np.stack([_GEN_MASKS['REG. GP'], _GEN_MASKS['REG. SP']])[:, _GEN_ORDS['REG. FEE']]
+_GEN_HALVES = np.repeat(np.eye(2, dtype=bool), 3, axis=1)
+_GEN_SLOT_INDEX = np.arange(6)
+# the slots _pick_slot prefers for each PG ordinal (no playing included)
+_GEN_SLOTS = np.ones((len(PG) + 1, 6), dtype=bool)
+_GEN_SLOTS[:-1][_pg_mask(PG.partition_table['NO_FIRST']), :1] = False
+_GEN_SLOTS[:-1][_pg_mask(PG.partition_table['NO_OPENING_ACT']), :2] = False
+_GOLDEN_ROAD = _PG_ORDINAL[str(PG.GoldenRoad)]
+# a lineup with one of these gets no 4 prizer
+_NO_4_PRIZER_PGS = frozenset({PG.MoreOrLess, PG.FortuneHunter})
+_NO_4_PRIZER = [_PG_ORDINAL[str(pg)] for pg in _NO_4_PRIZER_PGS]
+# gen_lineup's chance of each prizer, in the order they are decided, by the bigger prizers the lineup already got:
+# (bigger prizers, at least how many of them, odds key), the first rule that holds is the one used.
+_PRIZER_RULES = {
+    '4 PRIZER': (((), 0, '4 prizer'),),
+    '3 PRIZER': ((('4 PRIZER',), 1, '3 prizer after 4'), ((), 0, '3 prizer')),
+    '2 PRIZER': (
+        (('4 PRIZER', '3 PRIZER'), 2, '2 prizer after 4 and 3'),
+        (('3 PRIZER',), 1, '2 prizer after 3'),
+        ((), 0, '2 prizer'),
+    ),
+    '1+ PRIZER': (
+        (('4 PRIZER', '3 PRIZER', '2 PRIZER'), 2, '1+ prizer after 2'),
+        (('4 PRIZER', '3 PRIZER'), 1, '1+ prizer after 4 or 3'),
+        ((), 0, '1+ prizer'),
+    ),
+}
+
+
+def _prizer_rules(prizer: str, got: dict):
+    """(odds key, where that rule is the one used) of each of prizer's _PRIZER_RULES.
+
+    got is whether the lineup has each bigger prizer, bools for one lineup or arrays for many."""
+    taken = np.zeros((), dtype=bool)
+    for bigger, at_least, key in _PRIZER_RULES[prizer]:
+        holds = sum(np.asarray(got[p], dtype=int) for p in bigger) >= at_least
+        yield key, holds & ~taken
+        taken = taken | holds
+
+
+def _prizer_pct(odds: dict, prizer: str, got: dict):
+    keys, where = zip(*_prizer_rules(prizer, got))
+    return np.select(where, [odds[key] for key in keys])
+
+
+def _gen_lineup_batch(pool: np.ndarray, n: int, rng: np.random.Generator, odds: dict):
+    """gen_lineup n times over, each of its steps taken for all n lineups at once. pool is a _pg_mask of the games.
+
+    Returns (n, 6) PG ordinals and non-car marks, and which lineups made it through: where gen_lineup would raise
+    (a choice out of nothing), that lineup is marked failed instead."""
+    every = np.arange(n)
+    avail = np.tile(pool, (n, 1))
+    ords = np.full((n, 6), len(PG), dtype=np.int16)
+    non_car = np.zeros((n, 6), dtype=bool)
+    open_slots = np.ones((n, 6), dtype=bool)
+    fees = np.ones((n, 2), dtype=bool)
+    fee_halves = np.ones((n, 2), dtype=bool)
+    ok = np.ones(n, dtype=bool)
+
+    def chance(pct, rows):
+        return rng.random(len(rows)) < pct / 100
+
+    def available(rows, partition):
+        # only the partition's own columns of avail, most partitions are a handful of games
+        return avail[np.ix_(rows, _GEN_ORDS[partition])]
+
+    def remove(rows, partition):
+        avail[np.ix_(rows, _GEN_ORDS[partition])] = False
+
+    def pick(rows, masks, cols, weights=None):
+        # the col of a random True column of each row, by weights or uniformly, rows with none fail
+        cum = masks.cumsum(axis=1, dtype=np.int16) if weights is None else (masks * weights).cumsum(axis=1)
+        totals = cum[:, -1]
+        picked = (cum > (rng.random(len(rows)) * totals)[:, None]).argmax(axis=1)
+        ok[rows[totals == 0]] = False
+        return totals > 0, cols[picked]
+
+    def place(rows, pgs, slot_masks, weights=None):
+        # _pick_slot: the PG's preferred slots among slot_masks if there are any, else any of them
+        allowed = slot_masks & _GEN_SLOTS[pgs]
+        has, slots = pick(
+            rows, np.where(allowed.any(axis=1, keepdims=True), allowed, slot_masks), _GEN_SLOT_INDEX, weights
+        )
+        ords[rows[has], slots[has]] = pgs[has]
+        open_slots[rows[has], slots[has]] = False
+        return has, slots
+
+    def play(rows, partition):
+        # one game out of partition into an open slot, the rest of partition is then out
+        has, pgs = pick(rows, available(rows, partition), _GEN_ORDS[partition])
+        rows = rows[has]
+        has, _ = place(rows, pgs[has], open_slots[rows])
+        remove(rows[has], partition)
+
+    # cash
+    rows = every[chance(odds['cash'], every)]
+    has, cashers = pick(rows, available(rows, 'CASH'), _GEN_ORDS['CASH'])
+    rows, cashers = rows[has], cashers[has]
+    has, slots = place(rows, cashers, open_slots[rows], np.asarray(odds['cash_slots'], dtype=np.float64))
+    rows, cashers, slots = rows[has], cashers[has], slots[has]
+    fee = _GEN_MASKS['SP/CASH'][cashers].astype(np.intp)
+    avail[rows] &= ~_GEN_FEES[fee]
+    remove(rows[_GEN_MASKS['BAILOUT'][cashers]], 'BAILOUT')
+    fees[rows, fee] = False
+    fee_halves[rows, slots // 3] = False
+    avail[rows[(slots == 0) & chance(odds['no_golden_road_after_cash'], rows)], _GOLDEN_ROAD] = False
+
+    # cars
+    cars_in = _GEN_ORDS['ANY CAR']
+    car_count = np.where(chance(odds['three_cars'], every), 3, 2)
+    for ttc in range(3):
+        rows = every[ok & (car_count > ttc)]
+        do_non_car = chance(odds['non_car'], rows)
+        car_sample = available(rows, 'ANY CAR') & np.where(
+            do_non_car[:, None], _GEN_MASKS['NON-CAR'][cars_in], _GEN_MASKS['CAR'][cars_in]
+        )
+        respect_halves = chance(odds['car_respects_halves'], rows)
+        slot_choices = open_slots[rows]
+        if ttc < 2:
+            slot_choices &= _GEN_HALVES[ttc]
+            car_sample[~fee_halves[rows, ttc] & respect_halves] &= ~_GEN_MASKS['FEE'][cars_in]
+        third_car = np.append(_GEN_MASKS['CAR'], False)[ords[rows, 2]]
+        slot_choices[third_car & chance(odds['split_cars'], rows), 3] = False
+
+        has, cars = pick(rows, car_sample, cars_in)
+        rows, cars, do_non_car, respect_halves, slot_choices = (
+            rows[has], cars[has], do_non_car[has], respect_halves[has], slot_choices[has]
+        )
+        golden = (cars == _GOLDEN_ROAD) & (ords[rows, 0] == len(PG)) & chance(odds['golden_road_first'], rows)
+        slot_choices[golden] = _GEN_SLOT_INDEX == 0
+        has, slots = place(rows, cars, slot_choices, np.asarray(odds['car_slots'], dtype=np.float64))
+        rows, cars, do_non_car, respect_halves, slots = rows[has], cars[has], do_non_car[has], respect_halves[has], slots[has]
+        non_car[rows, slots] = do_non_car
+
+        fee = np.where(_GEN_MASKS['SP/CAR'][cars], 1, np.where(_GEN_MASKS['GP/CAR'][cars], 0, -1))
+        is_fee = fee >= 0
+        avail[rows[is_fee]] &= ~_GEN_FEES[fee[is_fee]]
+        avail[rows[~is_fee], cars[~is_fee]] = False
+        used = is_fee & respect_halves
+        rows, fee, half = rows[used], fee[used], slots[used] // 3
+        # gen_lineup's unused_fee_halves.remove raises when that half already had its fee
+        ok[rows[~fee_halves[rows, half]]] = False
+        fees[rows, fee] = False
+        fee_halves[rows, half] = False
+
+    # regular fees into the halves left, each list in random order and paired off
+    fee_count = fees.sum(axis=1)
+    do_fees = (fee_count == 2) | chance(odds['fill_fees'], every)
+    fee_order = np.argsort(np.where(fees, rng.random((n, 2)), 2), axis=1)
+    half_order = np.argsort(np.where(fee_halves, rng.random((n, 2)), 2), axis=1)
+    for k in range(2):
+        rows = every[ok & do_fees & (fee_count > k)]
+        fee, half = fee_order[rows, k], half_order[rows, k]
+        sample = available(rows, 'REG. FEE') & _GEN_REG_FEES[fee]
+        has = sample.any(axis=1)
+        rows, fee, half, sample = rows[has], fee[has], half[has], sample[has]
+        _, mps = pick(rows, sample, _GEN_ORDS['REG. FEE'])
+        respect_halves = chance(odds['fee_respects_halves'], rows)
+        has, _ = place(rows, mps, open_slots[rows] & np.where(respect_halves[:, None], _GEN_HALVES[half], True))
+        remove(rows[has & (fee == 0)], 'REG. GP')
+        remove(rows[has & (fee == 1)], 'REG. SP')
+
+    # 4, 3, 2 and 1+ prizers, each less likely the more of the others there are
+    got = {}
+    for prizer in _PRIZER_RULES:
+        rows = every[ok & open_slots.any(axis=1)] if prizer == '1+ PRIZER' else every[ok]
+        can = available(rows, prizer).any(axis=1)
+        if prizer == '4 PRIZER':
+            can &= ~np.isin(ords[rows], _NO_4_PRIZER).any(axis=1)
+        got[prizer] = np.zeros(n, dtype=bool)
+        got[prizer][rows] = can & chance(_prizer_pct(odds, prizer, {p: g[rows] for p, g in got.items()}), rows)
+        play(every[got[prizer] & ok], prizer)
+
+    # the rest are 1 prizers
+    while (rows := every[ok & open_slots.any(axis=1)]).size:
+        has, mps = pick(rows, available(rows, '1 PRIZER'), _GEN_ORDS['1 PRIZER'])
+        rows, mps = rows[has], mps[has]
+        has, _ = place(rows, mps, open_slots[rows])
+        avail[rows[has], mps[has]] = False
+
+    return ords, non_car, ok
+
+
+def _fit_lineup_odds(df: pl.DataFrame, seasons: Portion = LINEUP_ODDS_SEASONS):
+    """GEN_LINEUP_ODDS estimated from the full-hour lineups of the daytime frame df in seasons, in one pass over them.
+
+    Only what shows in a finished lineup is fitted: having cash, three cars, non-car games for cars, each prizer given
+    the bigger ones, and the slots cash and cars went in. The placement rules keep their defaults, Golden Road put first
+    by one of them is no car slot weight.
+
+    Fitted to gen_lineup's own lineups the rarer prizer chances still come out off from the odds that made them, so the
+    fit is not what gen_lineup and gen_lineups default to."""
+    odds = dict(GEN_LINEUP_ODDS)
+    df = df.filter(pl.col('S').is_in(list(P.iterate(seasons & P.closed(1, CURRENT_SEASON), step=1))))
+    ords = _pg_ordinals(df)
+    full = ords[:, -1] != len(PG)
+    ords = ords[full]
+    car_flag = df.select(pl.col('^PG\d_f$').fill_null(0)).to_numpy()[full] & 2 ** _pf_bit('car') > 0
+
+    def has(partition):
+        return np.append(_GEN_MASKS[partition], False)[ords]
+
+    def fit(key, hits, given):
+        if given.sum() >= _MIN_FIT_LINEUPS:
+            odds[key] = float(100 * hits[given].mean())
+
+    cash = has('CASH')
+    cars = has('CAR') | has('NON-CAR') & car_flag
+    every = np.ones(len(ords), dtype=bool)
+    fit('cash', cash.any(axis=1), every)
+    fit('three_cars', cars.sum(axis=1) >= 3, cars.sum(axis=1) >= 2)
+    if cars.sum() >= _MIN_FIT_LINEUPS:
+        odds['non_car'] = float(100 * (has('NON-CAR') & car_flag).sum() / cars.sum())
+    car_slots = cars.copy()
+    car_slots[:, 0] &= ords[:, 0] != _GOLDEN_ROAD
+    # slot weights, one extra per slot so none is ruled out
+    for key, played in (('cash_slots', cash), ('car_slots', car_slots)):
+        if played.sum() >= _MIN_FIT_LINEUPS:
+            odds[key] = (played.sum(axis=0) + 1).tolist()
+
+    got = {p: has(p).any(axis=1) for p in _PRIZER_RULES}
+    for prizer in _PRIZER_RULES:
+        for key, given in _prizer_rules(prizer, got):
+            if prizer == '4 PRIZER':
+                given = given & ~np.isin(ords, _NO_4_PRIZER).any(axis=1)
+            fit(key, got[prizer], given)
+    return odds
+
+
+class SimulatedLineups(NamedTuple):
+    """Lineups from ConflictSheet.gen_lineups: (n, 6) PG ordinals and non-car marks."""
+
+    ords: np.ndarray
+    non_car: np.ndarray
+
+    def pgs(self, i: int) -> List[str]:
+        return _PG_BY_ORDINAL[self.ords[i]].tolist()
+
+    def slot_table(self) -> pl.LazyFrame:
+        """PG, flag, PG1..PG6 counts like ConflictSheet.slot_table, the only flag being car (non-car games in a car slot)."""
+        counts = np.bincount(
+            ((self.ords.astype(np.intp) * 2 + self.non_car) * 6 + np.arange(6)).ravel(), minlength=(len(PG) + 1) * 12
+        ).reshape(len(PG) + 1, 2, 6)
+        return _slot_count_frame(counts, np.array([0, 1], dtype=np.uint16))
+
+    def pair_counts(self) -> np.ndarray:
+        """PG x PG matrix of how many lineups have both PGs, like ConflictSheet._pair_counts."""
+        size = len(PG) + 1
+        ords = self.ords.astype(np.intp)
+        pairs = sum(np.bincount(ords[:, i] * size + ords[:, j], minlength=size * size) for i, j in combinations(range(6), 2))
+        pairs = pairs.reshape(size, size)
+        pairs += pairs.T
+        pairs[np.diag_indices(size)] = np.bincount(ords.ravel(), minlength=size)
+        return pairs[:-1, :-1]
+
+
+class _SheetState(NamedTuple):
+    """The frames of every time and everything indexed off them. Replaced whole, never mutated, so a query that holds on
+    to one never sees a frame of one version against an index of another.
+
+    The one exception is lineup_odds, a memo filled lazily as windows are asked for. A fit only depends on this state's
+    daytime frame, so two threads fitting the same window store equal odds, and each store is a single dict assignment."""
+
+    frames: dict
+    # time -> (season, PG, PG) uint16 co-occurrence counts, primetime is all "season 0"
+    pairs: dict
+    # time -> (distinct flags, (season + 1, PG + 1, flag, slot) cumulative slot counts: cum[s] covers seasons < s)
+    slots: dict
+    # time -> (sorted airdate day numbers, row of each or None when the frame is already in airdate order)
+    dates: dict
+    # time -> _lineup_bitsets of the frame, row i is PG_n i + 1
+    lineups: dict
+    # time -> _long_playings of the frame: every playing as a row, each PG's a contiguous slice
+    playings: dict
+    # time -> _NotesIndex of its notes column
+    notes: dict
+    # season window -> gen_lineup odds fitted to it, filled in on first use; carried over daytime edits outside the window
+    lineup_odds: dict
+    # bumped with every new state, materialized results of older generations are never looked up again
+    generation: int
+
+
+_EMPTY_STATE = _SheetState({}, {}, {}, {}, {}, {}, {}, {}, 0)
+
 
 class ConflictSheet:
-    _MAX_CACHE = 64
-    _CACHE_GETTER = attrgetter('cache')
+    # bytes of collected frames (DataFrame.estimated_size) the LFU holds before evicting
+    _MAX_CACHE_BYTES = 128 * 2**20
+    # seconds after the last of a burst of edits that the snapshot is written, once for the whole burst
+    _SNAPSHOT_DELAY = 30
 
     def __init__(
-        self, load_func: Callable[[], io.BytesIO], save_func: Callable[[io.BytesIO], None], override_pickle: bool = False
+        self,
+        load_func: Callable[[], io.BytesIO],
+        save_func: Callable[[io.BytesIO], None],
+        override_snapshot: bool = False,
+        snapshot_dir: str = 'df_dict',
+        lineup_engine: str = 'bitset',
+        frames: Optional[Tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]] = None,
     ):
         self.load_func = load_func
         self.save_func = save_func
-        self.cache = LFUCache(self._MAX_CACHE)
+        self.snapshot_dir = snapshot_dir
+        # 'bitset' or 'polars', how lineup_query evaluates search conditions
+        self.lineup_engine = lineup_engine
+        self.cache = LFUCache(self._MAX_CACHE_BYTES, getsizeof=_frame_size)
+        self._cache_lock = threading.RLock()
+        self._state = _EMPTY_STATE
+        # the state a worker thread's query started on, see pinned
+        self._pinned = threading.local()
+        # query family (cache key prefix) -> lookups answered from / missing the LFU
+        self._cache_hits = Counter()
+        self._cache_misses = Counter()
+        self.notes = ''
+        # workbook and snapshot writes happen here, one at a time and in order.
+        self._persist_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cs_persist')
+        self._persisted = None
+        # the pending snapshot write after edits, and the lock queueing persistence work in the same order as the edits
+        self._snapshot_timer = None
+        self._persist_lock = threading.Lock()
+        # sheetName -> (member key, frame, legend colors, notes) of the last parse, and the workbook the frames came from
+        self._sheet_cache = {}
+        self._workbook_hash = None
+        if frames:
+            # prebuilt sheet frames (synthetic data): nothing is loaded from or persisted to the workbook
+            self.excel_fp = None
+            self._set_frames(*frames)
+            return
         try:
-            if override_pickle:
+            if override_snapshot:
                 raise ValueError
-            self.load_pickle()
+            self.load_snapshot()
             self.excel_fp = None
+        except SnapshotMismatch as e:
+            _log.warning(f'cs snapshot rejected, rebuilding from excel: {e}')
+            self.load_excel()
+            self.initialize()
         except:
             self.load_excel()
-            self._df_dict = {}
             self.initialize()
 
+    def _tables(self) -> _SheetState:
+        return getattr(self._pinned, 'state', None) or self._state
+
+    @contextmanager
+    def pinned(self):
+        """Every read of the frames and indexes on this thread sees the state current on entry, whatever gets published
+        meanwhile. Cached queries pin themselves, anything making several calls that must agree should run inside one."""
+        if getattr(self._pinned, 'state', None):
+            yield
+            return
+        self._pinned.state = self._state
+        try:
+            yield
+        finally:
+            del self._pinned.state
+
+    _df_dict = property(lambda self: self._tables().frames)
+    _pair_index = property(lambda self: self._tables().pairs)
+    _slot_index = property(lambda self: self._tables().slots)
+    _date_index = property(lambda self: self._tables().dates)
+    _lineup_index = property(lambda self: self._tables().lineups)
+    _playings = property(lambda self: self._tables().playings)
+    _notes_index = property(lambda self: self._tables().notes)
+    _lineup_odds = property(lambda self: self._tables().lineup_odds)
+    generation = property(lambda self: self._tables().generation)
+
     def get(self, time: str):
         return self._df_dict[time]
 
@@ -142,15 +1129,9 @@ class ConflictSheet:
         ttable.set_cols_dtype('tiiiiiiiif')
         ttable.set_precision(1)
 
-        sub_slots_df = self.endpoint_sub(endpoints, time, q=self.slot_table(time, 'S'))
-        # permutation must be done to match both possible orders of pg1/pg2, so do the more costly operation once
-        pg_pair_perms = set(itertools.permutations([str(pg) for pg in pgs], 2))
-
-        pg_pair_dict = Counter()
-        for r in self.endpoint_sub(endpoints, time).select(pl.col('^PG[1-6]_p$')).collect().rows():
-            for pg1, pg2 in set(itertools.combinations(r, 2)) & pg_pair_perms:
-                pg_pair_dict[pg1, pg2] += 1
-                pg_pair_dict[pg2, pg1] += 1
+        sub_slots_df = self.slot_counts(endpoints, time)
+        pair_counts = self._pair_counts(endpoints, time)
+        ords = [_PG_ORDINAL.get(str(pg)) for pg in pgs]
 
         nums = np.zeros((6, 8), dtype=int)
         hundo = False
@@ -158,7 +1139,12 @@ class ConflictSheet:
             row = [pgp]
             pg = pgp.pg
 
-            pg_conf = [pg_pair_dict[str(pg), str(pgs[j - 1])] if i != j else '-' for j in range(1, 7)]
+            pg_conf = [
+                (int(pair_counts[ords[i - 1], ords[j - 1]]) if ords[i - 1] is not None and ords[j - 1] is not None else 0)
+                if i != j
+                else '-'
+                for j in range(1, 7)
+            ]
             nums[i - 1, :6] = [i if type(i) is int else 0 for pgc in pg_conf]
             row.extend(pg_conf)
 
@@ -184,7 +1170,7 @@ class ConflictSheet:
 
         return ttable.draw()
 
-    def _pick_slot(self, pg, initial_slots):
+    def _pick_slot(self, pg, initial_slots, weights=None):
         slots = copy(initial_slots)
         if pg in PG.partition_table['NO_OPENING_ACT']:
             slots -= {1, 2}
@@ -192,12 +1178,45 @@ class ConflictSheet:
             slots -= {1}
         if not slots:
             slots = copy(initial_slots)
-        return choice(tuple(slots))
+        slots = tuple(slots)
+        return choices(slots, weights=[weights[s - 1] for s in slots])[0] if weights else choice(slots)
 
     def _pick_game(self, pg_group):
         t = tuple(pg_group)
 
-    def gen_lineup(self, pg_sample: Set[PG], half_hour: bool = False):
+    def lineup_odds(self, seasons: Optional[Portion] = None) -> dict:
+        """gen_lineup's odds fitted to the daytime lineups of seasons (LINEUP_ODDS_SEASONS if not given).
+
+        Fitted once per season window until a daytime edit in it, the default window comes with the snapshot."""
+        seasons = seasons or LINEUP_ODDS_SEASONS
+        state = self._tables()
+        odds = state.lineup_odds.get(seasons)
+        if odds is None:
+            odds = state.lineup_odds[seasons] = _fit_lineup_odds(state.frames['daytime'], seasons)
+        return odds
+
+    def gen_lineups(
+        self, pg_sample: Set[PG], n: int, seed: Optional[int] = None, odds: Optional[dict] = None, batch: int = 2**16
+    ) -> SimulatedLineups:
+        """n full-hour lineups under gen_lineup's "smart" rules, generated together on NumPy arrays for simulations.
+
+        A lineup gen_lineup would have raised on is thrown out and generated again. odds are GEN_LINEUP_ODDS unless given,
+        lineup_odds() for the fitted ones."""
+        odds = odds or GEN_LINEUP_ODDS
+        rng = np.random.default_rng(seed)
+        pool = _pg_mask(pg_sample)
+        ords, non_car, total = [], [], 0
+        while total < n:
+            o, nc, ok = _gen_lineup_batch(pool, min(batch, n - total), rng, odds)
+            if not ok.any():
+                raise ValueError('No lineup can be generated out of these games.')
+            ords.append(o[ok])
+            non_car.append(nc[ok])
+            total += ok.sum()
+        return SimulatedLineups(np.concatenate(ords)[:n], np.concatenate(non_car)[:n])
+
+    def gen_lineup(self, pg_sample: Set[PG], half_hour: bool = False, odds: Optional[dict] = None):
+        odds = odds or GEN_LINEUP_ODDS
         nPGs = [None] * (3 if half_hour else 6)
         non_car = [None] * (3 if half_hour else 6)
         unused_slots = set(range(1, 7))
@@ -206,10 +1225,10 @@ class ConflictSheet:
         unused_fee_halves = [0, 1]
 
         # decide on cash or no cash.
-        casher = choice(tuple(pg_sample & PG.partition_table['CASH'])) if pct_chance(70) else None
+        casher = choice(tuple(pg_sample & PG.partition_table['CASH'])) if pct_chance(odds['cash']) else None
         cash_type = None if not casher else 'SP' if casher in PG.partition_table['SP/CASH'] else 'GP'
         if casher:
-            slot = self._pick_slot(casher, unused_slots)
+            slot = self._pick_slot(casher, unused_slots, odds['cash_slots'])
             nPGs[slot - 1] = casher
             unused_slots.remove(slot)
             pg_sample -= PG.partition_table[f'{cash_type}']
@@ -217,16 +1236,16 @@ class ConflictSheet:
                 pg_sample -= PG.partition_table['BAILOUT']
             unused_fees.remove(cash_type)
             unused_fee_halves.remove((slot - 1) // 3)
-            if slot == 1 and pct_chance(98):
+            if slot == 1 and pct_chance(odds['no_golden_road_after_cash']):
                 pg_sample.discard(PG.GoldenRoad)
 
         # now decide cars.
-        total_car_count = 3 if pct_chance(2) else 2
+        total_car_count = 3 if pct_chance(odds['three_cars']) else 2
         for ttc in range(total_car_count):
-            do_non_car = pct_chance(4)
+            do_non_car = pct_chance(odds['non_car'])
             car_sample = pg_sample & (PG.partition_table['NON-CAR'] if do_non_car else PG.partition_table['CAR'])
 
-            respect_halves = pct_chance(93)
+            respect_halves = pct_chance(odds['car_respects_halves'])
             slot_choices = copy(unused_slots)
             if ttc == 0:
                 slot_choices &= halves[0]
@@ -236,15 +1255,15 @@ class ConflictSheet:
                 slot_choices &= halves[1]
                 if 1 not in unused_fee_halves and respect_halves:
                     car_sample -= PG.partition_table['FEE']
-            if nPGs[2] in PG.partition_table['CAR'] and pct_chance(99.5):
+            if nPGs[2] in PG.partition_table['CAR'] and pct_chance(odds['split_cars']):
                 slot_choices -= {4}
 
             car = choice(tuple(car_sample))
 
-            if car == PG.GoldenRoad and not nPGs[0] and pct_chance(95):
+            if car == PG.GoldenRoad and not nPGs[0] and pct_chance(odds['golden_road_first']):
                 slot = 1
             else:
-                slot = self._pick_slot(car, slot_choices)
+                slot = self._pick_slot(car, slot_choices, odds['car_slots'])
             nPGs[slot - 1] = car
             unused_slots.remove(slot)
             non_car[slot - 1] = do_non_car
@@ -257,7 +1276,7 @@ class ConflictSheet:
             else:
                 pg_sample.remove(car)
 
-        if len(unused_fees) == 2 or pct_chance(95):
+        if len(unused_fees) == 2 or pct_chance(odds['fill_fees']):
             shuffle(unused_fees)
             shuffle(unused_fee_halves)
             # fill in unused fees with regular fees, respecting halves most of the time.
@@ -265,56 +1284,29 @@ class ConflictSheet:
                 sample = pg_sample & PG.partition_table[f'REG. {fee}']
                 if sample:
                     mp = choice(tuple(sample))
-                    respect_halves = pct_chance(95)
+                    respect_halves = pct_chance(odds['fee_respects_halves'])
                     slot = self._pick_slot(mp, unused_slots & halves[half] if respect_halves else unused_slots)
                     nPGs[slot - 1] = mp
                     unused_slots.remove(slot)
                     pg_sample -= PG.partition_table[f'REG. {fee}']
 
-        # decide on a 4 prizer or not.
-        do_4p = (
-            bool(pg_sample & PG.partition_table['4 PRIZER'])
-            and not (set(nPGs) & {PG.MoreOrLess, PG.FortuneHunter})
-            and pct_chance(27)
-        )
-        if do_4p:
-            mp = choice(tuple(pg_sample & PG.partition_table['4 PRIZER']))
-            slot = self._pick_slot(mp, unused_slots)
-            nPGs[slot - 1] = mp
-            unused_slots.remove(slot)
-            pg_sample -= PG.partition_table['4 PRIZER']
-
-        # decide on a 3 prizer or not.
-        do_3p = bool(pg_sample & PG.partition_table['3 PRIZER']) and pct_chance(3 if do_4p else 30)
-        if do_3p:
-            mp = choice(tuple(pg_sample & PG.partition_table['3 PRIZER']))
-            slot = self._pick_slot(mp, unused_slots)
-            nPGs[slot - 1] = mp
-            unused_slots.remove(slot)
-            pg_sample -= PG.partition_table['3 PRIZER']
-
-        # decide on a 2 prizer or not.
-        do_2p = bool(pg_sample & PG.partition_table['2 PRIZER']) and pct_chance(
-            0.5 if do_4p and do_3p else 40 if do_3p else 75
-        )
-        if do_2p:
-            mp = choice(tuple(pg_sample & PG.partition_table['2 PRIZER']))
-            slot = self._pick_slot(mp, unused_slots)
-            nPGs[slot - 1] = mp
-            unused_slots.remove(slot)
-            pg_sample -= PG.partition_table['2 PRIZER']
-
-        if unused_slots:
-            # decide on a 1+ prizer or not.
-            do_1plusp = bool(pg_sample & PG.partition_table['1+ PRIZER']) and pct_chance(
-                0.25 if (do_4p + do_3p + do_2p >= 2) else 10 if (do_4p + do_3p >= 1) else 25 if do_2p and do_3p else 65
+        # decide on each prizer or not, the 1+ prizer only with slots left.
+        got = {}
+        for prizer in _PRIZER_RULES:
+            if prizer == '1+ PRIZER' and not unused_slots:
+                break
+            sample = pg_sample & PG.partition_table[prizer]
+            got[prizer] = (
+                bool(sample)
+                and not (prizer == '4 PRIZER' and set(nPGs) & _NO_4_PRIZER_PGS)
+                and pct_chance(_prizer_pct(odds, prizer, got))
             )
-            if do_1plusp:
-                mp = choice(tuple(pg_sample & PG.partition_table['1+ PRIZER']))
+            if got[prizer]:
+                mp = choice(tuple(sample))
                 slot = self._pick_slot(mp, unused_slots)
                 nPGs[slot - 1] = mp
                 unused_slots.remove(slot)
-                pg_sample -= PG.partition_table['1+ PRIZER']
+                pg_sample -= PG.partition_table[prizer]
 
         while unused_slots:
             # fill out remainder of lineup with 1 prizers.
@@ -326,93 +1318,339 @@ class ConflictSheet:
 
         return nPGs, non_car
 
-    @cachedmethod(_CACHE_GETTER, key=partial(hashkey, 'ep_sub'))
-    def endpoint_sub(self, endpoints: Portion, time: str, *, q: Optional[pl.LazyFrame] = None):
-        if q is None:
-            q = self._df_dict[time].lazy()
+    def cache_info(self, prefix: Optional[str] = None) -> QueryCacheInfo:
+        """Hits and misses of one query family ('ep_sub', 'lineup', 'cc', 'last', 'slots', 'slot_counts', 'result'), or of all of them."""
+        hits, misses = (
+            (self._cache_hits[prefix], self._cache_misses[prefix])
+            if prefix
+            else (sum(self._cache_hits.values()), sum(self._cache_misses.values()))
+        )
+        return QueryCacheInfo(hits, misses, self.cache.maxsize, self.cache.currsize)
+
+    # queries run on the cogs' worker threads, the LFU is only ever touched under the lock (never while collecting).
+    # it only holds results of the current state: a query pinned to an older one neither reads nor writes it.
+    def _cache_get(self, prefix: str, key) -> Optional[pl.DataFrame]:
+        with self._cache_lock:
+            df = self.cache.get(key) if self._tables() is self._state else None
+            (self._cache_misses if df is None else self._cache_hits)[prefix] += 1
+        return df
+
+    def _cache_put(self, key, df: pl.DataFrame):
+        try:
+            with self._cache_lock:
+                if self._tables() is self._state:
+                    self.cache[key] = df
+        except ValueError:
+            _log.debug(f'cs cache: {key.prefix} result of {df.estimated_size()} bytes exceeds the cache budget')
+
+    def materialize(self, key: Hashable, q: pl.LazyFrame) -> pl.DataFrame:
+        """q collected, cached in the sheet's LFU under key for the current generation of the frames.
+
+        For the cogs' own post-processing of query results. key must determine q completely, endpoints, time and all."""
+        with self.pinned():
+            key = _QueryKey('result', (self.generation, key))
+            df = self._cache_get('result', key)
+            if df is None:
+                df = q.collect()
+                self._cache_put(key, df)
+        return df
+
+    def _publish(self, state: _SheetState, invalidate: Optional[Callable[[], None]] = None):
+        """Makes state the current one. Stale cached results (all materialized ones, and whatever invalidate drops) go in
+        the same step, so no query can pair the new state with an old result."""
+        with self._cache_lock:
+            self._state = state._replace(generation=self._state.generation + 1)
+            for k in [k for k in self.cache.keys() if k.prefix == 'result']:
+                del self.cache[k]
+            if invalidate:
+                invalidate()
+
+    def playings(self, time: str, pgs: Optional[Iterable[PG]] = None) -> pl.LazyFrame:
+        """The long playings table of time (PROD, PG_n, S, AIRDATE, slot, PG, flag), only pgs' playings if given."""
+        long, starts = self._playings[time]
+        if pgs is None:
+            return long.lazy()
+        ords = sorted({_PG_ORDINAL[str(pg)] for pg in pgs if str(pg) in _PG_ORDINAL})
+        return pl.concat(
+            [long.slice(int(starts[o]), int(starts[o + 1] - starts[o])) for o in ords] or [long.clear()]
+        ).lazy()
+
+    def _row_mask(self, time: str, rows: pl.LazyFrame):
+        # by PG_n: whether that row of time is one of rows
+        keep = np.zeros(self._df_dict[time].height + 1, dtype=bool)
+        keep[rows.select('PG_n').collect().get_column('PG_n').to_numpy()] = True
+        return keep
+
+    def _playings_in(self, time: str, rows: pl.LazyFrame, pgs: Optional[Iterable[PG]] = None) -> pl.DataFrame:
+        long = self.playings(time, pgs).collect()
+        return long.filter(pl.Series(self._row_mask(time, rows)[long.get_column('PG_n').to_numpy()]))
+
+    @_cached_query('ep_sub', _endpoint_args)
+    def endpoint_sub(self, endpoints: Portion, time: str):
+        q = self._df_dict[time].lazy()
         if not endpoints:
             return q
-        elif type(endpoints.lower) is not int:
-            return q.filter(pl.col('AIRDATE').is_in(pl.date_range(endpoints.lower, endpoints.upper, '1d')))
+        elif not _is_season(endpoints):
+            if time in self._date_index:
+                lower, upper = (
+                    np.array([getattr(a, bound) for a in endpoints], dtype='datetime64[D]').astype(np.int64)
+                    for bound in ('lower', 'upper')
+                )
+                return self._airdate_rows(time, lower, upper)
+            return q.filter(pl.any([pl.col('AIRDATE').is_between(a.lower, a.upper, closed='both') for a in endpoints]))
         elif time != 'primetime':
             return q.filter(pl.col('S').is_in(list(P.iterate(endpoints, step=1))))
         else:
             return q
 
-    @cachedmethod(_CACHE_GETTER, key=partial(hashkey, 'lineup'))
+    def airdate_sub(self, dates: Iterable[date], time: str) -> pl.LazyFrame:
+        """Rows of time that aired on any of dates, in frame order."""
+        days = np.unique(np.array(list(dates), dtype='datetime64[D]').astype(np.int64))
+        if time not in self._date_index:
+            return self._df_dict[time].lazy().filter(pl.col('AIRDATE').dt.epoch('d').is_in(days.tolist()))
+        return self._airdate_rows(time, days, days)
+
+    def notes_sub(self, time: str, regex: str) -> pl.LazyFrame:
+        """Rows of time whose notes (SPECIAL in primetime) match regex case-insensitively, in frame order.
+
+        Only rows whose notes have every run of letters and digits the regex needs are candidates, out of the notes index.
+        The tokens a run can be in are narrowed down by its trigrams first. A regex that is one such run is answered from
+        the index alone, anything else is checked on the candidates."""
+        df, column = self._df_dict[time], _NOTES_COLUMNS[time]
+        pattern = regex.upper()
+        runs = [r for literal in required_literals(pattern) for r in re.findall(_TOKEN, literal)]
+        if not runs:
+            return df.lazy().filter(_notes_match(column, regex))
+
+        index = self._notes_index[time]
+        rows = None
+        for run in runs:
+            # a run can only occur inside a single token, one that has all of the run's trigrams
+            tokens = index.postings.keys()
+            if len(run) >= 3:
+                tokens = frozenset.intersection(*(index.trigrams.get(run[i : i + 3], frozenset()) for i in range(len(run) - 2)))
+            hits = [p for token in tokens if run in token and (p := index.postings.get(token)) is not None]
+            hits = np.unique(np.concatenate(hits)) if hits else np.zeros(0, dtype=np.uint32)
+            rows = hits if rows is None else np.intersect1d(rows, hits, assume_unique=True)
+        q = df.lazy().select(pl.all().take(pl.Series(rows.astype(np.int64) - 1, dtype=pl.UInt32)))
+        return q if re.fullmatch(_TOKEN, pattern) else q.filter(_notes_match(column, regex))
+
+    def _airdate_rows(self, time: str, lower: np.ndarray, upper: np.ndarray) -> pl.LazyFrame:
+        # each disjoint [lower, upper] day window is a binary search into the airdate index
+        df = self._df_dict[time]
+        days, order = self._date_index[time]
+        lo, hi = np.searchsorted(days, lower, 'left'), np.searchsorted(days, upper, 'right')
+        if order is None and len(lo) == 1:
+            return df.lazy().slice(int(lo[0]), int(hi[0] - lo[0]))
+
+        n = np.maximum(hi - lo, 0)
+        rows = np.arange(n.sum()) + np.repeat(lo - np.cumsum(n) + n, n)
+        if order is not None:
+            rows = np.sort(order[rows])
+        return df.lazy().select(pl.all().take(pl.Series(rows, dtype=pl.UInt32)))
+
+    @_cached_query('lineup', _lineup_args)
     def lineup_query(
         self,
         endpoints: Portion,
         time: str,
         logic: str,
         psff_quads: Sequence[tuple[frozenset[PG], frozenset[int | str], Optional[frozenset[int]], Optional[frozenset[int]]]],
+        engine: Optional[str] = None,
     ):
         q = self.endpoint_sub(endpoints, time)
-        exprs = []
-
-        for pgs, slots, flags, freqs in psff_quads:
-            e = [pl.col(f'PG{s}_p').is_in([str(pg) for pg in pgs]) for s in slots]
-
-            if flags:
-                e = [ee & has_any_flags(f'PG{s}_f', frozenset(flags)) for ee, s in zip(e, slots)]
-
-            if freqs:
-                exprs.append(sum([ee.cast(pl.UInt8) for ee in e]).is_in(tuple(freqs)))
-            else:
-                exprs.append(pl.any(e))
+        if not psff_quads:
+            # a search on notes alone
+            return q
+        elif engine == 'bitset':
+            return self._lineup_query_bitset(q, time, logic, psff_quads)
+        return q.filter(_search_expr(logic, psff_quads))
 
-        if logic == 'all':
-            total_expr = pl.all(exprs)
-        elif logic == 'any':
-            total_expr = pl.any(exprs)
-        else:
-            l = locals()
-            l |= {letter: fe for fe, letter in zip(exprs, string.ascii_uppercase)}
-            total_expr = eval(re.sub('([A-Z])', r'(\1)', logic))
+    def _lineup_query_bitset(self, q: pl.LazyFrame, time: str, logic: str, psff_quads):
+        terms = [_lineup_condition(self._lineup_index[time], *psff) for psff in psff_quads]
+        keep = _evaluate_logic(_parse_logic(logic, len(terms)), terms)
 
-        return q.filter(total_expr)
+        sub = q.collect()
+        return sub.filter(pl.Series(keep[sub.get_column('PG_n').to_numpy().astype(np.int64) - 1])).lazy()
 
-    @cachedmethod(_CACHE_GETTER, key=partial(hashkey, 'cc'))
+    @_cached_query('cc', _concurrence_args)
     def concurrence_query(
         self, endpoints: Portion, time: str, pgQueries: Tuple[PG], pgFlags: tuple[Optional[frozenset[int]]]
     ):
-        q = self.endpoint_sub(endpoints, time)
+        # rows having every PG, from each PG's slice of the playings table
+        keep = np.ones(self._df_dict[time].height + 1, dtype=bool)
+        for pg, pgf in zip(pgQueries, pgFlags):
+            played = self.playings(time, [pg])
+            if pgf:
+                played = played.filter(has_any_flags('flag', pgf))
+            keep &= self._row_mask(time, played)
+
+        sub = self.endpoint_sub(endpoints, time).collect()
+        return sub.filter(pl.Series(keep[sub.get_column('PG_n').to_numpy()])).lazy()
 
-        pgs = [str(pg) for pg in pgQueries]
-        pg_end_label = 3 if time == 'syndicated' else 6
+    @_cached_query('last', _last_playings_args)
+    def last_playings(
+        self,
+        endpoints: Portion,
+        time: str,
+        pgs: Iterable[PG],
+        nth: int,
+        flags: Optional[frozenset[int]] = None,
+        cutoff: Optional[int] = None,
+    ):
+        """PG, PROD, AIRDATE of the nth to last playing of each of pgs, with any of flags, up to PG_n cutoff.
+
+        A PG played fewer than nth times gets its first playing, one not played at all gets no row. All the PGs come from
+        one pass over their slices of the playings table, however many are asked for."""
+        q = self._playings_in(time, self.endpoint_sub(endpoints, time), pgs).lazy()
+        if cutoff:
+            q = q.filter(pl.col('PG_n') <= cutoff)
+        if flags:
+            q = q.filter(has_any_flags('flag', flags))
+
+        # reverse rank of each playing within its PG: the nth one, or the PG's first if it has fewer.
+        # a filter on the window itself would get pushed down into every slot's frame
+        return (
+            q.with_columns(
+                [
+                    pl.col('PG_n').rank('dense', descending=True).over('PG').alias('rank'),
+                    pl.min([pl.col('PG_n').n_unique().over('PG'), pl.lit(nth, pl.UInt32)]).alias('nth'),
+                ]
+            )
+            .filter(pl.col('rank') == pl.col('nth'))
+            .unique(subset='PG')
+            .select([pl.col('PG').cast(pl.Utf8), pl.col('^(PROD|AIRDATE)$')])
+        )
 
-        if not all(pgFlags):
-            q = q.with_column(pl.concat_list(pl.col(f'^PG[1-{pg_end_label}]_p$')).alias('PG_a'))
+    @_cached_query('slots', _slot_table_args)
+    def slot_table(self, time: str, by: Optional[str] = None):
+        return self._slot_agg(self.playings(time), time, by)
 
-        for pg, pgf in zip(pgs, pgFlags):
-            if pgf:
-                exprs = [(pl.col(f'PG{i}_p') == pg) & (has_any_flags(f'PG{i}_f', pgf)) for i in range(1, pg_end_label + 1)]
-                q = q.filter(pl.any(exprs))
-            else:
-                q = q.filter(pl.col('PG_a').arr.contains(pg))
+    @_cached_query('slot_counts', _endpoint_args)
+    def slot_counts(self, endpoints: Portion, time: str) -> pl.LazyFrame:
+        """slot_table(time) summed over endpoints: PG, flag, PG1..PGn, one row per (PG, flag) played in range.
 
-        return q
+        Season ranges come straight out of the cumulative slot index, a couple of array subtractions per interval."""
+        if endpoints and not _is_season(endpoints):
+            return self._slot_agg(self._playings_in(time, self.endpoint_sub(endpoints, time)).lazy(), time)
 
-    @cachedmethod(_CACHE_GETTER, key=partial(hashkey, 'slots'))
-    def slot_table(self, time: str, by: Optional[str] = None):
-        q = self._df_dict[time].lazy()
+        flags, cum = self._slot_index[time]
+        if not endpoints or time == 'primetime':
+            counts = cum[-1] - cum[0]
+        else:
+            counts = np.zeros(cum.shape[1:], dtype=cum.dtype)
+            for atomic in endpoints & P.closed(0, len(cum) - 2):
+                lower = atomic.lower + (atomic.left == P.OPEN)
+                upper = atomic.upper - (atomic.right == P.OPEN)
+                if lower <= upper:
+                    counts += cum[upper + 1] - cum[lower]
 
-        vc_subset = [[f'PG{i}_p', f'PG{i}_f'] for i in range(1, 4 if time == 'syndicated' else 7)]
-        if by:
-            for vc in vc_subset:
-                vc.insert(0, by)
+        return _slot_count_frame(counts, flags)
 
-        gs = [
-            q.groupby(vc).agg(pl.count()).rename({f'PG{i}_p': 'PG', f'PG{i}_f': 'flag', 'count': f'PG{i}'})
-            for i, vc in enumerate(vc_subset, 1)
-        ]
-        return reduce(
-            lambda g1, g2: g1.join(g2, on=[by, 'PG', 'flag'] if by else ['PG', 'flag'], how='outer'), gs
-        ).with_columns(
-            [
-                pl.col('PG').cast(pl.Categorical).cat.set_ordering('lexical'),
-                pl.col('^PG\d$').fill_null(strategy='zero'),
-            ]
+    @staticmethod
+    def _slot_agg(playings: pl.LazyFrame, time: str, by: Optional[str] = None):
+        # cast before summing, a grouped sum of booleans miscounts in polars 0.16
+        return (
+            playings.groupby([by, 'PG', 'flag'] if by else ['PG', 'flag'])
+            .agg([(pl.col('slot') == i).cast(pl.UInt32).sum().alias(f'PG{i}') for i in range(1, 4 if time == 'syndicated' else 7)])
+            .with_column(pl.col('PG').cast(pl.Categorical).cat.set_ordering('lexical'))
+        )
+
+    def _pair_counts(self, endpoints: Portion, time: str):
+        tensor = self._pair_index[time]
+        if not endpoints or (_is_season(endpoints) and time == 'primetime'):
+            return tensor.sum(axis=0, dtype=np.int64)
+        elif _is_season(endpoints):
+            seasons = list(P.iterate(endpoints & P.closed(0, len(tensor) - 1), step=1))
+            return tensor[seasons].sum(axis=0, dtype=np.int64)
+
+        # dates: seasons entirely inside the range come from the index, only the partial ones are scanned.
+        sub = self.endpoint_sub(endpoints, time).collect()
+        if 'S' not in sub.columns:
+            return _pg_pair_counts(_pg_ordinals(sub))
+        full = (
+            sub.groupby('S')
+            .agg(pl.count())
+            .join(self._df_dict[time].groupby('S').agg(pl.count().alias('total')), on='S')
+            .filter(pl.col('count') == pl.col('total'))
+            .get_column('S')
+            .to_list()
+        )
+        return tensor[full].sum(axis=0, dtype=np.int64) + _pg_pair_counts(
+            _pg_ordinals(sub.filter(~pl.col('S').is_in(full)))
+        )
+
+    def _indexed(
+        self,
+        frames: dict,
+        times: Iterable[str] = SNAPSHOT_TIMES,
+        seasons: Optional[Iterable[int]] = None,
+        notes: Optional[dict] = None,
+    ) -> _SheetState:
+        """A new state of frames, times reindexed and the rest of the indexes carried over from the current state.
+
+        seasons are the only daytime seasons that changed, if known: odds fitted to windows without them are kept.
+        notes are _NotesIndex already brought up to date with frames, by time.
+        Nothing is published, the current state stays as it was until _publish."""
+        old = self._state
+        lineup_odds = old.lineup_odds
+        if 'daytime' in times:
+            lineup_odds = {
+                window: odds
+                for window, odds in old.lineup_odds.items()
+                if seasons is not None and not any(s in window for s in seasons)
+            }
+        pairs, slots, dates, lineups, playings, notes_index = (
+            dict(d) for d in (old.pairs, old.slots, old.dates, old.lineups, old.playings, old.notes)
+        )
+        for time in times:
+            df = frames[time]
+            ords = _pg_ordinals(df)
+            seasons = df.get_column('S').fill_null(0).to_numpy() if 'S' in df.columns else np.zeros(df.height, dtype=int)
+
+            tensor = np.zeros((int(seasons.max(initial=0)) + 1, len(PG), len(PG)), dtype=np.uint16)
+            for season in np.unique(seasons):
+                tensor[season] = _pg_pair_counts(ords[seasons == season])
+            pairs[time] = tensor
+
+            flags, flag_idx = np.unique(df.select(pl.col('^PG\d_f$')).to_numpy(), return_inverse=True)
+            counts = np.zeros((len(tensor), len(PG) + 1, len(flags), ords.shape[1]), dtype=np.int32)
+            np.add.at(
+                counts,
+                (seasons[:, None], ords, flag_idx.reshape(ords.shape), np.arange(ords.shape[1])[None, :]),
+                1,
+            )
+            cum = np.zeros((len(counts) + 1, *counts.shape[1:]), dtype=np.int32)
+            np.cumsum(counts, axis=0, out=cum[1:])
+            slots[time] = flags, cum
+            pg_flags = df.select(pl.col('^PG\d_f$').fill_null(0)).to_numpy().astype(np.int64)
+            lineups[time] = _lineup_bitsets(ords, pg_flags)
+            playings[time] = _long_playings(df, ords, pg_flags)
+
+            if 'AIRDATE' in df.columns and df.height and not df.get_column('AIRDATE').is_null().any():
+                days = df.get_column('AIRDATE').to_physical().to_numpy().astype(np.int64)
+                order = np.argsort(days, kind='stable')
+                dates[time] = days[order], None if (order == np.arange(len(order))).all() else order
+            else:
+                dates.pop(time, None)
+
+            if notes and time in notes:
+                notes_index[time] = notes[time]
+            elif column := _NOTES_COLUMNS.get(time):
+                # most updates leave the notes alone, and the row numbers along with them
+                indexed = notes_index.get(time)
+                if not (indexed and indexed.notes.series_equal(df.get_column(column).cast(pl.Utf8), null_equal=True)):
+                    notes_index[time] = _build_notes_index(df, column)
+        return _SheetState(
+            dict(frames),
+            pairs,
+            slots,
+            dates,
+            lineups,
+            playings,
+            notes_index,
+            lineup_odds,
+            old.generation,
         )
 
     def load_excel(self, fn='Price_is_Right_Frequency.xlsx'):
@@ -425,30 +1663,108 @@ class ConflictSheet:
     def _reset_excel(self):
         self.excel_fp.seek(0)
 
-    def load_pickle(self, fn='df_dict.pickle'):
-        with self.load_func(fn) as f:
-            self._df_dict = pickle.load(f)
+    def _snapshot_path(self, fn):
+        return os.path.join(self.snapshot_dir, fn)
 
-    def update(self, prodNumber, pgps, append, airdate, intended_date, notes):
-        if not self.excel_fp:
-            self.load_excel()
+    def _read_local_manifest(self):
+        try:
+            with open(self._snapshot_path('manifest.json'), 'rb') as f:
+                return orjson.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _write_local(self, fn, data: bytes):
+        # write to the side and swap in, so frames still memory-mapped from the old file are left intact.
+        tmp = self._snapshot_path(fn + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._snapshot_path(fn))
+
+    def load_snapshot(self):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        manifest = self._read_local_manifest()
 
-        f_book = openpyxl.load_workbook(self.excel_fp)
+        try:
+            with self.load_func(f'{self.snapshot_dir}/manifest.json') as f:
+                remote_manifest = orjson.loads(f.read())
+        except Exception as e:
+            # no remote copy (or offline), the local snapshot is all there is
+            _log.warning(f'could not fetch remote cs snapshot manifest: {e}')
+            remote_manifest = None
+
+        if remote_manifest and remote_manifest != manifest:
+            for time in SNAPSHOT_TIMES:
+                with self.load_func(f'{self.snapshot_dir}/{time}.ipc') as f:
+                    self._write_local(f'{time}.ipc', f.read())
+            self._write_local('manifest.json', orjson.dumps(remote_manifest))
+            manifest = remote_manifest
+
+        if not manifest:
+            raise FileNotFoundError('no cs snapshot available')
+        if manifest['version'] != SNAPSHOT_VERSION:
+            raise SnapshotMismatch(f"snapshot version {manifest['version']}, expected {SNAPSHOT_VERSION}")
+
+        df_dict = {time: pl.read_ipc(self._snapshot_path(f'{time}.ipc'), memory_map=True, rechunk=False) for time in SNAPSHOT_TIMES}
+        # memory-mapped, nothing is read past the IPC footer before this
+        for time, schema in self._built_schemas(df_dict).items():
+            if list(df_dict[time].schema.items()) != list(schema.items()):
+                raise SnapshotMismatch(f'{time} snapshot columns are not what the frames are built as now')
+
+        self.notes = manifest['notes']
+        self._workbook_hash = manifest.get('workbook')
+        self._publish(self._indexed(df_dict))
+        fitted = manifest.get('lineup_odds')
+        if fitted and fitted['seasons'] == str(LINEUP_ODDS_SEASONS) and fitted['odds'].keys() == GEN_LINEUP_ODDS.keys():
+            self._lineup_odds[LINEUP_ODDS_SEASONS] = fitted['odds']
+
+    def save_snapshot(self, df_dict: Optional[dict[str, pl.DataFrame]] = None, workbook_hash: Optional[str] = None):
+        state = self._state
+        df_dict = df_dict or state.frames
+        # the current odds still hold if these are the current daytime lineups, and they are fitted at most once for them
+        if state.frames.get('daytime') is df_dict['daytime']:
+            odds = state.lineup_odds.get(LINEUP_ODDS_SEASONS)
+            if odds is None:
+                odds = state.lineup_odds[LINEUP_ODDS_SEASONS] = _fit_lineup_odds(df_dict['daytime'], LINEUP_ODDS_SEASONS)
+        else:
+            odds = _fit_lineup_odds(df_dict['daytime'], LINEUP_ODDS_SEASONS)
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'built': datetime.now().isoformat(),
+            'notes': self.notes,
+            'workbook': workbook_hash,
+            'lineup_odds': {
+                'seasons': str(LINEUP_ODDS_SEASONS),
+                'odds': odds,
+            },
+        }
+
+        for time in SNAPSHOT_TIMES:
+            with io.BytesIO() as b:
+                # IPC files can only be memory-mapped uncompressed.
+                df_dict[time].write_ipc(b, compression='uncompressed')
+                self._write_local(f'{time}.ipc', b.getvalue())
+                b.seek(0)
+                self.save_func(b, f'{self.snapshot_dir}/{time}.ipc')
+
+        m = orjson.dumps(manifest)
+        self._write_local('manifest.json', m)
+        with io.BytesIO(m) as b:
+            self.save_func(b, f'{self.snapshot_dir}/manifest.json')
 
-        isPrimetime = prodNumber.endswith('SP')
+    def update(self, prodNumber, pgps, append, airdate, intended_date, notes):
+        """Applies a lineup (or airdate/notes) edit straight to the in-memory frames.
 
-        f_sheet = f_book['Calendar']
-        EXCEL_COLORS = [f_sheet[f'N{i}'].fill for i in range(2, 10)]
-        EMPTY_FILL = f_sheet['A1'].fill
-        if isPrimetime:
-            f_sheet = f_book['Primetime']
+        Writing the workbook is queued on the persistence thread, the returned future resolves once done. The snapshot is
+        written _SNAPSHOT_DELAY seconds after the last of a burst of edits, once for all of them."""
+        isPrimetime = prodNumber.endswith('SP')
+        time = 'primetime' if isPrimetime else 'daytime'
+        df = self._df_dict[time]
 
+        # the sheet row is computed against the frames before this edit, the persistence thread works through edits in order.
         if not append:
             row_idx, _, retro_ts = (
-                self._df_dict['primetime' if isPrimetime else 'daytime']
-                .select(pl.col('^(PROD|INT. DATE)$'))
-                .with_row_count()
-                .row(by_predicate=pl.col('PROD') == prodNumber)
+                df.select(pl.col('^(PROD|INT. DATE)$')).with_row_count().row(by_predicate=pl.col('PROD') == prodNumber)
             )
 
             idx = 2 + row_idx
@@ -456,18 +1772,151 @@ class ConflictSheet:
                 idx += self._df_dict['unaired'].filter(pl.col('INT. DATE') < retro_ts).height
         else:
             if isPrimetime:
-                idx = 2 + self._df_dict['primetime'].height
+                row_idx = df.height
+                idx = 2 + row_idx
             else:
-                sorted_index = [
-                    SORT_PROD(i) for i in self._df_dict['daytime'].to_series().to_list() if i not in UNAIRED_DUPLICATES
-                ]
+                prods = df.to_series().to_list()
+                sorted_index = [SORT_PROD(i) for i in prods if i not in UNAIRED_DUPLICATES]
                 idx = (
                     2
                     + len(UNAIRED_DUPLICATES)
                     + self._df_dict['unaired'].height
-                    + bisect.bisect(sorted_index, prodNumber[4] + prodNumber[:4], lo=len(sorted_index) - 250)
+                    + bisect.bisect(sorted_index, SORT_PROD(prodNumber), lo=max(0, len(sorted_index) - 250))
                 )
+                row_idx = bisect.bisect([SORT_PROD(i) for i in prods], SORT_PROD(prodNumber), lo=max(0, len(prods) - 250))
 
+        old_row = None if append else df.row(row_idx, named=True)
+        # the persistence thread only ever writes to a workbook that is already loaded
+        if not self.excel_fp:
+            self.load_excel()
+        # the frames are now ahead of any workbook that was parsed
+        self._workbook_hash = None
+        new_df, notes_index = self._apply_update(
+            df, row_idx, old_row, prodNumber, pgps, airdate, intended_date, notes, self._notes_index.get(time)
+        )
+        season = CURRENT_SEASON if append or isPrimetime else old_row['S']
+        # indexed to the side, queries running meanwhile carry on with the old state
+        state = self._indexed({**self._df_dict, time: new_df}, [time], [season], {time: notes_index})
+        with self._persist_lock:
+            self._publish(
+                state,
+                partial(
+                    self._invalidate,
+                    time,
+                    season,
+                    [d for d in (airdate, old_row and old_row['AIRDATE']) if d],
+                    # a row inserted before the end renumbers PG_n of every row after it
+                    renumbered=append and row_idx < df.height,
+                ),
+            )
+            self._persisted = self._persist_executor.submit(
+                self._persist_update, idx, prodNumber, pgps, append, airdate, intended_date, notes
+            )
+            persisted = self._persisted
+            self._schedule_snapshot()
+        return persisted
+
+    @staticmethod
+    def _apply_update(df, row_idx, old_row, prodNumber, pgps, airdate, intended_date, notes, notes_index):
+        """df with the edit applied, and notes_index (the _NotesIndex of df) edited along with it."""
+        notes_col = 'SPECIAL' if 'SPECIAL' in df.columns else 'NOTES'
+        as_date = lambda d: d.date() if isinstance(d, datetime) else d
+
+        if old_row:
+            # a copy, update still needs the row as it was
+            row = dict(old_row)
+        else:
+            row = {'PROD': prodNumber, 'AIRDATE': as_date(airdate), 'INT. DATE': as_date(airdate)}
+            if notes_col == 'SPECIAL':
+                row['SPECIAL'] = 'TPIR@N – '
+            else:
+                row['S'] = CURRENT_SEASON
+
+        if pgps:
+            for i, pgp in enumerate(pgps, 1):
+                # mirror what initialize would read back out of the cell written by _persist_update
+                row[f'PG{i}'] = str(PGPlaying(pgp.pg_str if old_row else str(pgp.pg), pgp.flag))
+                row[f'PG{i}_p'] = str(pgp.pg)
+                row[f'PG{i}_f'] = pgp.flag
+        else:
+            if airdate:
+                row['AIRDATE'] = as_date(airdate)
+            if intended_date:
+                row['INT. DATE'] = as_date(intended_date)
+            if notes is not None:
+                row[notes_col] = notes or None
+
+        new_row = pl.DataFrame([pl.Series(col, [row.get(col)], dtype=dtype) for col, dtype in df.schema.items()])
+        new_df = pl.concat([df.slice(0, row_idx), new_row, df.slice(row_idx + (1 if old_row else 0))]).with_column(
+            _pg_n(df.height + (0 if old_row else 1))
+        )
+        notes_index = _edit_notes_index(
+            notes_index,
+            new_df.get_column(notes_col).cast(pl.Utf8),
+            row_idx + 1,
+            old_row and old_row[notes_col],
+            row.get(notes_col),
+            not old_row and row_idx < df.height,
+        )
+        return new_df, notes_index
+
+    def _invalidate(self, time: str, season: int, airdates: Sequence[date], renumbered: bool = False):
+        # cached results for other times, other seasons or date ranges not covering the edit stay valid,
+        # unless the edit renumbered rows: then everything of time is.
+        airdates = [datetime.combine(d, datetime.min.time()) if type(d) is date else d for d in airdates]
+        with self._cache_lock:
+            for k in list(self.cache.keys()):
+                if k.prefix == 'result':
+                    # only ever looked up under the current generation
+                    continue
+                # queries without endpoints (slot_table) cover all of time
+                endpoints = getattr(k.args, 'endpoints', None)
+                stale = k.args.time == time and (
+                    renumbered
+                    or not endpoints
+                    or (season in endpoints if _is_season(endpoints) else any(d in endpoints for d in airdates))
+                )
+                if stale:
+                    del self.cache[k]
+
+    def _schedule_snapshot(self):
+        # under _persist_lock. every edit pushes the write back, so a burst of them is written once.
+        if self._snapshot_timer:
+            self._snapshot_timer.cancel()
+        self._snapshot_timer = threading.Timer(self._SNAPSHOT_DELAY, self._queue_snapshot)
+        self._snapshot_timer.daemon = True
+        self._snapshot_timer.start()
+
+    def _queue_snapshot(self):
+        with self._persist_lock:
+            if self._snapshot_timer:
+                self._snapshot_timer.cancel()
+                self._snapshot_timer = None
+            # queued behind the workbook writes of every published edit, so the workbook it hashes holds all of them
+            self._persisted = self._persist_executor.submit(self._save_update_snapshot, dict(self._df_dict))
+
+    def _save_update_snapshot(self, df_dict):
+        self.save_snapshot(df_dict, _workbook_hash(self.excel_fp))
+
+    def flush(self):
+        # a snapshot still waiting out its delay is written now
+        if self._snapshot_timer:
+            self._queue_snapshot()
+        if self._persisted:
+            wait([self._persisted])
+
+    def _persist_update(self, idx, prodNumber, pgps, append, airdate, intended_date, notes):
+        f_book = openpyxl.load_workbook(self.excel_fp)
+
+        isPrimetime = prodNumber.endswith('SP')
+
+        f_sheet = f_book['Calendar']
+        EXCEL_COLORS = [f_sheet[f'N{i}'].fill for i in range(2, 10)]
+        EMPTY_FILL = f_sheet['A1'].fill
+        if isPrimetime:
+            f_sheet = f_book['Primetime']
+
+        if append:
             f_sheet.insert_rows(idx)
 
             for c in 'ABCDEFGHIJKL':
@@ -513,159 +1962,171 @@ class ConflictSheet:
         f_book.save(self.excel_fp)
         self._reset_excel()
 
-    @staticmethod
-    def _parse_sheet(workbook: pd.ExcelFile, sheetName, usecols):
-        return workbook.parse(sheet_name=sheetName, index_col=0, usecols=usecols, converters=conv_dict, skipfooter=1)
+        self.save_excel()
 
     @staticmethod
-    def _fill_in_flags(dff, fs, col, col_adjust, ec):
-        # this method has a lot of (odd-looking) microadjustments since it's run concurrently 3 times / a big factor in loading time
-        # d = dff.to_dict('records')
-        for i, ep in enumerate(fs.iter_rows(min_row=2, max_row=len(dff.index) + 1, min_col=col, max_col=col + col_adjust)):
-            for s, cell in enumerate(ep, -(col_adjust + 1)):
-                # try:
-                # 	if dff.iloc[i][f'PG{s}'].flag & 2**_pf_bit('?'):	# game uncertainty needs no further checking
-                # 		continue
-                # except AttributeError:	# nan - no playing here
-                # 	continue
-
-                if cell.fill.start_color.rgb in ec:  # and not dff.iloc[i][f'PG{s}'].flag:
-                    if not (dff.iat[i, s].flag & 2 ** _pf_bit('?')):
-                        dff.iat[i, s].flag |= 2 ** (ec[cell.fill.start_color.rgb])
-                # elif color.rgb not in ('FFFFFFFF', '00000000', 'FF7F7F7F'):
-                # print(cell)
-                # print(color)
-
-                if cell.font.color and cell.font.color.rgb != 'FF000000':
-                    try:
-                        dff.iat[i, s].flag |= 2 ** (ec[cell.font.color.rgb])
-                    except KeyError:
-                        dff.iat[i, s].flag |= 2 ** _pf_bit('MDG')
+    def _build_frame(names, rows, bits):
+        """One sheet's rows and (row, slot, fill/font) flag bits to PROD, [S], [dates], [NOTES/SPECIAL], PGi, PGi_p, PGi_f."""
+        raw = dict(zip(names, zip(*rows))) if rows else {n: () for n in names}
+        pg_cols = [n for n in names if re.fullmatch(r'PG\d', n)]
+
+        cols = [pl.Series('PROD', [None if v is None else str(v) for v in raw['PROD']], dtype=pl.Utf8)]
+        if 'S' in raw:
+            cols.append(pl.Series('S', raw['S'], dtype=pl.Int64).cast(pl.UInt8))
+        for c in ('AIRDATE', 'INT. DATE'):
+            if c in raw:
+                cols.append(pl.Series(c, [_xlsx_date(v) for v in raw[c]], dtype=pl.Date))
+        for c in ('NOTES', 'SPECIAL'):
+            if c in raw:
+                cols.append(pl.Series(c, [None if v is None else str(v) for v in raw[c]], dtype=pl.Utf8))
+
+        pg_strs, flags = [], []
+        for s, c in enumerate(pg_cols):
+            pg = pl.Series(c, [None if v is None else str(v) for v in raw[c]], dtype=pl.Utf8)
+            empty = pg.is_null().to_numpy()
+            none = (pg == '-').fill_null(False).to_numpy()
+            unc = (pg.str.starts_with('*') & pg.str.ends_with('*')).fill_null(False).to_numpy()
+
+            # an empty cell is an unknown game, game uncertainty needs no color checking but font colors still apply.
+            flag = np.where(empty, 1, np.where(unc, 2 ** _pf_bit('?'), 0)).astype(np.uint16)
+            flag |= np.where(unc, 0, bits[:, s, 0]) | bits[:, s, 1]
+            flag[none] = 2**15
+            flags.append(pl.Series(f'{c}_f', flag, dtype=pl.UInt16))
+
+            pg_strs.append(
+                pl.DataFrame([pg, pl.Series('empty', empty), pl.Series('none', none), pl.Series('unc', unc)])
+                .select(
+                    pl.when(pl.col('empty'))
+                    .then(pl.lit(str(PG._UNKNOWN)))
+                    .when(pl.col('none'))
+                    .then(pl.lit(None, dtype=pl.Utf8))
+                    .when(pl.col('unc'))
+                    .then(pl.col(c).str.extract(r'(?s)^\*(.*)\*$', 1))
+                    .otherwise(pl.col(c))
+                    .alias(c)
+                )
+                .to_series()
+            )
+
+        # naming and display strings only depend on (string, flag), of which there are a few hundred at most.
+        combos = (
+            pl.concat([pl.DataFrame([p.alias('pg_str'), f.alias('flag')]) for p, f in zip(pg_strs, flags)])
+            .drop_nulls()
+            .unique()
+        )
+        display, name = zip(*(_pg_names(*r) for r in combos.rows())) if combos.height else ((), ())
+        names_df = combos.with_columns(
+            [pl.Series('display', display, dtype=pl.Utf8), pl.Series('name', name, dtype=pl.Utf8)]
+        )
+
+        df = pl.DataFrame(cols + pg_strs + flags)
+        for c in pg_cols:
+            df = df.join(
+                names_df.rename({'pg_str': c, 'flag': f'{c}_f', 'display': f'{c}_d', 'name': f'{c}_p'}),
+                on=[c, f'{c}_f'],
+                how='left',
+            )
+        return df.select(
+            [
+                pl.col('^(PROD|S|AIRDATE|INT. DATE|NOTES|SPECIAL)$'),
+                *[pl.col(f'{c}_d').cast(pl.Categorical).alias(c) for c in pg_cols],
+                *[pl.col(f'{c}_p').cast(pl.Categorical) for c in pg_cols],
+                *[pl.col(f'{c}_f') for c in pg_cols],
+            ]
+        )
 
     def _reset_caches(self):
-        self.endpoint_sub.cache_clear(self)
-        self.lineup_query.cache_clear(self)
-        self.concurrence_query.cache_clear(self)
-        self.slot_table.cache_clear(self)
+        with self._cache_lock:
+            self.cache.clear()
 
     def initialize(self):
-        self._df_dict.clear()
-        self._reset_caches()
-        # print(datetime.datetime.now())
-        # openpyxl.load_workbook(self.excel_fp, read_only=True, data_only=True, keep_links=False)
-        with pd.ExcelFile(self.excel_fp, engine='openpyxl') as xlsx, ThreadPoolExecutor() as executor:
-            # dtype={'S':pd.CategoricalDtype(categories=range(1,CURRENT_SEASON+1), ordered=True)
-
-            df_args = [(xlsx, 'Calendar', 'A:B,D:L'), (xlsx, 'Primetime', 'A:J'), (xlsx, 'Syndication', 'A:E')]
-            futures = [executor.submit(ConflictSheet._parse_sheet, *dfa) for dfa in df_args]
-            df_daytime, df_primetime, df_syndicated = [f.result() for f in futures]
-            # print(datetime.datetime.now())
-            df_primetime.dropna(subset=['AIRDATE'], inplace=True)
-
-            # read background colors and adjust
-            f_book = xlsx.book
-            f_sheet = f_book['Calendar']
-            EXCEL_COLORS = {f_sheet[f'N{i}'].fill.start_color.rgb: i - 2 for i in range(2, 10)}
-
-            # read notes
-            self.notes = '\n'.join('-' + f_sheet[f'AA{i}'].value for i in range(2, 9))
-            # print(datetime.datetime.now())
-            df_args = [
-                (df_daytime, f_sheet, 7, 5, EXCEL_COLORS),
-                (df_primetime, f_book['Primetime'], 5, 5, EXCEL_COLORS),
-                (df_syndicated, f_book['Syndication'], 3, 2, EXCEL_COLORS),
-            ]
-            futures = [executor.submit(ConflictSheet._fill_in_flags, *dfa) for dfa in df_args]
-            [f.result() for f in futures]
-            # print(datetime.datetime.now())
+        workbook_hash = _workbook_hash(self.excel_fp)
+        if workbook_hash == self._workbook_hash and self._df_dict:
+            _log.info('cs workbook unchanged, keeping current frames')
+            return
 
-        self._reset_excel()
+        self._reset_caches()
 
-        # split into unaired, copy
-        df_unaired = df_daytime[df_daytime.apply(lambda r: pd.isnull(r['AIRDATE']), axis=1)].copy(deep=True)
-        df_daytime.drop(index=df_unaired.index, inplace=True)
-
-        # raw info
-        df_daytime_info = (
-            df_daytime.loc[:, 'PG1':'PG6']
-            .applymap(lambda v: v.pg if pd.notna(v) else np.nan)
-            .join(
-                df_daytime.loc[:, 'PG1':'PG6'].applymap(lambda v: v.flag if pd.notna(v) else 2**15).astype('uint16'),
-                rsuffix='_f',
-            )
-            .astype('category')
-        )
-        df_primetime_info = (
-            df_primetime.loc[:, 'PG1':'PG6']
-            .applymap(lambda v: v.pg if pd.notna(v) else np.nan)
-            .join(
-                df_primetime.loc[:, 'PG1':'PG6'].applymap(lambda v: v.flag if pd.notna(v) else 2**15).astype('uint16'),
-                rsuffix='_f',
-            )
-            .astype('category')
-        )
-        df_unaired_info = (
-            df_unaired.loc[:, 'PG1':'PG6']
-            .applymap(lambda v: v.pg if pd.notna(v) else np.nan)
-            .join(
-                df_unaired.loc[:, 'PG1':'PG6'].applymap(lambda v: v.flag if pd.notna(v) else 2**15).astype('uint16'),
-                rsuffix='_f',
-            )
-            .astype('category')
-        )
-        df_syndicated_info = (
-            df_syndicated.loc[:, 'PG1':'PG3']
-            .applymap(lambda v: v.pg if pd.notna(v) else np.nan)
-            .join(
-                df_syndicated.loc[:, 'PG1':'PG3'].applymap(lambda v: v.flag if pd.notna(v) else 2**15).astype('uint16'),
-                rsuffix='_f',
-            )
-            .astype('category')
-        )
+        frames = {}
+        EXCEL_COLORS = {}
+        with zipfile.ZipFile(self.excel_fp) as zf:
+            sheet_paths, epoch = _xlsx_workbook(zf)
+            common_key = _xlsx_member_key(zf, 'xl/workbook.xml', 'xl/styles.xml', 'xl/sharedStrings.xml')
+            shared_strings = styles = None
+
+            # Calendar goes first: its legend colors are part of the other sheets' keys.
+            for sheetName, columns in _SHEET_COLUMNS.items():
+                key = (_xlsx_member_key(zf, sheet_paths[sheetName]), common_key, tuple(EXCEL_COLORS.items()))
+                if (cached := self._sheet_cache.get(sheetName)) and cached[0] == key:
+                    _, frame, colors, notes = cached
+                    _log.info(f'cs sheet {sheetName} unchanged, reusing parsed frame')
+                else:
+                    if styles is None:
+                        shared_strings, styles = _xlsx_shared_strings(zf), _xlsx_styles(zf)
+                    names, rows, xf, extra = _xlsx_read_sheet(
+                        zf,
+                        sheet_paths[sheetName],
+                        columns,
+                        shared_strings,
+                        styles,
+                        epoch,
+                        _CALENDAR_EXTRA if sheetName == 'Calendar' else (),
+                    )
+
+                    # read background colors and notes
+                    if sheetName == 'Calendar':
+                        colors = {styles.fill_rgb[extra[f'N{i}'][1]]: i - 2 for i in range(2, 10)}
+                        notes = '\n'.join('-' + extra[f'AA{i}'][0] for i in range(2, 9))
+                    else:
+                        colors, notes = EXCEL_COLORS, self.notes
 
-        # now that all dfs have been built, can replace PGPlaying object with static category strings
-        for i in range(1, 7):
-            df_daytime[f'PG{i}'] = df_daytime[f'PG{i}'].apply(lambda v: str(v) if pd.notna(v) else np.nan).astype('category')
-            df_primetime[f'PG{i}'] = (
-                df_primetime[f'PG{i}'].apply(lambda v: str(v) if pd.notna(v) else np.nan).astype('category')
-            )
-            df_unaired[f'PG{i}'] = df_unaired[f'PG{i}'].apply(lambda v: str(v) if pd.notna(v) else np.nan).astype('category')
-            if i <= 3:
-                df_syndicated[f'PG{i}'] = (
-                    df_syndicated[f'PG{i}'].apply(lambda v: str(v) if pd.notna(v) else np.nan).astype('category')
-                )
-        df_daytime['NOTES'] = df_daytime['NOTES'].astype('category')
-        df_primetime['SPECIAL'] = df_primetime['SPECIAL'].astype('category')
+                    n_slots = sum(1 for n in names if re.fullmatch(r'PG\d', n))
+                    frame = self._build_frame(names, rows, _xlsx_style_bits(styles, colors)[xf][:, -n_slots:])
+                    self._sheet_cache[sheetName] = key, frame, colors, notes
 
-        # build public dict: polars
+                if sheetName == 'Calendar':
+                    EXCEL_COLORS, self.notes = colors, notes
+                frames[sheetName] = frame
+        self._reset_excel()
 
-        for time in ('daytime', 'primetime', 'syndicated', 'unaired'):
-            df = eval(f'df_{time}')
+        self._set_frames(*frames.values())
+        self._workbook_hash = workbook_hash
+        self._persisted = self._persist_executor.submit(self.save_snapshot, dict(self._df_dict), workbook_hash)
 
-            cols = [
-                pl.col('PROD'),
-                pl.col('^.*DATE$').cast(pl.Date),
-                pl.arange(1, len(df) + 1).cast(pl.UInt16).alias('PG_n'),
-                pl.col('^PG\d$').cast(pl.Categorical),
-            ]
+    def _set_frames(self, df_daytime: pl.DataFrame, df_primetime: pl.DataFrame, df_syndicated: pl.DataFrame):
+        """Calendar, Primetime and Syndication frames as built by _build_frame into the four time frames, and index them."""
+        self._publish(self._indexed(self._split_frames(df_daytime, df_primetime, df_syndicated)))
 
-            if time != 'primetime':
-                cols.insert(1, pl.col('S').cast(pl.UInt8))
-            if time != 'syndicated':
-                cols.insert(len(cols) - 2, pl.col('^(NOTES|SPECIAL)$'))
-
-            self._df_dict[time] = (
-                pl.from_pandas(df.reset_index())
-                .select(cols)
-                .hstack(
-                    pl.from_pandas(eval(f'df_{time}_info').applymap(lambda v: str(v) if type(v) is PG else v))
-                    .select(pl.exclude('S'))
-                    .with_columns([pl.col('^PG\d$').cast(pl.Categorical), pl.col('^PG\d_f$').cast(pl.UInt16)])
-                    .rename({f'PG{i}': f'PG{i}_p' for i in range(1, 4 if time == 'syndicated' else 7)})
-                )
+    @staticmethod
+    def _split_frames(df_daytime: pl.DataFrame, df_primetime: pl.DataFrame, df_syndicated: pl.DataFrame):
+        # split into unaired, only the aired frames get categorical notes
+        frames = {
+            'daytime': df_daytime.filter(pl.col('AIRDATE').is_not_null()).with_column(pl.col('NOTES').cast(pl.Categorical)),
+            'primetime': df_primetime.filter(pl.col('AIRDATE').is_not_null()).with_column(
+                pl.col('SPECIAL').cast(pl.Categorical)
+            ),
+            'syndicated': df_syndicated,
+            'unaired': df_daytime.filter(pl.col('AIRDATE').is_null()),
+        }
+
+        for time, df in frames.items():
+            frames[time] = df.select(
+                [
+                    pl.col('^(PROD|S|AIRDATE|INT. DATE|NOTES|SPECIAL)$'),
+                    _pg_n(df.height),
+                    pl.all().exclude('^(PROD|S|AIRDATE|INT. DATE|NOTES|SPECIAL)$'),
+                ]
             )
+        return frames
+
+    @classmethod
+    def _built_schemas(cls, df_dict: dict[str, pl.DataFrame]):
+        """The schema each time's frame would be built with now, out of sheets with the same headers and row counts."""
+        headers = {time: [c for c in df.columns if not re.fullmatch(r'PG_n|PG\d_[pf]', c)] for time, df in df_dict.items()}
+
+        def empty(names):
+            n_slots = sum(1 for n in names if re.fullmatch(r'PG\d', n))
+            return cls._build_frame(names, [], np.zeros((0, n_slots, 2), dtype=np.uint16))
 
-        with io.BytesIO() as dfd_ip:
-            pickle.dump(self._df_dict, dfd_ip)
-            dfd_ip.seek(0)
-            self.save_func(dfd_ip, 'df_dict.pickle')
+        built = cls._split_frames(empty(headers['daytime']), empty(headers['primetime']), empty(headers['syndicated']))
+        return {time: {**built[time].schema, 'PG_n': _pg_n_dtype(df_dict[time].height)} for time in SNAPSHOT_TIMES}
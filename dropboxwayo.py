@@ -3,7 +3,7 @@ from contextlib import closing
 from datetime import datetime
 
 import dropbox
-from dropbox.files import WriteMode
+from dropbox.files import FileMetadata, WriteMode
 
 _log = logging.getLogger('wayo_log')
 
@@ -25,6 +25,14 @@ class DropboxWayo:
         with closing(res) as r:
             return r.text if path.endswith('.txt') or path.endswith('.html') else r.content
 
+    def content_hashes(self, path):
+        res = self.dbx.files_list_folder(path)
+        entries = list(res.entries)
+        while res.has_more:
+            res = self.dbx.files_list_folder_continue(res.cursor)
+            entries.extend(res.entries)
+        return {e.name: e.content_hash for e in entries if isinstance(e, FileMetadata)}
+
     def update_str(self, sf, path, append, notify=True):
         a = self.download(path)
         assert not a or (type(a) is str and type(sf) is str)
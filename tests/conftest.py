@@ -0,0 +1,141 @@
+import io
+import os
+import random
+import sys
+from datetime import datetime
+
+import openpyxl
+import polars as pl
+import pytest
+from openpyxl.styles import Font, PatternFill
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_conflictsheet import synthetic_frames
+from conflictsheet import ConflictSheet
+from pg import PG
+
+# the bot runs with the global string cache on, edits concat categoricals built apart
+pl.toggle_string_cache(True)
+
+# Calendar's legend colors, N2:N9
+LEGEND = ['FFFF0000', 'FF00FF00', 'FF0000FF', 'FFFFFF00', 'FFFF00FF', 'FF00FFFF', 'FF7F7F00', 'FF007F7F']
+# a font color that is no legend color, the Million Dollar Game's
+MDG_FONT = 'FF123456'
+
+
+@pytest.fixture(scope='session')
+def frames():
+    random.seed(0)
+    return synthetic_frames(12)
+
+
+@pytest.fixture
+def cs(frames):
+    cs = ConflictSheet(None, None, frames=frames)
+    # edits go nowhere
+    cs.excel_fp = io.BytesIO()
+    cs._persist_update = lambda *args: None
+    cs._SNAPSHOT_DELAY = 3600
+    return cs
+
+
+@pytest.fixture(scope='session')
+def bot_config():
+    # the tables wayo.py sets up for every cog
+    (
+        pl.Config.set_tbl_cols(-1)
+        .set_tbl_rows(-1)
+        .set_tbl_width_chars(1_000)
+        .set_fmt_str_lengths(100)
+        .set_tbl_formatting('NOTHING')
+        .set_tbl_cell_alignment('RIGHT')
+        .set_tbl_hide_dataframe_shape()
+        .set_tbl_hide_column_data_types()
+        .set_tbl_hide_dtype_separator()
+    )
+    yield
+    pl.Config.restore_defaults()
+
+
+def _pg_cell(rng: random.Random, names):
+    roll = rng.random()
+    if roll < 0.05:
+        return None
+    elif roll < 0.1:
+        return '-'
+    elif roll < 0.15:
+        return f'*{rng.choice(names)}*'
+    return rng.choice(names)
+
+
+def _style_pg_cell(rng: random.Random, cell):
+    if rng.random() < 0.2:
+        cell.fill = PatternFill('solid', start_color=rng.choice(LEGEND))
+    # mostly black, some legend and other colors, a few left on the default theme color
+    roll = rng.random()
+    if roll < 0.1:
+        cell.font = Font(color=rng.choice(LEGEND))
+    elif roll < 0.15:
+        cell.font = Font(color=MDG_FONT)
+    elif roll < 0.95:
+        cell.font = Font(color='FF000000')
+
+
+@pytest.fixture(scope='session')
+def workbook_bytes():
+    """A small workbook laid out like the real sheet: Calendar (with its legend and notes), Primetime and Syndication."""
+    rng = random.Random(1)
+    names = [str(pg) for pg in PG if pg is not PG._UNKNOWN][:40]
+    wb = openpyxl.Workbook()
+
+    cal = wb.active
+    cal.title = 'Calendar'
+    for c, name in zip('ABCDEFGHIJKL', ['PROD', 'S', 'EP', 'AIRDATE', 'INT. DATE', 'NOTES'] + [f'PG{i}' for i in range(1, 7)]):
+        cal[f'{c}1'] = name
+    for i, rgb in enumerate(LEGEND, 2):
+        cal[f'N{i}'].fill = PatternFill('solid', start_color=rgb)
+    for i in range(2, 9):
+        cal[f'AA{i}'] = f'note {i}'
+    for r in range(2, 42):
+        cal[f'A{r}'] = f'{1000 + r}K'
+        cal[f'B{r}'] = 40 + r // 15
+        cal[f'C{r}'] = r
+        # a few unaired episodes, with no airdate
+        if r % 13:
+            cal[f'D{r}'] = datetime(2022, 1, 1 + r % 28, 0, 0)
+        cal[f'E{r}'] = datetime(2022, 2, 1 + r % 28, 0, 0)
+        cal[f'F{r}'] = rng.choice([None, 'MDS', 'a note', 'Drew Carey'])
+        for c in 'GHIJKL':
+            cal[f'{c}{r}'] = _pg_cell(rng, names)
+            _style_pg_cell(rng, cal[f'{c}{r}'])
+    cal['A42'] = 'TOTAL'
+
+    prime = wb.create_sheet('Primetime')
+    for c, name in zip('ABCDEFGHIJ', ['PROD', 'AIRDATE', 'INT. DATE', 'SPECIAL'] + [f'PG{i}' for i in range(1, 7)]):
+        prime[f'{c}1'] = name
+    for r in range(2, 12):
+        prime[f'A{r}'] = f'{r:03d}SP'
+        if r != 5:
+            prime[f'B{r}'] = datetime(2008, 2, r, 0, 0)
+        prime[f'C{r}'] = datetime(2008, 2, r, 0, 0)
+        prime[f'D{r}'] = rng.choice(['Million Dollar Spectacular', 'TPIR@N – Vegas', None])
+        for c in 'EFGHIJ':
+            prime[f'{c}{r}'] = _pg_cell(rng, names)
+            _style_pg_cell(rng, prime[f'{c}{r}'])
+    prime['A12'] = 'TOTAL'
+
+    synd = wb.create_sheet('Syndication')
+    for c, name in zip('ABCDE', ['PROD', 'S', 'PG1', 'PG2', 'PG3']):
+        synd[f'{c}1'] = name
+    for r in range(2, 22):
+        synd[f'A{r}'] = f'{r:04d}N'
+        synd[f'B{r}'] = 1 + r // 8
+        for c in 'CDE':
+            synd[f'{c}{r}'] = _pg_cell(rng, names)
+            _style_pg_cell(rng, synd[f'{c}{r}'])
+    synd['A22'] = 'TOTAL'
+
+    b = io.BytesIO()
+    wb.save(b)
+    return b.getvalue()
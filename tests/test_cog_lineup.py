@@ -0,0 +1,46 @@
+import random
+from datetime import timedelta
+
+import polars as pl
+import pytest
+
+from cog_lineup import LineupText, gen_lineup_submes
+
+
+@pytest.fixture
+def lineups(frames, bot_config):
+    return frames[0].filter(pl.col('AIRDATE').is_not_null()).select(pl.exclude(r'^PG\d_[pf]$')).head(60)
+
+
+def _check(df: pl.DataFrame, initial_str: str = '', rows: int = 7):
+    text = LineupText(df, initial_str)
+    expected = gen_lineup_submes(df, initial_str)
+    assert ''.join(text.chunks(rows)) == expected
+    assert text.size == len(expected)
+
+
+@pytest.mark.parametrize('initial_str', ['', 'Plinko\nin S3'])
+@pytest.mark.parametrize('height', [1, 7, 60])
+def test_lineup_text(lineups, initial_str, height):
+    _check(lineups.head(height), initial_str)
+
+
+def test_lineup_text_wide_cells(lineups):
+    rng = random.Random(6)
+    df = lineups.head(30).with_columns(
+        [
+            # a note past fmt_str_lengths, truncated the same in every slice
+            pl.Series('NOTES', [None] * 29 + ['x' * 150]).cast(pl.Categorical),
+            pl.Series('d', [timedelta(days=rng.randint(0, 4000)) for _ in range(30)]),
+            pl.Series('b', [rng.random() < 0.5 for _ in range(30)]),
+        ]
+    )
+    for _ in range(20):
+        _check(
+            df.with_columns(
+                [
+                    pl.Series('f', [rng.random() * 10 ** rng.randint(-9, 12) for _ in range(30)]),
+                    pl.Series('n', [rng.randint(-(9 ** rng.randint(1, 6)), 50) for _ in range(30)]),
+                ]
+            )
+        )
@@ -0,0 +1,100 @@
+import random
+import re
+from datetime import date, timedelta
+
+import polars as pl
+import pytest
+from cachetools import LFUCache
+from sortedcontainers import SortedDict
+
+import compendium as C
+
+WORDS = ['BEACH', 'SNACK', 'SHACK', 'TEX-MEX', "ROCK 'N' ROLL", 'MAMMA', 'MIA!', 'HAZY', 'SKY', 'A', 'DAY', 'AT', 'THE', 'Q&A', 'ZZ', 'TOP', 'QUIZ', 'JAZZ', 'ST. LOUIS']
+ROUNDS = ['T1', 'T2', 'R1', 'R2', 'R3', 'R4', 'BR']
+
+
+def _season_csv(rng: random.Random, season: int):
+    lines = ['S,DATE,EP,UNC,ROUND,PUZZLE,CATEGORY,BONUS,EXTRA']
+    first = date(1981 + season, 9, 1)
+    days = [first + timedelta(days=d) for d in range(40) if (first + timedelta(days=d)).weekday() < 5][:8]
+    episodes = [(100 * season + i, d) for i, d in enumerate(days, 1)]
+    # the sheet has episodes out of order, sorting is _materialize's job
+    rng.shuffle(episodes)
+    for ep, d in episodes:
+        for rd in ROUNDS:
+            puzzle = ' '.join(rng.sample(WORDS, rng.randint(1, 4)))
+            bonus = rng.choice(['', '', 'LOUIS', 'SNACKS'])
+            lines.append(f'{season},{d:%m/%d/%y},{ep},,{rd},"{puzzle}",THING,{bonus},')
+    return '\n'.join(lines).encode()
+
+
+@pytest.fixture(scope='module')
+def wc():
+    # no downloads: a few made-up seasons parsed and materialized the way load does
+    rng = random.Random(4)
+    wc = C.WheelCompendium.__new__(C.WheelCompendium)
+    wc.cache = LFUCache(C.WheelCompendium._MAX_CACHE)
+    wc._df_dict = SortedDict()
+    wc._trigram_index = {}
+    wc._cols = ['S', 'DATE', 'EP', 'E/S', 'UNC', 'ROUND', 'PP', 'RL', 'PR', 'PUZZLE', 'CATEGORY', 'CLUE/BONUS']
+    for season in (25, 18, 32):
+        wc._df_dict[season] = wc._process_season(season, _season_csv(rng, season))[0].lazy()
+    wc._materialize()
+    return wc
+
+
+def test_materialize_sorted(wc):
+    df = wc.df
+    assert df.get_column('ID').to_list() == list(range(df.height))
+    keys = list(zip(df.get_column('S'), df.get_column('EP')))
+    assert keys == sorted(keys)
+    # each episode's rounds in sheet order
+    for _, rounds in df.groupby('EP', maintain_order=True).agg(pl.col('RD').cast(pl.Utf8)).rows():
+        assert rounds == ROUNDS
+    for season in (18, 25, 32):
+        assert wc.season_slice([season]).frame_equal(df.filter(pl.col('S') == season))
+    assert wc.season_slice([18, 32]).frame_equal(df.filter(pl.col('S').is_in([18, 32])))
+    for l in 'AZ':
+        assert df.get_column(f'N_{l}').to_list() == [p.count(l) for p in df.get_column('PUZZLE')]
+
+
+@pytest.mark.parametrize('column', C.TRIGRAM_COLUMNS)
+@pytest.mark.parametrize(
+    'pattern, literal',
+    [
+        ('BEACH', False),
+        ('SNACK|SHACK', False),
+        ('[[:upper:]]ZZ', False),
+        ('^A DAY', False),
+        ('ROCK.*ROLL', False),
+        ('(JAZZ|QUIZ) TOP', False),
+        ('ST. LOUIS', True),
+        ('Q&A', True),
+        ('XYZZY', False),
+        ('Z', False),
+        ('LOUIS$', False),
+    ],
+)
+def test_text_match(wc, column, pattern, literal):
+    expected = wc.df.filter(pl.col(column).str.contains(pattern, literal=literal))
+    assert wc.df.filter(wc.text_match(column, pattern, literal)).frame_equal(expected)
+
+
+@pytest.mark.parametrize('how, pattern', [('regex', '^[A-Z]{3}$'), ('regex', 'ZZ'), ('literal', 'ACK'), ('exact', 'TOP'), ('exact', 'NONE')])
+@pytest.mark.parametrize('idx', [None, 0, 1, -1, -2])
+def test_word_rows(wc, how, pattern, idx):
+    def matches(word):
+        if how == 'regex':
+            return re.search(pattern, word) is not None
+        return pattern in word if how == 'literal' else word == pattern
+
+    expected = set()
+    for id_, puzzle in wc.df.select(['ID', 'PUZZLE']).rows():
+        words = re.findall(C.WORD_REGEX, puzzle)
+        if idx is None:
+            hit = any(matches(w) for w in words)
+        else:
+            hit = -len(words) <= idx < len(words) and matches(words[idx])
+        if hit:
+            expected.add(id_)
+    assert set(wc.word_rows(pattern, how, idx).to_list()) == expected
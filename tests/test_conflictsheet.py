@@ -0,0 +1,329 @@
+import io
+import zipfile
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from itertools import combinations
+
+import numpy as np
+import openpyxl
+import polars as pl
+import portion as P
+import pytest
+
+from conflictsheet import (
+    _CALENDAR_EXTRA,
+    _PG_ORDINAL,
+    _SHEET_COLUMNS,
+    _build_notes_index,
+    _pf_bit,
+    _xlsx_read_sheet,
+    _xlsx_shared_strings,
+    _xlsx_style_bits,
+    _xlsx_styles,
+    _xlsx_workbook,
+    ALL_FLAGS_BUT_UNCERTAIN,
+    ANY_FLAG,
+    ANY_FREQ,
+    ANY_SLOT,
+    FIRST_HALF,
+    ConflictSheet,
+)
+from pg import PG, PGPlaying
+
+SEASONS = P.closed(3, 8)
+LOGICS = ('all', 'any', 'A & ~(B | C)', '(A ^ C) | B')
+
+
+def _date_range(df: pl.DataFrame):
+    dates = df.get_column('AIRDATE')
+    mid = dates[df.height // 3]
+    return P.closed(mid, mid + timedelta(days=3 * 365)) | P.closed(dates[-40], dates[-20])
+
+
+def _endpoint_rows(df: pl.DataFrame, endpoints):
+    """endpoint_sub as the plain polars filter it started as."""
+    if endpoints is None:
+        return df
+    elif isinstance(endpoints.lower, int):
+        return df.filter(pl.col('S').is_in(list(P.iterate(endpoints, step=1))))
+    return df.filter(pl.any([pl.col('AIRDATE').is_between(a.lower, a.upper, closed='both') for a in endpoints]))
+
+
+def _wide_playings(df: pl.DataFrame, n_slots: int = 6):
+    return pl.concat(
+        [
+            df.select(
+                [
+                    pl.col('PG_n'),
+                    pl.col(f'PG{s}_p').cast(pl.Utf8).alias('PG'),
+                    pl.col(f'PG{s}_f').alias('flag'),
+                    pl.lit(s).alias('slot'),
+                ]
+            )
+            for s in range(1, n_slots + 1)
+        ]
+    ).drop_nulls('PG')
+
+
+# the workbook, read straight from its XML against openpyxl and built against the per-cell conversion it replaced
+
+
+def _openpyxl_bits(ws, row, columns, colors):
+    bits = []
+    for c in columns:
+        cell = ws[f'{c}{row}']
+        fill = 2 ** colors[cell.fill.start_color.rgb] if cell.fill.start_color.rgb in colors else 0
+        font = 0
+        if cell.font.color and cell.font.color.rgb != 'FF000000':
+            font = 2 ** colors[cell.font.color.rgb] if cell.font.color.rgb in colors else 2 ** _pf_bit('MDG')
+        bits.append((fill, font))
+    return bits
+
+
+def _reference_playing(value, fill, font):
+    # (display, name, flag) the way each cell's PGPlaying was made and flagged
+    if value == '-':
+        return None, None, 2**15
+    if value is None:
+        pgp = PGPlaying(str(PG._UNKNOWN), 1)
+    elif value.startswith('*') and value.endswith('*'):
+        pgp = PGPlaying(value[1:-1], 2 ** _pf_bit('?'))
+    else:
+        pgp = PGPlaying(value, 0)
+    if not pgp.flag & 2 ** _pf_bit('?'):
+        pgp.flag |= fill
+    pgp.flag |= font
+    return str(pgp), str(pgp.pg), pgp.flag
+
+
+@pytest.fixture(scope='module')
+def parsed(workbook_bytes):
+    with zipfile.ZipFile(io.BytesIO(workbook_bytes)) as zf:
+        paths, epoch = _xlsx_workbook(zf)
+        strings, styles = _xlsx_shared_strings(zf), _xlsx_styles(zf)
+        sheets = {
+            name: _xlsx_read_sheet(zf, paths[name], columns, strings, styles, epoch, _CALENDAR_EXTRA if name == 'Calendar' else ())
+            for name, columns in _SHEET_COLUMNS.items()
+        }
+    return styles, sheets
+
+
+def test_xlsx_values_match_openpyxl(workbook_bytes, parsed):
+    wb = openpyxl.load_workbook(io.BytesIO(workbook_bytes))
+    _, sheets = parsed
+    for name, columns in _SHEET_COLUMNS.items():
+        ws = wb[name]
+        names, rows, _, extra = sheets[name]
+        assert names == [ws[f'{c}1'].value for c in columns]
+        # the footer row is left out
+        assert rows == [[ws[f'{c}{r}'].value for c in columns] for r in range(2, ws.max_row)]
+    _, _, _, extra = sheets['Calendar']
+    assert {ref: v for ref, (v, _) in extra.items() if ref.startswith('AA')} == {f'AA{i}': wb['Calendar'][f'AA{i}'].value for i in range(2, 9)}
+
+
+def test_xlsx_style_bits_match_openpyxl(workbook_bytes, parsed):
+    wb = openpyxl.load_workbook(io.BytesIO(workbook_bytes))
+    styles, sheets = parsed
+    _, _, _, extra = sheets['Calendar']
+    colors = {styles.fill_rgb[extra[f'N{i}'][1]]: i - 2 for i in range(2, 10)}
+    assert colors == {wb['Calendar'][f'N{i}'].fill.start_color.rgb: i - 2 for i in range(2, 10)}
+
+    for name, columns in _SHEET_COLUMNS.items():
+        ws = wb[name]
+        names, rows, xf, _ = sheets[name]
+        pg_columns = [c for c, n in zip(columns, names) if n.startswith('PG')]
+        bits = _xlsx_style_bits(styles, colors)[xf][:, -len(pg_columns) :]
+        expected = [_openpyxl_bits(ws, r, pg_columns, colors) for r in range(2, ws.max_row)]
+        assert bits.tolist() == [[list(b) for b in row] for row in expected]
+
+
+def test_build_frame_matches_per_cell_playings(workbook_bytes, parsed):
+    wb = openpyxl.load_workbook(io.BytesIO(workbook_bytes))
+    styles, sheets = parsed
+    colors = {wb['Calendar'][f'N{i}'].fill.start_color.rgb: i - 2 for i in range(2, 10)}
+    for name, columns in _SHEET_COLUMNS.items():
+        ws = wb[name]
+        names, rows, xf, _ = sheets[name]
+        pg_columns = [c for c, n in zip(columns, names) if n.startswith('PG')]
+        df = ConflictSheet._build_frame(names, rows, _xlsx_style_bits(styles, colors)[xf][:, -len(pg_columns) :])
+
+        assert df.get_column('PROD').to_list() == [str(r[0]) for r in rows]
+        for s, c in enumerate(pg_columns, 1):
+            expected = [
+                _reference_playing(ws[f'{c}{r}'].value, *_openpyxl_bits(ws, r, [c], colors)[0]) for r in range(2, ws.max_row)
+            ]
+            got = zip(
+                df.get_column(f'PG{s}').cast(pl.Utf8).to_list(),
+                df.get_column(f'PG{s}_p').cast(pl.Utf8).to_list(),
+                df.get_column(f'PG{s}_f').to_list(),
+            )
+            assert list(got) == expected, (name, c)
+
+
+def test_initialize_splits_sheets(workbook_bytes, tmp_path):
+    cs = ConflictSheet(lambda *args: io.BytesIO(workbook_bytes), lambda *args: None, override_snapshot=True, snapshot_dir=str(tmp_path))
+    cs._persisted.result()
+    wb = openpyxl.load_workbook(io.BytesIO(workbook_bytes))
+    cal, prime = wb['Calendar'], wb['Primetime']
+
+    aired = [cal[f'A{r}'].value for r in range(2, cal.max_row) if cal[f'D{r}'].value]
+    unaired = [cal[f'A{r}'].value for r in range(2, cal.max_row) if not cal[f'D{r}'].value]
+    assert cs.get('daytime').get_column('PROD').to_list() == aired
+    assert cs.get('unaired').get_column('PROD').to_list() == unaired
+    assert cs.get('primetime').get_column('PROD').to_list() == [prime[f'A{r}'].value for r in range(2, prime.max_row) if prime[f'B{r}'].value]
+    assert cs.get('syndicated').height == wb['Syndication'].max_row - 2
+    assert cs.notes == '\n'.join('-' + cal[f'AA{i}'].value for i in range(2, 9))
+    for df in cs._df_dict.values():
+        assert df.get_column('PG_n').to_list() == list(range(1, df.height + 1))
+
+
+# queries answered from the indexes, against polars over the frames
+
+
+def test_endpoint_sub(cs):
+    df = cs.get('daytime')
+    for endpoints in (None, SEASONS, _date_range(df)):
+        assert cs.endpoint_sub(endpoints, 'daytime').collect().frame_equal(_endpoint_rows(df, endpoints), null_equal=True)
+
+
+@pytest.mark.parametrize('logic', LOGICS)
+def test_lineup_query_bitset_matches_polars(cs, logic):
+    conditions = (
+        (frozenset({PG.Plinko, PG.Cliffhangers}), FIRST_HALF, ANY_FLAG, ANY_FREQ),
+        (frozenset(PG.partition_table['CAR']), ANY_SLOT, ALL_FLAGS_BUT_UNCERTAIN, frozenset({1, 2})),
+        (frozenset(PG.partition_table['1 PRIZER']), ANY_SLOT, frozenset({0}), frozenset({2})),
+    )
+    for endpoints in (None, SEASONS, _date_range(cs.get('daytime'))):
+        bitset = cs.lineup_query(endpoints, 'daytime', logic, conditions, engine='bitset').collect()
+        polars = cs.lineup_query(endpoints, 'daytime', logic, conditions, engine='polars').collect()
+        assert bitset.height
+        assert bitset.frame_equal(polars, null_equal=True)
+
+
+@pytest.mark.parametrize('time', ['daytime', 'primetime', 'syndicated'])
+def test_slot_counts(cs, time):
+    df = cs.get(time)
+    n_slots = 3 if time == 'syndicated' else 6
+    for endpoints in (None, SEASONS) + ((_date_range(df),) if time != 'syndicated' else ()):
+        # primetime has no seasons, a season range is all of it
+        rows = df if time == 'primetime' and endpoints is not None and isinstance(endpoints.lower, int) else _endpoint_rows(df, endpoints)
+        expected = defaultdict(lambda: [0] * n_slots)
+        for _, pg, flag, slot in _wide_playings(rows, n_slots).rows():
+            expected[pg, flag][slot - 1] += 1
+
+        got = cs.slot_counts(endpoints, time).collect()
+        assert got.columns == ['PG', 'flag'] + [f'PG{s}' for s in range(1, n_slots + 1)]
+        assert {(pg, flag): list(counts) for pg, flag, *counts in got.rows()} == expected, endpoints
+
+
+@pytest.mark.parametrize('by', [None, 'S'])
+def test_slot_table(cs, by):
+    df = cs.get('daytime')
+    expected = defaultdict(lambda: [0] * 6)
+    for pg_n, pg, flag, slot in _wide_playings(df).rows():
+        expected[(df.get_column('S')[pg_n - 1],) * bool(by) + (pg, flag)][slot - 1] += 1
+
+    got = cs.slot_table('daytime', by).collect().with_columns(pl.col('PG').cast(pl.Utf8))
+    assert {tuple(row[:-6]): list(row[-6:]) for row in got.rows()} == expected
+
+
+def test_pair_counts(cs):
+    df = cs.get('daytime')
+    for endpoints in (None, SEASONS, _date_range(df)):
+        expected = np.zeros((len(PG), len(PG)), dtype=np.int64)
+        for row in _endpoint_rows(df, endpoints).select(pl.col(r'^PG\d_p$').cast(pl.Utf8)).rows():
+            ords = sorted({_PG_ORDINAL[pg] for pg in row if pg is not None})
+            for o in ords:
+                expected[o, o] += 1
+            for a, b in combinations(ords, 2):
+                expected[a, b] += 1
+                expected[b, a] += 1
+        assert (cs._pair_counts(endpoints, 'daytime') == expected).all(), endpoints
+
+
+@pytest.mark.parametrize('nth', [1, 3, 500])
+def test_last_playings(cs, nth):
+    df = cs.get('daytime')
+    pgs = [PG.Plinko, PG.Cliffhangers, PG.ClockGame, PG.DoubleBullseye]
+    for endpoints in (None, SEASONS):
+        for flags, cutoff in ((None, None), (frozenset({0}), None), (None, df.height // 2)):
+            got = {pg: (prod, airdate) for pg, prod, airdate in cs.last_playings(endpoints, 'daytime', pgs, nth, flags, cutoff).collect().rows()}
+
+            playings = _wide_playings(_endpoint_rows(df, endpoints))
+            if flags:
+                playings = playings.filter(pl.col('flag') == 0)
+            if cutoff:
+                playings = playings.filter(pl.col('PG_n') <= cutoff)
+            expected = {}
+            for pg in pgs:
+                rows = playings.filter(pl.col('PG') == str(pg)).get_column('PG_n').unique().sort().to_list()
+                if rows:
+                    row = df.row(rows[-min(nth, len(rows))] - 1, named=True)
+                    expected[str(pg)] = row['PROD'], row['AIRDATE']
+            assert got == expected, (endpoints, flags, cutoff)
+
+
+# edits: what is left in the LFU afterwards, and the notes index kept up to date in place
+
+
+def _season_keys(cs, time='daytime'):
+    return {getattr(k.args, 'endpoints', None) for k in cs.cache.keys() if k.args.time == time}
+
+
+def test_update_invalidates_only_edited_season(cs):
+    df = cs.get('daytime')
+    row = df.row(df.height // 2, named=True)
+    edited, other = P.singleton(row['S']), P.singleton(row['S'] + 2)
+    cs.concurrence_query(edited, 'daytime', (PG.Plinko,), (None,))
+    cs.concurrence_query(other, 'daytime', (PG.Plinko,), (None,))
+    cs.slot_table('primetime')
+
+    lineup = [PGPlaying(str(pg), 0, pg=pg) for pg in (PG.Plinko, PG.Cliffhangers, PG.ClockGame, PG.AnyNumber, PG.BonusGame, PG.Bullseye)]
+    cs.update(row['PROD'], lineup, False, None, None, None).result()
+
+    assert other in _season_keys(cs) and edited not in _season_keys(cs)
+    assert _season_keys(cs, 'primetime')
+    assert cs.concurrence_query(edited, 'daytime', (PG.Plinko,), (None,)).collect().frame_equal(
+        _endpoint_rows(cs.get('daytime'), edited).filter(pl.any([pl.col(f'PG{s}_p') == 'Plinko' for s in range(1, 7)])),
+        null_equal=True,
+    )
+
+
+def test_update_invalidates_old_airdate(cs):
+    df = cs.get('daytime')
+    row = df.row(df.height // 2, named=True)
+    day = datetime.combine(row['AIRDATE'], datetime.min.time())
+    assert cs.endpoint_sub(P.singleton(day), 'daytime').collect().height
+
+    cs.update(row['PROD'], None, False, date(2031, 1, 1), None, None).result()
+    assert cs.endpoint_sub(P.singleton(day), 'daytime').collect().frame_equal(
+        _endpoint_rows(cs.get('daytime'), P.singleton(day)), null_equal=True
+    )
+
+
+def test_notes_index_edited_in_place(cs):
+    rng = np.random.default_rng(3)
+    words = ['MDS', 'a note', 'Bob Barker', 'Drew Carey', 'car-a-thon', 'Dream Car week', 'PLINKO 40th', '']
+    lineup = [PGPlaying(str(pg), 0, pg=pg) for pg in (PG.Plinko, PG.Cliffhangers, PG.ClockGame, PG.AnyNumber, PG.BonusGame, PG.Bullseye)]
+    for step in range(20):
+        df = cs.get('daytime')
+        if step % 5 == 4:
+            # a new row between existing ones, every row after it renumbered
+            prod = df.get_column('PROD')[int(rng.integers(df.height - 200, df.height - 20))]
+            cs.update(prod[:-1] + '5' + prod[-1], lineup, True, date(2030, 1, 1), None, 'Dream Car week').result()
+        else:
+            prod = df.get_column('PROD')[int(rng.integers(df.height))]
+            cs.update(prod, None, False, None, None, ' '.join(rng.choice(words, 2))).result()
+
+        index, rebuilt = cs._notes_index['daytime'], _build_notes_index(cs.get('daytime'), 'NOTES')
+        assert index.notes.series_equal(rebuilt.notes, null_equal=True)
+        assert index.postings.keys() == rebuilt.postings.keys()
+        assert all((index.postings[t] == p).all() for t, p in rebuilt.postings.items())
+
+
+@pytest.mark.parametrize('regex', ['MDS', 'car', 'DREAM CAR', 'bob|drew', 'th$', 'ar.a', 'plinko 4', 'a note', 'xyz', 'A', '^$'])
+def test_notes_sub(cs, regex):
+    cs.update(cs.get('daytime').get_column('PROD')[5], None, False, None, None, 'Dream Car week, PLINKO 40th').result()
+    df = cs.get('daytime')
+    expected = df.filter(pl.col('NOTES').cast(pl.Utf8).str.to_uppercase().str.contains(regex.upper()))
+    assert cs.notes_sub('daytime', regex).collect().frame_equal(expected, null_equal=True)
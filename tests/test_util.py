@@ -0,0 +1,43 @@
+import random
+import re
+
+import pytest
+
+from util import required_literals
+
+
+@pytest.mark.parametrize(
+    'pattern, literals',
+    [
+        ('BEACH', ['BEACH']),
+        ('(JAZZ|QUIZ) TOP', [' TOP']),
+        ('AB(CD)+EF', ['AB', 'CD', 'EF']),
+        ('AB(CD)*EF', ['AB', 'EF']),
+        ('AB?C', ['A', 'C']),
+        ('ABC{2,}', ['AB', 'C']),
+        (r'ST\. LOUIS', ['ST. LOUIS']),
+        (r'\bWORD\b', ['WORD']),
+        ('[XYZ]DEF', ['DEF']),
+        ('A(?i:B)C', ['A', 'C']),
+        ('A|B', []),
+        # read differently by polars' regex, or not at all by Python's
+        ('(?i)ABC', []),
+        ('[[:upper:]]ZZ', []),
+        ('[A-Z&&[^AEIOU]]X', []),
+        ('AB(', []),
+    ],
+)
+def test_required_literals(pattern, literals):
+    assert required_literals(pattern) == literals
+
+
+def test_required_literals_in_every_match():
+    rng = random.Random(5)
+    atoms = ['A', 'B', 'AB', 'BA', '.', '[AB]', '(A|B)', '(AB)+', '(BA)*', 'A?', 'B{2}', '(A|AB)B']
+    texts = [''.join(rng.choice('AB') for _ in range(rng.randint(0, 12))) for _ in range(300)]
+    for _ in range(300):
+        pattern = ''.join(rng.choice(atoms) for _ in range(rng.randint(1, 5)))
+        literals = required_literals(pattern)
+        for text in texts:
+            for m in re.finditer(pattern, text):
+                assert all(l in m.group() for l in literals), (pattern, m.group(), literals)
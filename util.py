@@ -1,7 +1,9 @@
+import asyncio
 import operator
 import random
 import re
 import string
+import tempfile
 from datetime import date, datetime
 from functools import reduce
 from sys import getsizeof
@@ -222,6 +224,7 @@ def _command_to_fn(command):
 
 
 _MAX_FILESIZE = 8 * 2**20
+_MAX_PASTEBIN_SIZE = 512 * 2**10
 
 
 async def send_long_mes(ctx, s, *, fn=None, newline_limit=19):
@@ -255,6 +258,36 @@ async def send_long_mes(ctx, s, *, fn=None, newline_limit=19):
         # 		await ctx.author.send(pp, delete_after=300.)
 
 
+def _write_chunks(f, chunks: Iterable[str]):
+    for chunk in chunks:
+        f.write(chunk.encode())
+        if f.tell() > _MAX_FILESIZE:
+            return False
+    return True
+
+
+async def send_long_lines(ctx, chunks: Iterable[str], *, fn=None):
+    """send_long_mes for a text that comes a chunk at a time, always as a file. The chunks go straight to a temporary
+    file (off the event loop), so the whole text is never held in memory. Only files pastebin takes get a mirror."""
+    with tempfile.TemporaryFile() as f:
+        if not await asyncio.to_thread(_write_chunks, f, chunks):
+            f.seek(0)
+            await ctx.send(
+                '```The result is too big for a Discord file size (non-Nitro). You probably did not mean to get a result this large.\n\nIf you really want this result, contact Wayoshi directly and he can help get it for you. The first 500 characters of the result are included below as a convenience.\n\n'
+                + f.read(500).decode(errors='ignore')
+                + '```'
+            )
+            return
+
+        fn = fn or (_command_to_fn(ctx.command) + '_' + datetime.now().isoformat(timespec='seconds'))
+        link = None
+        if f.tell() <= _MAX_PASTEBIN_SIZE:
+            f.seek(0)
+            link = await ctx.bot.do_pastebin(f.read().decode(), fn)
+        f.seek(0)
+        await ctx.send(f'Pastebin mirror: <{link}>' if link else None, file=discord.File(f, filename=fn + '.txt'))
+
+
 async def send_PIL_image(channel, image, desc, content=None):
     with io.BytesIO() as b:
         image.save(b, format='png')
@@ -355,6 +388,73 @@ class LogicExpression:
         return self.expr
 
 
+import warnings
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    # before 3.11
+    import sre_parse
+
+
+def _rust_only_class(pattern: str) -> bool:
+    """Whether a character class in pattern uses syntax polars' (Rust) regex reads differently from Python's re:
+    a nested class such as [[:upper:]] or [a[bc]], or a class operator &&, -- or ~~."""
+    in_class, i = False, 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            i += 2
+            continue
+        if in_class:
+            if c == '[' or pattern[i : i + 2] in ('&&', '--', '~~'):
+                return True
+            in_class = c != ']'
+        elif c == '[':
+            in_class = True
+            # a ] right after [ or [^ is a literal in both
+            i += 1 + pattern.startswith('^', i + 1)
+            i += pattern.startswith(']', i)
+            continue
+        i += 1
+    return False
+
+
+def _literal_runs(parsed) -> List[str]:
+    literals, run = [], []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            literals.append(''.join(run))
+            run = []
+        if op is sre_parse.SUBPATTERN:
+            if not av[1] & re.IGNORECASE:
+                literals.extend(_literal_runs(av[-1]))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            literals.extend(_literal_runs(av[-1]))
+    if run:
+        literals.append(''.join(run))
+    return literals
+
+
+def required_literals(pattern: str) -> List[str]:
+    """Literal strings every match of regex pattern contains, as far as can be told from its plain sequences and groups.
+
+    Patterns are run by polars, so anything Python's parser might read differently gives no literals: nested classes,
+    class operators, syntax Python only warns about or rejects. Case-insensitive parts are skipped too."""
+    if _rust_only_class(pattern):
+        return []
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            parsed = sre_parse.parse(pattern)
+    except (re.error, Warning, OverflowError, RecursionError):
+        return []
+    return [] if parsed.state.flags & re.IGNORECASE else _literal_runs(parsed)
+
+
 import colorsys
 
 import numpy as np
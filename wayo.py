@@ -25,6 +25,8 @@ from dropboxwayo import dropboxwayo
 from util import SCHEDULER_TZ
 
 DEBUG = 'DEBUG' in sys.argv
+# the oldest polars the cogs' queries are written against
+POLARS_MIN_VERSION = '0.16.8'
 _log = logging.getLogger('wayo_log')
 
 
@@ -259,6 +261,9 @@ async def sync(ctx, guilds: commands.Greedy[commands.GuildConverter], spec: Opti
 
 
 if __name__ == '__main__':
+    if tuple(map(int, re.findall(r'\d+', pl.__version__)[:3])) < tuple(map(int, POLARS_MIN_VERSION.split('.'))):
+        sys.exit(f'wayo.py needs polars {POLARS_MIN_VERSION} or newer, found {pl.__version__}')
+
     pl.toggle_string_cache(True)
 
     (
@@ -271,7 +276,7 @@ if __name__ == '__main__':
         .set_tbl_cell_alignment('RIGHT')
         .set_tbl_hide_dataframe_shape()
         .set_tbl_hide_column_data_types()
-        .set_tbl_hide_column_separator()
+        .set_tbl_hide_dtype_separator()
     )
 
     # if sys.platform.startswith('linux') and datetime.now(tz=pytz.timezone('US/Eastern')).weekday() > 4: